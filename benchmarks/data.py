@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import random
+from typing import Any
+
+STATUSES = ["open", "assigned", "done", "archived"]
+
+
+def generate(size=10000, depth=3, fanout=3, list_ratio=0.3, seed=0) -> dict:
+	"""
+	Generate a reproducible synthetic database of size records.
+
+	Every record has the flat fields id, owner, status, amount and tags that
+	the benchmarks work with, and a nested tree of the given depth and
+	fan-out. Each inner node of the tree is a list with probability
+	list_ratio and a dict otherwise.
+	"""
+	rng = random.Random(seed)
+	owners = [f"u{i}" for i in range(max(1, size // 100))]
+	return {
+		f"r{i}": {
+			"id": i,
+			"owner": rng.choice(owners),
+			"status": rng.choice(STATUSES),
+			"amount": rng.randint(0, 1000),
+			"tags": [rng.choice(STATUSES) for _ in range(rng.randint(0, 5))],
+			"tree": generate_tree(rng, depth, fanout, list_ratio),
+		}
+		for i in range(size)
+	}
+
+
+def generate_tree(rng: random.Random, depth: int, fanout: int, list_ratio: float) -> Any:
+	if depth == 0:
+		return rng.randint(0, 1000)
+	children = [generate_tree(rng, depth - 1, fanout, list_ratio) for _ in range(fanout)]
+	if rng.random() < list_ratio:
+		return children
+	return {f"k{i}": child for i, child in enumerate(children)}
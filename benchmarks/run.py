@@ -0,0 +1,171 @@
+"""
+Benchmark suite for PathDict and MultiPathDict.
+
+Usage:
+	python -m benchmarks.run                          # Run and print results
+	python -m benchmarks.run --save baseline.json     # Store results as baseline
+	python -m benchmarks.run --compare baseline.json  # Compare against a baseline
+
+When comparing, the exit code is 1 if any benchmark is slower than the
+baseline by more than the threshold factor.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable, Tuple
+
+from path_dict import pd
+from path_dict.utils import fast_deepcopy
+
+from .data import generate
+
+# A benchmark is (name, setup, run). setup(data) returns the state passed to
+# run, and is not timed. run(state) performs the timed operation.
+Benchmark = Tuple[str, Callable[[dict], Any], Callable[[Any], Any]]
+
+
+def fresh(data: dict):
+	return pd(fast_deepcopy(data))
+
+
+def shared(data: dict):
+	return pd(data)
+
+
+def get_loop(p):
+	keys = list(p.data)
+	for k in keys:
+		p.at(k, "tree").get()
+
+
+def getitem_loop(p):
+	for k in list(p.data):
+		p[k, "status"]
+
+
+def set_loop(p):
+	for k in list(p.data):
+		p.at(k, "status").set("done")
+
+
+def setitem_loop(p):
+	for k in list(p.data):
+		p[k, "meta", "seen"] = True
+
+
+def map_loop(p):
+	for k in list(p.data):
+		p.at(k, "amount").map(lambda x: x + 1)
+
+
+def append_loop(state):
+	p, n = state
+	for i in range(n):
+		p.at("log").append(i)
+
+
+BENCHMARKS: list[Benchmark] = [
+	("get", shared, get_loop),
+	("__getitem__", shared, getitem_loop),
+	("set", fresh, set_loop),
+	("__setitem__", fresh, setitem_loop),
+	("map", fresh, map_loop),
+	("append", lambda data: (pd({}), len(data)), append_loop),
+	("filter", fresh, lambda p: p.filter(lambda k, v: v["status"] == "open")),
+	("filtered", shared, lambda p: p.filtered(lambda k, v: v["status"] == "open")),
+	("deepcopy", shared, lambda p: p.deepcopy()),
+	("gather *", shared, lambda p: p.at("*", "status").gather()),
+	("gather * *", shared, lambda p: p.at("*", "tree", "*").gather()),
+	("multi map", fresh, lambda p: p.at("*", "amount").map(lambda x: x + 1)),
+	("multi set", fresh, lambda p: p.at("*", "status").set("done")),
+	("multi sum", shared, lambda p: p.at("*", "amount").sum()),
+]
+
+
+def run(data: dict, repeat: int, only: list[str] | None = None) -> dict[str, float]:
+	"""
+	Run all benchmarks and return the best time of each in seconds.
+	"""
+	results = {}
+	for name, setup, bench in BENCHMARKS:
+		if only and name not in only:
+			continue
+		best = float("inf")
+		for _ in range(repeat):
+			state = setup(data)
+			start = time.perf_counter()
+			bench(state)
+			best = min(best, time.perf_counter() - start)
+		results[name] = best
+	return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+	"""
+	Print a comparison table and return the names of all regressions.
+	"""
+	regressions = []
+	print(f"{'benchmark':<16}{'baseline':>12}{'current':>12}{'ratio':>8}")
+	for name, current in results.items():
+		if name not in baseline:
+			print(f"{name:<16}{'-':>12}{current:>12.5f}{'-':>8}")
+			continue
+		ratio = current / baseline[name] if baseline[name] > 0 else float("inf")
+		flag = ""
+		if ratio > threshold:
+			regressions.append(name)
+			flag = "  REGRESSION"
+		print(f"{name:<16}{baseline[name]:>12.5f}{current:>12.5f}{ratio:>8.2f}{flag}")
+	return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--size", type=int, default=10000, help="Number of records")
+	parser.add_argument("--depth", type=int, default=3, help="Depth of the nested tree of each record")
+	parser.add_argument("--fanout", type=int, default=3, help="Fan-out of the nested tree of each record")
+	parser.add_argument("--list-ratio", type=float, default=0.3, help="Share of list nodes in the nested trees")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark, the best is reported")
+	parser.add_argument("--only", nargs="*", help="Only run these benchmarks")
+	parser.add_argument("--save", metavar="FILE", help="Save the results as JSON")
+	parser.add_argument("--compare", metavar="FILE", help="Compare against results saved with --save")
+	parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown factor that counts as regression")
+	args = parser.parse_args(argv)
+
+	params = {
+		"size": args.size,
+		"depth": args.depth,
+		"fanout": args.fanout,
+		"list_ratio": args.list_ratio,
+		"seed": args.seed,
+	}
+	data = generate(**params)
+	results = run(data, args.repeat, args.only)
+
+	exit_code = 0
+	if args.compare:
+		with open(args.compare) as f:
+			saved = json.load(f)
+		if saved["params"] != params:
+			print(f"Warning: baseline was recorded with {saved['params']}, not {params}")
+		if compare(results, saved["results"], args.threshold):
+			exit_code = 1
+	else:
+		for name, seconds in results.items():
+			print(f"{name:<16}{seconds:>12.5f}")
+
+	if args.save:
+		with open(args.save, "w") as f:
+			meta = {"python": platform.python_version(), "platform": platform.platform()}
+			json.dump({"meta": meta, "params": params, "results": results}, f, indent=4)
+	return exit_code
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -14,9 +14,14 @@ while [ $# -gt 0 ]; do case $1 in
     shift ;;
 
 
+  --benchmark|-b)
+    poetry run python -m benchmarks.run
+    shift ;;
+
+
   *|-*|--*)
     echo "Unknown option $1"
-    echo "Usage: [ -t | --test ] [ -p | --profiler ]"
+    echo "Usage: [ -t | --test ] [ -p | --profiler ] [ -b | --benchmark ]"
     exit 2
     exit 1 ;;
 
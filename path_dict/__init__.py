@@ -1,7 +1,10 @@
+from .path import where
 from .path_dict import PathDict
 
 pd = PathDict
 
+__all__ = ["PathDict", "pd", "where"]
+
 ################################################################################
 # To be used like this:
 # pd(db).at("u1", "meta", "last_login").get()
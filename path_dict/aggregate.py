@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from .index import compile_fields, field_value
+
+AGGREGATIONS = ("sum", "min", "max", "mean", "count")
+
+
+def group_by(items: Iterable[tuple[Any, Any]], fields: tuple, keep_keys: bool) -> dict:
+	"""
+	Group (key, child) items by the value of the fields in each child, in a
+	single pass. Each group is a dict {key: child} if keep_keys is True,
+	otherwise a list of children.
+	"""
+	fields = compile_fields(fields)
+	groups = {}
+	for key, child in items:
+		group = field_value(fields, child)
+		if keep_keys:
+			groups.setdefault(group, {})[key] = child
+		else:
+			groups.setdefault(group, []).append(child)
+	return groups
+
+
+def combine_groups(a: dict, b: dict) -> dict:
+	"""
+	Merge the groups of b into the groups of a, keeping the order of the
+	members. Used to combine the results of group_by on consecutive shards.
+	"""
+	for group, members in b.items():
+		if group not in a:
+			a[group] = members
+		elif isinstance(members, dict):
+			a[group].update(members)
+		else:
+			a[group].extend(members)
+	return a
+
+
+def count_by(children: Iterable, fields: tuple) -> dict:
+	"""
+	Count the children per value of the fields, in a single pass.
+	"""
+	fields = compile_fields(fields)
+	counts = {}
+	for child in children:
+		group = field_value(fields, child)
+		counts[group] = counts.get(group, 0) + 1
+	return counts
+
+
+def combine_counts(a: dict, b: dict) -> dict:
+	"""
+	Add the counts of b to the counts of a.
+	"""
+	for group, count in b.items():
+		a[group] = a.get(group, 0) + count
+	return a
+
+
+def aggregate_by(children: Iterable, field: Any, aggregations: dict) -> dict:
+	"""
+	Group the children by the value of field, and aggregate the values of
+	other fields per group in a single pass. aggregations maps a field (a key,
+	or a tuple of keys for a nested field) to one of AGGREGATIONS. Missing
+	values are ignored.
+
+	Returns {group: {field: aggregated value}}.
+	"""
+	return finalize_states(aggregate_states(children, field, aggregations), aggregations)
+
+
+def aggregate_states(children: Iterable, field: Any, aggregations: dict) -> dict:
+	"""
+	Like aggregate_by, but return the partial state of every aggregation, so
+	that the states of several shards can be combined with combine_states.
+	"""
+	for op in aggregations.values():
+		if op not in AGGREGATIONS:
+			raise ValueError(f"PathDict aggregate_by: unknown aggregation {op}, must be one of {AGGREGATIONS}")
+	group_fields = compile_fields((field,))
+	targets = [(name, op, compile_fields((name,))) for name, op in aggregations.items()]
+
+	# The state of every aggregation is [accumulator, number of values]
+	states = {}
+	for child in children:
+		group = field_value(group_fields, child)
+		group_states = states.get(group)
+		if group_states is None:
+			group_states = states[group] = [[0 if op in ("sum", "mean") else None, 0] for _, op, _ in targets]
+		for state, (_, op, fields) in zip(group_states, targets):
+			value = field_value(fields, child)
+			if value is None:
+				continue
+			state[1] += 1
+			if op == "sum" or op == "mean":
+				state[0] += value
+			elif op == "min":
+				if state[0] is None or value < state[0]:
+					state[0] = value
+			elif op == "max":
+				if state[0] is None or value > state[0]:
+					state[0] = value
+
+	return states
+
+
+def combine_states(aggregations: dict, a: dict, b: dict) -> dict:
+	"""
+	Combine the aggregation states b into a.
+	"""
+	ops = list(aggregations.values())
+	for group, b_states in b.items():
+		a_states = a.get(group)
+		if a_states is None:
+			a[group] = b_states
+			continue
+		for op, state, other in zip(ops, a_states, b_states):
+			state[1] += other[1]
+			if op == "sum" or op == "mean":
+				state[0] += other[0]
+			elif other[0] is None:
+				continue
+			elif state[0] is None or (op == "min" and other[0] < state[0]) or (op == "max" and other[0] > state[0]):
+				state[0] = other[0]
+	return a
+
+
+def finalize_states(states: dict, aggregations: dict) -> dict:
+	ops = list(aggregations.items())
+	res = {}
+	for group, group_states in states.items():
+		res[group] = {name: _finalize(op, state) for state, (name, op) in zip(group_states, ops)}
+	return res
+
+
+def _finalize(op: str, state: list) -> Any:
+	acc, count = state
+	if op == "count":
+		return count
+	if op == "mean":
+		return acc / count if count > 0 else None
+	return acc
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Iterable, Iterator, List, Union
+
+from .index import compile_fields, field_value
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+def _require_numpy(method: str) -> Any:
+	if numpy is None:
+		raise ImportError(f"PathDict {method}: numpy is required, install it with `pip install numpy`")
+	return numpy
+
+
+def _filled(values: Iterable, fill: Any, method: str) -> Iterator:
+	for value in values:
+		if value is None:
+			if fill is None:
+				raise ValueError(f"PathDict {method}: missing value, pass fill to replace missing values")
+			value = fill
+		yield value
+
+
+def to_array(values: Iterable, dtype: Any = float, fill: Any = None, count: int = -1) -> Any:
+	"""
+	Fill a NumPy array of dtype with values while they are produced, without
+	building a list first. Missing values (None) are replaced by fill, or
+	raise a ValueError if fill is None.
+	"""
+	np = _require_numpy("to_array")
+	return np.fromiter(_filled(values, fill, "to_array"), dtype=dtype, count=count)
+
+
+def columns(rows: List[Any], fields: list, dtype: Any = float, fill: Any = None) -> dict:
+	"""
+	Return {field: array} with the value of every field in every row. A field
+	is a key, or a list or tuple of keys for a nested field. List fields are
+	returned as tuples.
+	"""
+	np = _require_numpy("columns")
+	compiled = compile_fields(tuple(fields))
+	res = {}
+	for field, path in zip(fields, compiled):
+		values = (field_value((path,), row) for row in rows)
+		key = tuple(field) if isinstance(field, list) else field
+		res[key] = np.fromiter(_filled(values, fill, "columns"), dtype=dtype, count=len(rows))
+	return res
+
+
+################################################################################
+# Statistics
+# Missing values are ignored. The mean and quantiles are floats, the minimum
+# and maximum have the type of the values, and all are None without values.
+################################################################################
+
+
+def total(values: Iterable) -> Any:
+	"""
+	Sum the values that are not missing with the built-in sum, so ints stay
+	exact and any values that support + can be summed. 0 without values.
+	"""
+	return sum(v for v in values if v is not None)
+
+
+def _present(values: Iterable) -> Any:
+	present = (v for v in values if v is not None)
+	if numpy is not None:
+		return numpy.fromiter(present, dtype=float)
+	return [float(v) for v in present]
+
+
+def mean(values: Iterable) -> float | None:
+	present = _present(values)
+	if len(present) == 0:
+		return None
+	if numpy is not None:
+		return float(present.mean())
+	return math.fsum(present) / len(present)
+
+
+def minimum(values: Iterable) -> Any:
+	"""
+	The smallest value that is not missing, with the built-in min, so it
+	has the type of the values and large ints stay exact.
+	"""
+	return min((v for v in values if v is not None), default=None)
+
+
+def maximum(values: Iterable) -> Any:
+	"""
+	The largest value that is not missing, like minimum.
+	"""
+	return max((v for v in values if v is not None), default=None)
+
+
+def quantile(values: Iterable, q: Union[float, List[float]]) -> Union[float, List[float], None]:
+	"""
+	Return the q-th quantile of the values, or a list of quantiles if q is
+	a list, interpolating linearly like numpy.quantile.
+	"""
+	qs = q if isinstance(q, (list, tuple)) else [q]
+	for x in qs:
+		if not 0 <= x <= 1:
+			raise ValueError(f"PathDict quantile: q must be between 0 and 1, but is {x}")
+	present = _present(values)
+	if len(present) == 0:
+		return None
+	if numpy is not None:
+		res = numpy.quantile(present, qs).tolist()
+	else:
+		present.sort()
+		res = [_interpolate(present, x) for x in qs]
+	return res if isinstance(q, (list, tuple)) else res[0]
+
+
+def _interpolate(ordered: List[float], q: float) -> float:
+	position = q * (len(ordered) - 1)
+	lower = math.floor(position)
+	upper = min(lower + 1, len(ordered) - 1)
+	return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
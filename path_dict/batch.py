@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from .path import _MISSING, _as_index, _list_get, compile_path
+
+# Marks the (position, value) that is set at a node of a set_many trie
+_VALUE = object()
+# Marks the indices of the paths that end at a node of a get_many trie
+_END = object()
+
+
+def _list_slot(current: list, key: Any) -> int | None:
+	"""
+	Return the index in current that key refers to, so that aliases like "0"
+	and 0, or -1 and the last index, give the same slot.
+	"""
+	index = _as_index(key)
+	if index is not None and -len(current) <= index < 0:
+		index += len(current)
+	return index
+
+
+def get_many(data: dict | list, paths: list[tuple], default=None) -> list:
+	"""
+	Get the values at all paths in data, in the order of paths. The paths are
+	grouped into a trie, so every shared prefix is only descended once.
+	"""
+	values = [default] * len(paths)
+	trie = {}
+	for i, keys in enumerate(paths):
+		node = trie
+		for key in keys:
+			node = node.setdefault(key, {})
+		node.setdefault(_END, []).append(i)
+
+	# The trie is keyed by the keys as given, so the nodes of list index
+	# aliases are merged when the list is reached
+	stack = [(data, [trie])]
+	while stack:
+		current, nodes = stack.pop()
+		children = {}
+		for node in nodes:
+			for key, child_node in node.items():
+				if key is _END:
+					for i in child_node:
+						values[i] = current
+					continue
+				slot = _list_slot(current, key) if isinstance(current, list) else key
+				children.setdefault(slot, (key, []))[1].append(child_node)
+		for slot, (key, child_nodes) in children.items():
+			if isinstance(current, dict):
+				child = current.get(key)
+			elif isinstance(current, list):
+				child = _list_get(current, key, slot)
+			else:
+				raise KeyError(
+					f"PathDict: The path is not a stack of nested dicts and lists "
+					f"(value at key {key} has type {type(current)})"
+				)
+			if child is not None:
+				stack.append((child, child_nodes))
+	return values
+
+
+def set_many(data: dict | list, items: Iterable[tuple[tuple, Any]]) -> None:
+	"""
+	Set all (path, value) items in data, creating missing dicts on the way
+	down. The result is the same as setting them one by one in order, but
+	the paths are grouped into a trie, so every shared prefix is only
+	descended once. Paths must not be empty.
+	"""
+	items = list(items)
+	trie = {}
+	replaced = False
+	for position, (keys, value) in enumerate(items):
+		node = trie
+		for key in keys:
+			node = node.setdefault(key, {})
+		# A later write replaces everything that was written below it before
+		replaced = replaced or any(key is not _VALUE for key in node)
+		node.clear()
+		node[_VALUE] = (position, value)
+	if replaced:
+		# The replaced writes are not in the trie, but made one by one they
+		# may still raise a KeyError
+		_set_sequential(data, items, (), -1)
+		return
+
+	# Stack entries are (container, trie node, path to the node, position of
+	# the latest write at or above the node)
+	stack = [(data, trie, (), -1)]
+	while stack:
+		current, node, prefix, latest = stack.pop()
+		if isinstance(current, list) and _has_aliases(current, node):
+			# The order of writes to aliases is not kept in the trie
+			_set_sequential(current, items, prefix, latest)
+			continue
+		for key, child_node in node.items():
+			if key is _VALUE:
+				continue
+			position, value = child_node.get(_VALUE, (latest, _MISSING))
+			if value is not _MISSING:
+				if isinstance(current, dict):
+					current[key] = value
+				elif isinstance(current, list):
+					_list_set(current, key, value)
+				if len(child_node) == 1:
+					continue
+
+			if isinstance(current, dict):
+				child = current.get(key, _MISSING)
+				if child is _MISSING:
+					child = current[key] = {}
+			elif isinstance(current, list):
+				child = _list_get(current, key, _as_index(key))
+			else:
+				raise KeyError("Can't set the key of a non-dict")
+			stack.append((child, child_node, prefix + (key,), position))
+
+
+def _has_aliases(current: list, node: dict) -> bool:
+	slots = [_list_slot(current, key) for key in node if key is not _VALUE]
+	return len(set(slots)) < len(slots)
+
+
+def _set_sequential(current: list, items: list, prefix: tuple, latest: int) -> None:
+	"""
+	Set the items below prefix one by one in current, the list at prefix,
+	skipping the items that were replaced by the write at position latest.
+	"""
+	depth = len(prefix)
+	for keys, value in items[latest + 1 :]:
+		if len(keys) > depth and keys[:depth] == prefix:
+			compile_path(keys[depth:], raw=True).set(current, value)
+
+
+def _list_set(current: list, key: Any, value: Any) -> None:
+	index = _as_index(key)
+	if index is None:
+		raise KeyError(f"PathDict set: invalid path ({key} not in {current})")
+	try:
+		current[index] = value
+	except IndexError as e:
+		raise KeyError(f"PathDict set: invalid path ({key} not in {current})") from e
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import io
+import struct
+from typing import IO, Any, Iterable, Iterator, List, Tuple
+
+from .path import _MISSING, _as_index
+
+################################################################################
+# Format
+#
+# A document starts with the magic bytes and the offset of the root node. All
+# offsets are absolute positions in the document. Every node starts with a tag
+# byte:
+# - null, true, false: just the tag
+# - int: int64, or the decimal digits as a string for ints that do not fit
+# - float: float64
+# - str: uint32 length and UTF-8 bytes
+# - list: uint32 length and the uint64 offsets of the items
+# - dict: uint32 length, the entries (uint64 key offset, uint32 encoded key
+#   length, uint64 value offset) in insertion order, and the uint32 positions
+#   of the entries ordered by encoded key, for binary search
+# Children are written before their parents, so a document can be written in
+# a single pass without seeking.
+################################################################################
+
+MAGIC = b"PDB1"
+
+_HEADER = struct.Struct("<4sQ")
+_LENGTH = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_ENTRY = struct.Struct("<QIQ")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+
+NULL, TRUE, FALSE, INT, BIG_INT, FLOAT, STR, LIST, DICT = b"ntfiIdslo"
+
+_CONSTANTS = {NULL: None, TRUE: True, FALSE: False}
+
+
+def encode_scalar(value: Any) -> bytes:
+	"""
+	Encode a value that is not a dict, list or tuple.
+	"""
+	if value is None:
+		return b"n"
+	if value is True:
+		return b"t"
+	if value is False:
+		return b"f"
+	if isinstance(value, int):
+		if -(1 << 63) <= value < 1 << 63:
+			return b"i" + _INT.pack(value)
+		digits = str(value).encode()
+		return b"I" + _LENGTH.pack(len(digits)) + digits
+	if isinstance(value, float):
+		return b"d" + _FLOAT.pack(value)
+	if isinstance(value, str):
+		encoded = value.encode()
+		return b"s" + _LENGTH.pack(len(encoded)) + encoded
+	raise TypeError(f"PathDict binary: cannot encode values of type {type(value)}")
+
+
+class _Frame:
+	"""
+	A container that is being written, with the offsets of the children that
+	were written so far.
+	"""
+
+	__slots__ = ("is_dict", "items", "keys", "offsets")
+
+	def __init__(self, is_dict: bool, items: Iterator[Tuple[Any, Any]]):
+		self.is_dict = is_dict
+		self.items = items
+		self.keys = []
+		self.offsets = []
+
+
+def _frame(value: dict | list | tuple) -> _Frame:
+	if isinstance(value, dict):
+		return _Frame(True, iter(value.items()))
+	return _Frame(False, ((None, v) for v in value))
+
+
+class Writer:
+	"""
+	Writes one document to a binary file, see the format above.
+	"""
+
+	def __init__(self, fp: IO):
+		self.fp = fp
+		self.pos = _HEADER.size
+		fp.write(_HEADER.pack(MAGIC, 0))
+
+	def _emit(self, data: bytes) -> int:
+		offset = self.pos
+		self.fp.write(data)
+		self.pos += len(data)
+		return offset
+
+	def write(self, value: Any) -> int:
+		"""
+		Write the value with all its children, and return its offset.
+		"""
+		if not isinstance(value, (dict, list, tuple)):
+			return self._emit(encode_scalar(value))
+		return self.write_container(isinstance(value, dict), _frame(value).items)
+
+	def write_container(self, is_dict: bool, items: Iterable[Tuple[Any, Any]]) -> int:
+		"""
+		Write a dict or list from (key, value) items, which may be produced
+		lazily, and return its offset. Keys are ignored for lists.
+		"""
+		stack = [_Frame(is_dict, iter(items))]
+		while True:
+			frame = stack[-1]
+			item = next(frame.items, _MISSING)
+			if item is _MISSING:
+				stack.pop()
+				offset = self._finish(frame)
+				if len(stack) == 0:
+					return offset
+				stack[-1].offsets.append(offset)
+				continue
+			key, child = item
+			if frame.is_dict:
+				frame.keys.append(key)
+			if isinstance(child, (dict, list, tuple)):
+				stack.append(_frame(child))
+			else:
+				frame.offsets.append(self._emit(encode_scalar(child)))
+
+	def _finish(self, frame: _Frame) -> int:
+		count = len(frame.offsets)
+		if not frame.is_dict:
+			return self._emit(b"l" + _LENGTH.pack(count) + b"".join(_OFFSET.pack(o) for o in frame.offsets))
+		encoded = [encode_scalar(k) for k in frame.keys]
+		key_offsets = [self._emit(k) for k in encoded]
+		entries = b"".join(_ENTRY.pack(k, len(e), v) for k, e, v in zip(key_offsets, encoded, frame.offsets))
+		order = sorted(range(count), key=encoded.__getitem__)
+		return self._emit(b"o" + _LENGTH.pack(count) + entries + b"".join(_LENGTH.pack(i) for i in order))
+
+	def finish(self, root: int) -> None:
+		"""
+		Point the header to the root node. The file must be seekable.
+		"""
+		end = self.fp.tell()
+		self.fp.seek(end - self.pos)
+		self.fp.write(_HEADER.pack(MAGIC, root))
+		self.fp.seek(end)
+
+
+def dumps(value: Any) -> bytes:
+	"""
+	Encode value as a binary document.
+	"""
+	fp = io.BytesIO()
+	writer = Writer(fp)
+	writer.finish(writer.write(value))
+	return fp.getvalue()
+
+
+def loads(data: bytes) -> Any:
+	view = View(data)
+	return view.decode(view.root)
+
+
+class View:
+	"""
+	Read access to a binary document in a buffer, like bytes, an mmap or a
+	shared memory block. Nodes are addressed by their offset, and only the
+	nodes that are accessed are decoded.
+	"""
+
+	def __init__(self, buf: Any):
+		self.buf = buf
+		magic, self.root = _HEADER.unpack_from(buf, 0)
+		if magic != MAGIC:
+			raise ValueError("PathDict binary: not a PathDict binary document")
+
+	def tag(self, offset: int) -> int:
+		return self.buf[offset]
+
+	def is_container(self, offset: int) -> bool:
+		return self.buf[offset] in (LIST, DICT)
+
+	def length(self, offset: int) -> int:
+		return _LENGTH.unpack_from(self.buf, offset + 1)[0]
+
+	def scalar(self, offset: int) -> Any:
+		buf = self.buf
+		tag = buf[offset]
+		if tag == STR:
+			size = _LENGTH.unpack_from(buf, offset + 1)[0]
+			return str(buf[offset + 5 : offset + 5 + size], "utf-8")
+		if tag == INT:
+			return _INT.unpack_from(buf, offset + 1)[0]
+		if tag == FLOAT:
+			return _FLOAT.unpack_from(buf, offset + 1)[0]
+		if tag in _CONSTANTS:
+			return _CONSTANTS[tag]
+		if tag == BIG_INT:
+			size = _LENGTH.unpack_from(buf, offset + 1)[0]
+			return int(bytes(buf[offset + 5 : offset + 5 + size]))
+		raise ValueError(f"PathDict binary: not a scalar at offset {offset}")
+
+	def child(self, offset: int, key: Any, index: int | None = _MISSING) -> int | None:
+		"""
+		Return the offset of the child at key of the container at offset, or
+		None if it does not exist. Raise a KeyError if the node at offset is
+		not a container, or key is not a valid list index.
+		"""
+		buf = self.buf
+		tag = buf[offset]
+		if tag == DICT:
+			count = _LENGTH.unpack_from(buf, offset + 1)[0]
+			try:
+				encoded = encode_scalar(key)
+			except TypeError:
+				return None
+			entries = offset + 5
+			order = entries + count * _ENTRY.size
+			lo, hi = 0, count
+			while lo < hi:
+				mid = (lo + hi) // 2
+				entry = entries + _LENGTH.unpack_from(buf, order + mid * 4)[0] * _ENTRY.size
+				key_offset, key_size, value_offset = _ENTRY.unpack_from(buf, entry)
+				candidate = bytes(buf[key_offset : key_offset + key_size])
+				if candidate == encoded:
+					return value_offset
+				if candidate < encoded:
+					lo = mid + 1
+				else:
+					hi = mid
+			return None
+		if tag == LIST:
+			count = _LENGTH.unpack_from(buf, offset + 1)[0]
+			index = _as_index(key) if index is _MISSING else index
+			if index is None:
+				raise KeyError(f"PathDict: invalid path ({key} is not a list index)")
+			if index < 0:
+				index += count
+			if not 0 <= index < count:
+				raise KeyError(f"PathDict: invalid path ({key} not in list of length {count})")
+			return _OFFSET.unpack_from(buf, offset + 5 + index * 8)[0]
+		raise KeyError(f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} is a scalar)")
+
+	def children(self, offset: int) -> Iterator[Tuple[Any, int]]:
+		"""
+		Yield (key, offset) for all children of the container at offset, in
+		order. List children have int keys.
+		"""
+		buf = self.buf
+		tag = buf[offset]
+		if tag not in (LIST, DICT):
+			raise KeyError(
+				f"PathDict: The path is not a stack of nested dicts and lists (value at {offset} is a scalar)"
+			)
+		count = _LENGTH.unpack_from(buf, offset + 1)[0]
+		if tag == DICT:
+			for i in range(count):
+				key_offset, _, value_offset = _ENTRY.unpack_from(buf, offset + 5 + i * _ENTRY.size)
+				yield self.scalar(key_offset), value_offset
+		else:
+			for i in range(count):
+				yield i, _OFFSET.unpack_from(buf, offset + 5 + i * 8)[0]
+
+	def select(self, offset: int, selector: Any) -> List[Tuple[Any, int]]:
+		"""
+		Return (key, offset) for the children of the container at offset that
+		the selector of a wildcard key selects, see path.select_keys. Only
+		where() predicates decode the children.
+		"""
+		if selector is None:
+			return list(self.children(offset))
+		is_list = self.tag(offset) == LIST
+		if isinstance(selector, tuple):
+			if not is_list:
+				selected = ((key, self.child(offset, key)) for key, _ in selector)
+				return [(key, child) for key, child in selected if child is not None]
+			length = self.length(offset)
+			indices = (i + length if i < 0 else i for _, i in selector if i is not None and -length <= i < length)
+			return [(i, self.child(offset, i, i)) for i in dict.fromkeys(indices)]
+		if isinstance(selector, slice):
+			if not is_list:
+				return []
+			return [(i, self.child(offset, i, i)) for i in range(self.length(offset))[selector]]
+		return [(key, child) for key, child in self.children(offset) if selector.matches(self.decode(child))]
+
+	def decode(self, offset: int) -> Any:
+		"""
+		Decode the node at offset with all its children.
+		"""
+		if not self.is_container(offset):
+			return self.scalar(offset)
+		root = {} if self.tag(offset) == DICT else []
+		stack = [(root, offset)]
+		while stack:
+			container, offset = stack.pop()
+			for key, child_offset in self.children(offset):
+				if self.is_container(child_offset):
+					child = {} if self.tag(child_offset) == DICT else []
+					stack.append((child, child_offset))
+				else:
+					child = self.scalar(child_offset)
+				if isinstance(container, dict):
+					container[key] = child
+				else:
+					container.append(child)
+		return root
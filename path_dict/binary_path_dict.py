@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Iterator, Tuple
+
+from . import binary, traversal
+from .path import CompiledPath, Path, _as_index, compile_path, select_keys
+from .path_dict import PathDict
+
+
+class BinaryPathDict:
+	"""
+	Base class of PathDicts that read a binary document (see binary.py)
+	through a View, and decode only the nodes that a path touches. It
+	implements the reading part of the PathDict API.
+
+	Subclasses can hold written values in the overlay, which maps top-level
+	keys to changed top-level children, or replace the whole data with
+	replaced_root. Containers in the overlay that were only decoded to
+	write below them are partial, see _PartialDict.
+	"""
+
+	path_handle: Path
+	view: binary.View
+	root_is_dict: bool
+	overlay: dict
+	replaced_root: dict | list | None
+
+	def __init__(self, view: binary.View, raw=False):
+		self.path_handle = Path([], raw=raw)
+		self._attach(view)
+
+	def _attach(self, view: binary.View):
+		self.view = view
+		self.root_is_dict = view.tag(view.root) == binary.DICT
+		self.overlay = {}
+		# The whole data, if the root was set
+		self.replaced_root = None
+
+	############################################################################
+	# Moving the handle
+	############################################################################
+
+	def at(self, *path, raw=None) -> BinaryPathDict:
+		"""
+		Move the handle to the given path, like PathDict.at. Wildcard paths
+		can be read with gather.
+		"""
+		raw = self.path_handle.raw if raw is None else raw
+		self.path_handle = Path(*path, raw=raw)
+		return self
+
+	def at_root(self) -> BinaryPathDict:
+		return self.at()
+
+	############################################################################
+	# Getters
+	############################################################################
+
+	def get(self, default=None) -> Any:
+		"""
+		Decode and return the value at the current path, or default if the
+		path does not exist.
+		"""
+		value = self._get(self._concrete("get"))
+		return default if value is None else value
+
+	def gather(self, as_type="list", include_paths=False) -> dict | list:
+		"""
+		Decode the values at all paths that match the current path, like
+		MultiPathDict.gather.
+		"""
+		if as_type not in ["list", "dict"]:
+			raise ValueError("Can only return as dict or list, not both")
+		items = self._iter(self.path_handle.compiled)
+		if as_type == "dict":
+			return dict(items)
+		return list(items) if include_paths else [value for _, value in items]
+
+	def filter(self, f: Callable, as_type="list", include_paths=False) -> PathDict:
+		"""
+		Return a PathDict on the children at the current path for which
+		f(key, value) is True for dicts, or f(value) is True for lists. The
+		children are decoded one at a time. For wildcard paths, filter the
+		matching values like MultiPathDict.filter.
+		"""
+		compiled = self.path_handle.compiled
+		if compiled.has_wildcards:
+			if as_type == "dict":
+				data = {path: value for path, value in self._iter(compiled) if f(path, value)}
+			else:
+				items = self._iter(compiled) if include_paths else (v for _, v in self._iter(compiled))
+				data = [x for x in items if f(x)]
+			return PathDict(data)
+		is_dict = self._is_dict(compiled)
+		children = self._iter(compile_path(compiled.keys + ("*",), raw=False))
+		if is_dict:
+			return PathDict({path[-1]: value for path, value in children if f(path[-1], value)})
+		return PathDict([value for _, value in children if f(value)])
+
+	def keys(self) -> list:
+		compiled = self._concrete("keys")
+		if len(compiled) == 0 and self.replaced_root is None:
+			return self._top_keys()
+		if not self._is_dict(compiled):
+			raise TypeError(f"{type(self).__name__} keys: must be applied to a dict")
+		return [path[-1] for path, _ in self._iter(compile_path(compiled.keys + ("*",)), decode=False)]
+
+	def __len__(self) -> int:
+		compiled = self._concrete("len")
+		if len(compiled) == 0 and self.replaced_root is None:
+			return len(self._top_keys())
+		return sum(1 for _ in self._iter(compile_path(compiled.keys + ("*",)), decode=False))
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def _item_path(self, path) -> CompiledPath:
+		keys = path if isinstance(path, tuple) else tuple(path) if isinstance(path, list) else (path,)
+		return compile_path(keys, self.path_handle.raw)
+
+	def __getitem__(self, path):
+		compiled = self._item_path(path)
+		if compiled.has_wildcards:
+			return [value for _, value in self._iter(compiled)]
+		return self._get(compiled)
+
+	def __contains__(self, path) -> bool:
+		try:
+			return self[path] is not None
+		except KeyError:
+			return False
+
+	############################################################################
+	# Internals
+	############################################################################
+
+	def _concrete(self, method: str) -> CompiledPath:
+		compiled = self.path_handle.compiled
+		if compiled.has_wildcards:
+			raise ValueError(f"{type(self).__name__} {method}: wildcard paths are not supported, use gather")
+		return compiled
+
+	def _top_key(self, key: Any) -> Any:
+		"""
+		Normalize a top-level key. List indices become non-negative ints.
+		"""
+		if self.root_is_dict:
+			return key
+		index = _as_index(key)
+		length = self.view.length(self.view.root)
+		if index is not None and index < 0:
+			index += length
+		if index is None or not 0 <= index < length:
+			raise KeyError(f"PathDict: invalid path ({key} not in list of length {length})")
+		return index
+
+	def _top_keys(self) -> list:
+		view = self.view
+		if not self.root_is_dict:
+			return list(range(view.length(view.root)))
+		keys = [key for key, _ in view.children(view.root)]
+		if self.overlay:
+			existing = set(keys)
+			keys.extend(key for key in self.overlay if key not in existing)
+		return keys
+
+	def _get(self, compiled: CompiledPath) -> Any:
+		for _, value in self._iter(compiled):
+			return value
+
+	def _is_dict(self, compiled: CompiledPath) -> bool:
+		for _, value in self._iter(compiled, decode=False):
+			if isinstance(value, _Offset) and self.view.is_container(value.offset):
+				return self.view.tag(value.offset) == binary.DICT
+			if isinstance(value, dict):
+				return True
+			if isinstance(value, list):
+				return False
+		raise TypeError(f"{type(self).__name__}: must be applied to a dict or list")
+
+	def _iter(self, compiled: CompiledPath, decode=True) -> Iterator[Tuple[tuple, Any]]:
+		"""
+		Yield (path, value) for every path matching compiled, like
+		traversal.iter_values. Values in the file are decoded, or yielded as
+		an _Offset if decode is False.
+		"""
+		nodes = _Nodes(self)
+		root = self.view.root if self.replaced_root is None else _Decoded(self.replaced_root)
+		for path, node in traversal.walk(root, compiled, nodes):
+			yield path, self._load(node, decode)
+
+	def _load(self, node: Any, decode=True) -> Any:
+		if node is None:
+			return None
+		if isinstance(node, _Decoded):
+			return self._materialize(node.value) if decode else node.value
+		if not decode:
+			return _Offset(node)
+		return self._decode_root() if node == self.view.root else self.view.decode(node)
+
+	def _decode_root(self) -> dict | list:
+		root = self.view.decode(self.view.root)
+		for key, value in self.overlay.items():
+			root[key] = self._materialize(value)
+		return root
+
+	def _materialize(self, value: Any) -> Any:
+		"""
+		Return value with the placeholders in its partial containers decoded.
+		Only partial containers are copied, they are the containers along
+		written paths.
+		"""
+		if isinstance(value, _Offset):
+			return self.view.decode(value.offset)
+		if isinstance(value, _PartialDict):
+			return {k: self._materialize(v) for k, v in value.items()}
+		if isinstance(value, _PartialList):
+			return [self._materialize(v) for v in value]
+		return value
+
+
+class _Offset:
+	"""
+	An undecoded node in the document.
+	"""
+
+	__slots__ = ("offset",)
+
+	def __init__(self, offset: int):
+		self.offset = offset
+
+
+class _PartialDict(dict):
+	"""
+	A dict of the document that was decoded one level deep, to write below
+	it. Its children that are containers are _Offset placeholders, until
+	they are decoded to write below them.
+	"""
+
+	__slots__ = ()
+
+
+class _PartialList(list):
+	"""
+	A list of the document that was decoded one level deep, like _PartialDict.
+	"""
+
+	__slots__ = ()
+
+
+class _Decoded:
+	"""
+	A decoded value in the overlay or replaced_root, as a node of _Nodes.
+	"""
+
+	__slots__ = ("value",)
+
+	def __init__(self, value: Any):
+		self.value = value
+
+
+def _decoded(value: Any) -> _Decoded | None:
+	return None if value is None else _Decoded(value)
+
+
+class _Nodes(traversal.Nodes):
+	"""
+	The nodes of a BinaryPathDict for traversal._walk: offsets of nodes in
+	the view, or _Decoded values. The top-level children in the overlay
+	replace the ones in the file.
+	"""
+
+	def __init__(self, pd: BinaryPathDict):
+		self.pd = pd
+		self.view = pd.view
+		self.root = pd.view.root
+		self.overlay = pd.overlay
+
+	def is_container(self, node: Any) -> bool:
+		if isinstance(node, _Decoded):
+			return isinstance(node.value, (dict, list))
+		return self.view.is_container(node)
+
+	def is_list(self, node: Any) -> bool:
+		if isinstance(node, _Decoded):
+			return isinstance(node.value, list)
+		return self.view.tag(node) == binary.LIST
+
+	def length(self, node: Any) -> int:
+		return len(node.value) if isinstance(node, _Decoded) else self.view.length(node)
+
+	def child(self, node: Any, key: Any) -> Any:
+		if isinstance(node, _Decoded):
+			value = node.value
+			return self._node(value.get(key) if isinstance(value, dict) else value[key])
+		if node == self.root and key in self.overlay:
+			return _decoded(self.overlay[key])
+		return self._offset(self.view.child(node, key, key))
+
+	def select(self, node: Any, selector: Any) -> list[tuple[Any, Any]] | None:
+		if not self.is_container(node):
+			return None
+		if isinstance(node, _Decoded):
+			value = node.value
+			if selector is None or isinstance(selector, (tuple, slice)):
+				keys = select_keys(selector, value)
+			else:
+				# Predicates see decoded children, also in partial containers
+				keys = value if isinstance(value, dict) else range(len(value))
+				keys = [k for k in keys if selector.matches(self.pd._materialize(value[k]))]
+			return [(k, self._node(value[k])) for k in keys]
+		if node == self.root and self.overlay:
+			return self._select_root(selector)
+		return [(k, self._offset(child)) for k, child in self.view.select(node, selector)]
+
+	def identity(self, node: Any) -> Any:
+		# Offsets are ints, so the ids of decoded values are put in a tuple
+		return (id(node.value),) if isinstance(node, _Decoded) else node
+
+	def _node(self, value: Any) -> Any:
+		# Placeholders in partial containers refer to nodes in the document
+		return self._offset(value.offset) if isinstance(value, _Offset) else _decoded(value)
+
+	def _offset(self, offset: int | None) -> int | None:
+		if offset is None or self.view.tag(offset) == binary.NULL:
+			return None
+		return offset
+
+	def _select_root(self, selector: Any) -> list[tuple[Any, Any]]:
+		keys = self.pd._top_keys()
+		if selector is None or isinstance(selector, (tuple, slice)):
+			keys = select_keys(selector, dict.fromkeys(keys) if self.pd.root_is_dict else keys)
+			return [(k, self.child(self.root, k)) for k in keys]
+		children = ((k, self.child(self.root, k)) for k in keys)
+		return [(k, child) for k, child in children if selector.matches(self.pd._load(child))]
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Any, List, NamedTuple
+
+# Operations of a patch:
+# - set: set the value at path
+# - delete: remove the key at path from its dict
+# - insert: insert the value into the list before the index at path
+# - remove: remove the item at the index at path from its list
+OPS = ("set", "delete", "insert", "remove")
+
+
+class Op(NamedTuple):
+	"""
+	One operation of a patch, see OPS. value is None for delete and remove.
+	"""
+
+	op: str
+	path: tuple
+	value: Any = None
+
+
+def _same(a: Any, b: Any) -> bool:
+	# True == 1, but the values are different
+	return a is b or (type(a) is type(b) and a == b)
+
+
+def diff(a: Any, b: Any) -> List[Op]:
+	"""
+	Return the operations that turn a into b, with paths relative to a.
+	Applied in order with patch, they give a value equal to b. The values of
+	set and insert operations are the objects from b, not copies.
+
+	Subtrees that are the same object in a and b are skipped without
+	comparing them. Lists are compared by trimming their equal prefix and
+	suffix first, so only the changed middle is diffed.
+	"""
+	ops = []
+	stack = [((), a, b)]
+	while stack:
+		path, a, b = stack.pop()
+		if a is b:
+			continue
+		if isinstance(a, dict) and isinstance(b, dict):
+			ops.extend(Op("delete", path + (key,)) for key in a if key not in b)
+			children = []
+			for key, value in b.items():
+				if key not in a:
+					ops.append(Op("set", path + (key,), value))
+				elif a[key] is not value:
+					children.append((path + (key,), a[key], value))
+			stack.extend(reversed(children))
+		elif isinstance(a, list) and isinstance(b, list):
+			_diff_lists(path, a, b, ops, stack)
+		elif not _same(a, b):
+			ops.append(Op("set", path, b))
+	return ops
+
+
+def _diff_lists(path: tuple, a: list, b: list, ops: List[Op], stack: list) -> None:
+	# Trim the equal prefix and suffix
+	end = min(len(a), len(b))
+	start = 0
+	while start < end and _same(a[start], b[start]):
+		start += 1
+	suffix = 0
+	while suffix < end - start and _same(a[len(a) - 1 - suffix], b[len(b) - 1 - suffix]):
+		suffix += 1
+	a_end, b_end = len(a) - suffix, len(b) - suffix
+
+	# Diff the items at the same index, and insert or remove the rest
+	paired = min(a_end, b_end) - start
+	for i in range(a_end - 1, start + paired - 1, -1):
+		ops.append(Op("remove", path + (i,)))
+	for i in range(start + paired, b_end):
+		ops.append(Op("insert", path + (i,), b[i]))
+	stack.extend((path + (i,), a[i], b[i]) for i in reversed(range(start, start + paired)))
+
+
+def apply_op(container: Any, op: str, key: Any, value: Any) -> None:
+	"""
+	Apply a delete, insert or remove operation at key of its parent
+	container.
+	"""
+	if isinstance(container, dict) and op == "delete":
+		container.pop(key, None)
+	elif isinstance(container, list) and op in ("delete", "remove", "insert"):
+		if not isinstance(key, int):
+			raise KeyError(f"PathDict patch: invalid path ({key} is not a list index)")
+		if op == "insert":
+			container.insert(key, value)
+		else:
+			try:
+				del container[key]
+			except IndexError as e:
+				raise KeyError(f"PathDict patch: invalid path ({key} not in list of length {len(container)})") from e
+	else:
+		raise KeyError(f"PathDict patch: cannot {op} at key {key} of a {type(container)}")
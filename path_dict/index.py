@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from .path import CompiledPath, compile_path
+
+
+def compile_fields(fields: tuple) -> tuple[CompiledPath, ...]:
+	"""
+	Compile relative field paths. A field is a single key, or a list or tuple
+	of keys for a nested field.
+	"""
+	if len(fields) == 0:
+		raise ValueError("PathDict: at least one field path is required")
+	return tuple(compile_path(tuple(f) if isinstance(f, (list, tuple)) else (f,)) for f in fields)
+
+
+def field_value(fields: tuple[CompiledPath, ...], child: Any) -> Any:
+	"""
+	Get the value of the fields in child. Return a tuple of values for
+	composite fields. Fields that are missing or invalid in child are None.
+	"""
+	if len(fields) == 1:
+		return _get_field(fields[0], child)
+	return tuple(_get_field(f, child) for f in fields)
+
+
+def _get_field(field: CompiledPath, child: Any) -> Any:
+	if not isinstance(child, (dict, list)):
+		return None
+	try:
+		return field.get(child)
+	except KeyError:
+		return None
+
+
+class Index:
+	"""
+	A hash index on the children of the dict or list at path. It maps the
+	value at the relative field path of each child to the keys (or indices)
+	of the children with that value. With more than one field, the index is
+	composite and its values are tuples.
+
+	Values that are not hashable are not indexed.
+	"""
+
+	path: tuple
+	fields: tuple[CompiledPath, ...]
+	buckets: dict[Any, dict[Any, None]]
+	values_by_key: dict[Any, Any]
+
+	def __init__(self, path: tuple, fields: tuple[CompiledPath, ...]):
+		self.path = path
+		self.fields = fields
+		self.buckets = {}
+		self.values_by_key = {}
+
+	def __repr__(self) -> str:
+		fields = [f.keys for f in self.fields]
+		return f"Index(path={self.path}, fields={fields}, size={len(self.values_by_key)})"
+
+	def lookup(self, value: Any) -> list:
+		"""
+		Return the keys of all children whose field value equals value.
+		"""
+		return list(self.buckets.get(value, ()))
+
+	def lookup_many(self, values: Iterable) -> list:
+		"""
+		Return the keys of all children whose field value is in values.
+		"""
+		keys = {}
+		for value in values:
+			keys.update(self.buckets.get(value, {}))
+		return list(keys)
+
+	############################################################################
+	# Maintenance
+	############################################################################
+
+	def rebuild(self, container: Any) -> None:
+		"""
+		Index all children of the container from scratch.
+		"""
+		self.buckets = {}
+		self.values_by_key = {}
+		if isinstance(container, dict):
+			for key, child in container.items():
+				self._add(key, child)
+		elif isinstance(container, list):
+			for key, child in enumerate(container):
+				self._add(key, child)
+
+	def changed(self, root: dict | list, keys: tuple) -> None:
+		"""
+		Update the index after the value at the absolute path keys in root
+		was changed.
+		"""
+		depth = len(self.path)
+		if len(keys) > depth and keys[:depth] == self.path:
+			# Only one child changed, and only if the change touches a field
+			rest = keys[depth + 1 :]
+			if any(f.keys[: len(rest)] == rest or rest[: len(f.keys)] == f.keys for f in self.fields):
+				container = compile_path(self.path).get(root)
+				self._update(container, keys[depth])
+		elif self.path[: len(keys)] == keys:
+			# The container itself or one of its parents changed
+			self.rebuild(compile_path(self.path).get(root))
+
+	def _update(self, container: Any, key: Any) -> None:
+		if isinstance(container, list):
+			key = int(key)
+			if key < 0:
+				key += len(container)
+		self._remove(key)
+		if isinstance(container, dict) and key in container:
+			self._add(key, container[key])
+		elif isinstance(container, list) and 0 <= key < len(container):
+			self._add(key, container[key])
+
+	def _add(self, key: Any, child: Any) -> None:
+		value = field_value(self.fields, child)
+		try:
+			self.buckets.setdefault(value, {})[key] = None
+		except TypeError:
+			return
+		self.values_by_key[key] = value
+
+	def _remove(self, key: Any) -> None:
+		if key not in self.values_by_key:
+			return
+		value = self.values_by_key.pop(key)
+		bucket = self.buckets[value]
+		del bucket[key]
+		if len(bucket) == 0:
+			del self.buckets[value]
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from typing import Any, List, NamedTuple
+
+from . import utils
+from .path import compile_path
+
+
+class Change(NamedTuple):
+	"""
+	A change at the absolute path. For op "set", old and new are copies of
+	the values before and after the change, and None if there was no value.
+	For op "insert", items were inserted into a list, path ends with the
+	index of the first inserted item, old is None and new is a list of
+	copies of the inserted items.
+	"""
+
+	path: tuple
+	old: Any
+	new: Any
+	op: str = "set"
+
+
+def _value_at(root: Any, keys: tuple) -> Any:
+	try:
+		return compile_path(keys, raw=True).get(root)
+	except KeyError:
+		return None
+
+
+class Journal:
+	"""
+	Records the changes that are made through a PathDict handle, created
+	with PathDict.journal(). Every write is recorded as a Change of the path
+	that was written, so a saver or replicator can apply the changes instead
+	of the whole document. Items that are appended or inserted into a list
+	are recorded as an insert of only these items.
+
+	If coalesce is True, repeated writes to the same path are collapsed into
+	one Change with the oldest old value and the newest new value. It moves
+	to the position of the latest write, so applying the changes in order
+	still gives the current data. Inserts shift the indexes of a list, so
+	writes from before an insert are not collapsed with writes after it,
+	and consecutive appends to the same list are collapsed into one insert.
+	"""
+
+	coalesce: bool
+
+	def __init__(self, coalesce=False):
+		self.coalesce = coalesce
+		# Changes by the position of their latest write
+		self._changes = {}
+		self._position = 0
+		# Positions of the changes that later writes can be collapsed into
+		self._open = {}
+		# Old values of the writes that are in progress
+		self._pending = {}
+
+	def __repr__(self) -> str:
+		return f"Journal(coalesce={self.coalesce}, changes={len(self._changes)})"
+
+	def __len__(self) -> int:
+		return len(self._changes)
+
+	@property
+	def changes(self) -> List[Change]:
+		return list(self._changes.values())
+
+	def dirty_paths(self) -> list:
+		"""
+		Return the distinct paths that changed since the last drain, in the
+		order of their first change, or of their latest change if coalesce is
+		True.
+		"""
+		paths = [change.path for change in self._changes.values()]
+		if self.coalesce:
+			return list(reversed(dict.fromkeys(reversed(paths))))
+		return list(dict.fromkeys(paths))
+
+	def drain_changes(self) -> List[Change]:
+		"""
+		Return the recorded changes in order, and clear the journal.
+		"""
+		changes = self.changes
+		self._changes = {}
+		self._open = {}
+		return changes
+
+	############################################################################
+	# Recording
+	############################################################################
+
+	def before(self, root: Any, keys: tuple) -> None:
+		"""
+		Remember the old value at keys, before it is changed in place.
+		"""
+		self._pending[keys] = utils.fast_deepcopy(_value_at(root, keys))
+
+	def after(self, root: Any, keys: tuple) -> None:
+		"""
+		Record the change at keys, after it was written.
+		"""
+		old = self._pending.pop(keys, None)
+		new = utils.fast_deepcopy(_value_at(root, keys))
+		if old is None and new is None:
+			return
+		if self.coalesce and keys in self._open:
+			old = self._changes.pop(self._open[keys]).old
+		self._record(Change(keys, old, new))
+
+	def inserted(self, root: Any, keys: tuple, index: int, count: int) -> None:
+		"""
+		Record that count items were inserted at index into the list at keys,
+		after they were inserted. Only the inserted items are copied.
+		"""
+		if count == 0:
+			return
+		items = utils.fast_deepcopy(_value_at(root, keys)[index : index + count])
+		if self.coalesce:
+			last = self._changes.get(self._position - 1)
+			if last is not None and last.op == "insert" and last.path == keys + (index - len(last.new),):
+				last.new.extend(items)
+				return
+			self._open = {}
+		self._record(Change(keys + (index,), None, items, "insert"))
+
+	def _record(self, change: Change) -> None:
+		self._changes[self._position] = change
+		if self.coalesce and change.op == "set":
+			self._open[change.path] = self._position
+		self._position += 1
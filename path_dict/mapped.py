@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import mmap
+import os
+from typing import IO, Any
+
+from . import binary, stream
+from .binary_path_dict import BinaryPathDict, _Offset, _PartialDict, _PartialList
+from .path import CompiledPath, Path, compile_path
+
+_RECORD_LENGTH = binary._LENGTH
+
+
+class MappedPathDict(BinaryPathDict):
+	"""
+	A PathDict over a binary document in a file (see binary.py), which is
+	memory-mapped, so only the nodes that a path touches are decoded. Several
+	processes that open the same file share one page-cached copy of it.
+
+	Writes are appended to a log next to the file (filename + ".log") and
+	applied to an in-memory overlay. The overlay holds the top-level children
+	that were written to, in which only the containers along the written
+	paths are decoded. Their other children still refer to the file.
+	refresh() applies the writes that other processes appended to the log,
+	and compact() merges the log into the file.
+	"""
+
+	filename: str
+	log_filename: str
+
+	def __init__(self, filename: str, raw=False):
+		self.filename = filename
+		self.log_filename = filename + ".log"
+		self.path_handle = Path([], raw=raw)
+		self._open()
+
+	def _open(self):
+		self._file = open(self.filename, "rb")
+		self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		self._attach(binary.View(self._mmap))
+		stat = os.fstat(self._file.fileno())
+		self._generation = (stat.st_dev, stat.st_ino)
+		self._log_position = 0
+		self.refresh()
+
+	@classmethod
+	def create(cls, filename: str, data: dict | list, raw=False) -> MappedPathDict:
+		"""
+		Write data to filename in the binary format, and open it.
+		"""
+		if not isinstance(data, (dict, list)):
+			raise TypeError(f"MappedPathDict create: data must be dict or list but is {type(data)}")
+		with open(filename, "wb") as fp:
+			writer = binary.Writer(fp)
+			writer.finish(writer.write(data))
+		cls._remove_log(filename)
+		return cls(filename, raw=raw)
+
+	@classmethod
+	def from_json(cls, filename: str, fp: IO, raw=False) -> MappedPathDict:
+		"""
+		Convert the JSON document in the file fp to the binary format in
+		filename, and open it. The JSON is parsed incrementally, so only one
+		top-level child is held in memory at a time.
+		"""
+		is_dict, children = stream.iter_root(fp)
+		with open(filename, "wb") as out:
+			writer = binary.Writer(out)
+			writer.finish(writer.write_container(is_dict, children))
+		cls._remove_log(filename)
+		return cls(filename, raw=raw)
+
+	@staticmethod
+	def _remove_log(filename: str):
+		if os.path.exists(filename + ".log"):
+			os.remove(filename + ".log")
+
+	def close(self):
+		self._mmap.close()
+		self._file.close()
+
+	def __enter__(self) -> MappedPathDict:
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __repr__(self) -> str:
+		return f"MappedPathDict({self.filename!r}, {self.path_handle = })"
+
+	############################################################################
+	# Setters
+	############################################################################
+
+	def set(self, value) -> MappedPathDict:
+		"""
+		Set the value at the current path, and append the write to the log.
+		"""
+		self._set(self._concrete("set").keys, value)
+		return self
+
+	def __setitem__(self, path, value):
+		compiled = self._item_path(path)
+		if compiled.has_wildcards:
+			raise ValueError("MappedPathDict set: wildcard paths are not supported")
+		self._set(compiled.keys, value)
+
+	def _set(self, keys: tuple, value: Any):
+		# Setting nothing is a no-op
+		if value is None:
+			return
+		# Encode first, so values that cannot be encoded change nothing
+		record = binary.dumps([list(keys), value])
+		self._apply(keys, value)
+		with open(self.log_filename, "ab") as log:
+			start = log.tell()
+			log.write(_RECORD_LENGTH.pack(len(record)) + record)
+			# Only skip the own write if there are no unread writes before it
+			if start == self._log_position:
+				self._log_position = log.tell()
+
+	def refresh(self) -> MappedPathDict:
+		"""
+		Apply the writes that were appended to the log since it was last read,
+		for example by other processes. If another process compacted the
+		file, it is reopened.
+		"""
+		stat = os.stat(self.filename)
+		if (stat.st_dev, stat.st_ino) != self._generation:
+			# The log of the open file was merged into the new file and removed
+			self.close()
+			self._open()
+			return self
+		if not os.path.exists(self.log_filename):
+			return self
+		with open(self.log_filename, "rb") as log:
+			log.seek(self._log_position)
+			while True:
+				header = log.read(_RECORD_LENGTH.size)
+				if len(header) < _RECORD_LENGTH.size:
+					break
+				record = log.read(_RECORD_LENGTH.unpack(header)[0])
+				if len(record) < _RECORD_LENGTH.unpack(header)[0]:
+					# The record is still being written
+					break
+				keys, value = binary.loads(record)
+				self._apply(tuple(keys), value)
+				self._log_position = log.tell()
+		return self
+
+	def compact(self) -> MappedPathDict:
+		"""
+		Merge the log into the file, one top-level child at a time, and clear
+		the log. Other processes reopen the file on their next refresh().
+		"""
+		tmp = self.filename + ".tmp"
+		with open(tmp, "wb") as out:
+			writer = binary.Writer(out)
+			if self.replaced_root is not None:
+				root = writer.write(self.replaced_root)
+			else:
+				children = ((key, self._get(compile_path((key,), raw=True))) for key in self._top_keys())
+				root = writer.write_container(self.root_is_dict, children)
+			writer.finish(root)
+		self.close()
+		os.replace(tmp, self.filename)
+		self._remove_log(self.filename)
+		self._open()
+		return self
+
+	def _apply(self, keys: tuple, value: Any):
+		if len(keys) == 0:
+			if not isinstance(value, dict if self.root_is_dict else list):
+				raise TypeError(
+					"PathDict set: At the root level, you can only set dict dict or"
+					f"list to a list (tried to set a {'dict' if self.root_is_dict else 'list'} to a "
+					f"{type(value)})."
+				)
+			self.replaced_root = value
+			self.overlay = {}
+			return
+		if self.replaced_root is not None:
+			compile_path(keys, raw=True).set(self.replaced_root, value)
+			return
+		top = self._top_key(keys[0])
+		if len(keys) == 1:
+			self.overlay[top] = value
+			return
+		if top not in self.overlay:
+			offset = self.view.child(self.view.root, top)
+			self.overlay[top] = {} if offset is None else self._partial(offset)
+		compiled = compile_path(keys[1:], raw=True)
+		self._expand(self.overlay[top], compiled)
+		compiled.set(self.overlay[top], value)
+
+	def _partial(self, offset: int) -> Any:
+		"""
+		Decode the node at offset one level deep. Its children that are
+		containers become _Offset placeholders.
+		"""
+		view = self.view
+		if not view.is_container(offset):
+			return view.decode(offset)
+		children = ((k, _Offset(c) if view.is_container(c) else view.decode(c)) for k, c in view.children(offset))
+		if view.tag(offset) == binary.DICT:
+			return _PartialDict(children)
+		return _PartialList(child for _, child in children)
+
+	def _expand(self, current: Any, compiled: CompiledPath):
+		"""
+		Decode the placeholders along the parent steps of compiled one level
+		deep, so that compiled.set can descend through them.
+		"""
+		for key, index in compiled.parent_steps:
+			if isinstance(current, dict) and key in current:
+				slot = key
+			elif isinstance(current, list) and index is not None and -len(current) <= index < len(current):
+				slot = index
+			else:
+				# set creates or rejects the rest of the path
+				return
+			if isinstance(current[slot], _Offset):
+				current[slot] = self._partial(current[slot].offset)
+			current = current[slot]
@@ -1,21 +1,30 @@
 from __future__ import annotations
 
-from typing import Any, Callable
+import functools
+import operator
+from concurrent.futures import Executor
+from typing import Any, Callable, Iterator
 
+from . import aggregate, arrays, parallel, serialize, traversal, utils
 from .path import Path
 from .path_dict import PathDict
+from .snapshot import CopyOnWrite
 
 
 class MultiPathDict:
 	path_handle: Path
 	root_data: dict | list
+	handle: PathDict | None
 
-	def __init__(self, data: dict | list, path: Path):
+	def __init__(self, data: dict | list, path: Path, handle: PathDict | None = None):
 		self.path_handle = path
 		self.root_data = data
+		# The PathDict this MultiPathDict was created from, if any
+		self.handle = handle
 
 	def __repr__(self) -> str:
-		return f"MultiPathDict({self.root_data = }, {self.path_handle = })"
+		root_data = serialize.bounded_repr(self.root_data)
+		return f"MultiPathDict(self.root_data = {root_data}, {self.path_handle = })"
 
 	############################################################################
 	# Setters
@@ -34,18 +43,32 @@ class MultiPathDict:
 		if as_type not in ["list", "dict"]:
 			raise ValueError("Can only return as dict or list, not both")
 
-		handle = PathDict.from_data_and_path(self.root_data, self.path_handle)
 		if as_type == "list":
-			res = []
-			for path in self.path_handle.expand(self.root_data):
-				data = handle.at(path.path).get()
-				res.append((tuple(path.path), data) if include_paths else data)
+			return list(self.iter_items() if include_paths else self.iter_values())
 		# as_type == "dict"
-		else:
-			res = {}
-			for path in self.path_handle.expand(self.root_data):
-				res[tuple(path.path)] = handle.at(path.path).get()
-		return res
+		return dict(self.iter_items())
+
+	def iter_values(self) -> Iterator[Any]:
+		"""
+		Lazily yield the values at all paths that match the multi-path, in the
+		same order as gather.
+		"""
+		for _, value in traversal.iter_values(self.root_data, self.path_handle.compiled):
+			yield value
+
+	def iter_paths(self) -> Iterator[tuple]:
+		"""
+		Lazily yield all paths that match the multi-path as tuples.
+		"""
+		for path, _ in traversal.iter_values(self.root_data, self.path_handle.compiled, with_paths=True):
+			yield path
+
+	def iter_items(self) -> Iterator[tuple[tuple, Any]]:
+		"""
+		Lazily yield (path, value) tuples for all paths that match the
+		multi-path.
+		"""
+		return traversal.iter_values(self.root_data, self.path_handle.compiled, with_paths=True)
 
 	def gather_pd(self, as_type="list", include_paths=False) -> PathDict:
 		data = self.gather(as_type=as_type, include_paths=include_paths)
@@ -56,21 +79,60 @@ class MultiPathDict:
 	# Setters ALWAYS return a handle, not the value.
 	############################################################################
 
-	def map(self, f: Callable) -> PathDict:
+	def map(self, f: Callable, executor: Executor = None, chunksize: int = None) -> PathDict:
 		"""
 		Map the result of f to the value at path previously set by ".at(path)".
 
+		If an executor from concurrent.futures is given, f is applied to the
+		matching values in chunks of chunksize values in the executor, and the
+		results are written back in a single pass, in the same order as without
+		an executor. For a ProcessPoolExecutor, f and the values must be
+		picklable.
+
 		:return: The handle itself for further operations.
 		"""
-		for path in self.path_handle.expand(self.root_data):
-			PathDict.from_data_and_path(self.root_data, path).map(f)
+		self._write(f, needs_value=True, executor=executor, chunksize=chunksize)
+		if self.handle is not None:
+			return self.handle
 		return PathDict.from_data_and_path(self.root_data, self.path_handle)
 
-	def reduce(self, f: Callable, aggregate: Any, as_type="list", include_paths=False) -> Any:
+	def reduce(
+		self,
+		f: Callable,
+		aggregate: Any,
+		as_type="list",
+		include_paths=False,
+		combine: Callable = None,
+		workers: int = None,
+		executor: Executor = None,
+	) -> Any:
 		"""
 		Get all values of the given multi-path, and reduce them using f.
+		If as_type is dict, f is called with (path, value, aggregate),
+		otherwise with (value, aggregate), or ((path, value), aggregate) if
+		include_paths is True.
+
+		Pass workers or an executor and combine to reduce the values in
+		shards in parallel. See PathDict.reduce.
 		"""
-		return self.gather_pd(as_type=as_type, include_paths=include_paths).reduce(f, aggregate)
+		if as_type not in ["list", "dict"]:
+			raise ValueError("Can only return as dict or list, not both")
+
+		if workers is not None or executor is not None:
+			if combine is None:
+				raise ValueError("MultiPathDict reduce: combine is required to reduce in parallel")
+			star = as_type == "dict"
+			items = self.iter_items() if star or include_paths else self.iter_values()
+			return parallel.reduce_shards(parallel.fold, items, (f, aggregate, star), combine, workers, executor)
+
+		agg = aggregate
+		if as_type == "dict":
+			for path, value in self.iter_items():
+				agg = f(path, value, agg)
+			return agg
+		for value in self.iter_items() if include_paths else self.iter_values():
+			agg = f(value, agg)
+		return agg
 
 	############################################################################
 	#### Filter
@@ -81,26 +143,246 @@ class MultiPathDict:
 		At the current path only keep the elements for which f(key, value)
 		is True for dicts, or f(value) is True for lists.
 		"""
-		return self.gather_pd(as_type=as_type, include_paths=include_paths).filter(f)
+		if as_type not in ["list", "dict"]:
+			raise ValueError("Can only return as dict or list, not both")
+
+		if as_type == "dict":
+			data = {path: value for path, value in self.iter_items() if f(path, value)}
+		else:
+			data = [x for x in (self.iter_items() if include_paths else self.iter_values()) if f(x)]
+		return PathDict.from_data_and_path(data, self.path_handle.copy(replace_path=[]))
+
+	def parallel_filter(
+		self, f: Callable, executor: Executor, chunksize: int = None, as_type="list", include_paths=False
+	) -> PathDict:
+		"""
+		Like filter, but f is applied in chunks of chunksize values in the
+		given executor from concurrent.futures. The result has the same order
+		as the result of filter.
+		"""
+		if as_type not in ["list", "dict"]:
+			raise ValueError("Can only return as dict or list, not both")
+
+		items = list(self.iter_items() if as_type == "dict" or include_paths else self.iter_values())
+		keep = parallel.map_chunks(f, items, executor, chunksize, star=as_type == "dict")
+		if as_type == "dict":
+			data = {path: value for (path, value), k in zip(items, keep) if k}
+		else:
+			data = [x for x, k in zip(items, keep) if k]
+		return PathDict.from_data_and_path(data, self.path_handle.copy(replace_path=[]))
 
 	# def filtered(self, f: Callable[[Any], bool], as_type="list", include_paths=False) -> PathDict:
 	# 	raise NotImplementedError
 
+	############################################################################
+	#### Grouping
+	############################################################################
+
+	def group_by(self, *fields, workers: int = None, executor: Executor = None) -> dict:
+		"""
+		Group all values at the given multi-path by the value of the given
+		relative field paths, in a single pass. Each group is a list of values.
+		"""
+		items = ((None, v) for v in self.iter_values())
+		return parallel.reduce_shards(
+			aggregate.group_by, items, (fields, False), aggregate.combine_groups, workers, executor
+		)
+
+	def count_by(self, *fields, workers: int = None, executor: Executor = None) -> dict:
+		"""
+		Count all values at the given multi-path per value of the given
+		relative field paths, in a single pass.
+		"""
+		values = self.iter_values()
+		return parallel.reduce_shards(
+			aggregate.count_by, values, (fields,), aggregate.combine_counts, workers, executor
+		)
+
+	def aggregate_by(self, field, aggregations: dict, workers: int = None, executor: Executor = None) -> dict:
+		"""
+		Group all values at the given multi-path by the value of field, and
+		aggregate other fields of each group in a single pass.
+		See PathDict.aggregate_by.
+		"""
+		combine = functools.partial(aggregate.combine_states, aggregations)
+		args = (field, aggregations)
+		states = parallel.reduce_shards(
+			aggregate.aggregate_states, self.iter_values(), args, combine, workers, executor
+		)
+		return aggregate.finalize_states(states, aggregations)
+
 	############################################################################
 	#### Useful shorthands
 	############################################################################
 
-	def sum(self) -> Any:
+	def sum(self, workers: int = None, executor: Executor = None) -> Any:
+		"""
+		Sum all values at the given multi-path, ignoring missing values like
+		mean, in shards in parallel if workers or an executor are given.
+		Unlike mean, the sum does not use NumPy, so ints stay exact and it
+		has the type of the values. Returns 0 if there are no values.
+		"""
+		return parallel.reduce_shards(arrays.total, self.iter_values(), (), operator.add, workers, executor)
+
+	def mean(self) -> float | None:
+		"""
+		Mean of all values at the given multi-path, ignoring missing values.
+		Uses NumPy if it is installed. Returns None if there are no values.
+		"""
+		return arrays.mean(self.iter_values())
+
+	def min(self) -> Any:
+		"""
+		Minimum of all values at the given multi-path, ignoring missing values.
+		Like sum, it has the type of the values. Returns None if there are no
+		values.
+		"""
+		return arrays.minimum(self.iter_values())
+
+	def max(self) -> Any:
+		"""
+		Maximum of all values at the given multi-path, like min.
+		"""
+		return arrays.maximum(self.iter_values())
+
+	def quantile(self, q: float | list[float]) -> float | list[float] | None:
+		"""
+		The q-th quantile (0 <= q <= 1) of all values at the given multi-path,
+		or a list of quantiles if q is a list, like mean.
+		"""
+		return arrays.quantile(self.iter_values(), q)
+
+	def to_array(self, dtype: Any = float, fill: Any = None) -> Any:
 		"""
-		Sum all values at the given multi-path.
+		Return a NumPy array of dtype with all values at the given multi-path,
+		filled during the traversal without building a list first. Missing
+		values are replaced by fill, or raise a ValueError if fill is None.
+		Requires NumPy.
 		"""
-		return sum(self.gather())
+		return arrays.to_array(self.iter_values(), dtype, fill)
 
 	def set(self, value: Any) -> PathDict:
-		for path in self.path_handle.expand(self.root_data):
-			PathDict.from_data_and_path(self.root_data, path).set(value)
+		# Setting nothing is a no-op
+		if value is None:
+			return self
+		self._write(lambda _: value, needs_value=False)
 		return self
 
+	def append(self, value: Any) -> MultiPathDict:
+		"""
+		Append the value to the lists at all matching paths, in place.
+		Missing lists are created.
+		"""
+		return self.extend((value,))
+
+	def extend(self, values) -> MultiPathDict:
+		"""
+		Extend the lists at all matching paths by all values, in place.
+		Missing lists are created.
+		"""
+		values = list(values)
+		copy_on_write = self.handle is not None and self.handle.copy_on_write
+
+		def extend(current):
+			if current is None:
+				return list(values)
+			if not isinstance(current, list):
+				raise TypeError("MultiPathDict extend: must be applied to lists")
+			if copy_on_write:
+				return current + values
+			current.extend(values)
+			return current
+
+		inserts = None if copy_on_write else lambda current: (len(current), len(values))
+		self._write(extend, needs_value=True, inserts=inserts)
+		return self
+
+	def insert(self, index: int, value: Any) -> MultiPathDict:
+		"""
+		Insert the value before index into the lists at all matching paths,
+		in place. Missing lists are created.
+		"""
+		copy_on_write = self.handle is not None and self.handle.copy_on_write
+
+		def insert(current):
+			if current is None:
+				return [value]
+			if not isinstance(current, list):
+				raise TypeError("MultiPathDict insert: must be applied to lists")
+			if copy_on_write:
+				current = list(current)
+			current.insert(index, value)
+			return current
+
+		inserts = None if copy_on_write else lambda current: (utils.insert_position(len(current), index), 1)
+		self._write(insert, needs_value=True, inserts=inserts)
+		return self
+
+	def _write(
+		self,
+		f: Callable,
+		needs_value: bool,
+		executor: Executor = None,
+		chunksize: int = None,
+		inserts: Callable | None = None,
+	):
+		"""
+		Set the value at every matching path to f(value), skipping None
+		results like PathDict.set does. With an executor, all results are
+		computed in the executor first. If inserts is given, f inserts items
+		into existing lists in place, and inserts(list) returns their
+		(index, count) before f is called.
+
+		All matching paths are found before anything is written, so a path
+		that raises a KeyError leaves the data unchanged.
+		"""
+		handle = self.handle
+		compiled = self.path_handle.compiled
+
+		if executor is not None and needs_value:
+			# Both traversals yield the matching paths in the same order
+			values = [value for _, value in traversal.iter_values(self.root_data, compiled)]
+			results = iter(parallel.map_chunks(f, values, executor, chunksize))
+			f, needs_value = (lambda _: next(results)), False
+
+		if handle is not None and handle.copy_on_write:
+			writer = CopyOnWrite(self.root_data)
+			written = []
+			matches = list(traversal.iter_values(self.root_data, compiled, with_paths=True))
+			for path, value in matches:
+				value = f(value)
+				if value is not None:
+					handle._changing(path)
+					writer.set(path, value)
+					written.append(path)
+			handle.data = self.root_data = writer.root
+			for path in written:
+				handle._changed(path)
+			return
+
+		track = handle is not None and (
+			len(handle.indexes) > 0 or len(handle.journals) > 0 or len(handle.transactions) > 0
+		)
+		# Find every slot first, so a KeyError in a later branch writes nothing
+		slots = list(traversal.iter_slots(self.root_data, compiled, track, create=False))
+		if any(parent is None for _, parent, _ in slots):
+			# The paths are valid, so creating the missing dicts cannot fail
+			slots = list(traversal.iter_slots(self.root_data, compiled, track))
+		for path, parent, key in slots:
+			current = traversal.read(parent, key) if needs_value else None
+			inserted = None
+			if track and inserts is not None and isinstance(current, list):
+				# f changes current before it returns
+				inserted = inserts(current)
+				handle._changing(path, insert=True)
+			value = f(current)
+			if value is not None:
+				if track and inserted is None:
+					handle._changing(path)
+				traversal.write(parent, key, value)
+				if track:
+					handle._changed(path, inserted)
+
 	############################################################################
 	#### Standard dict methods
 	############################################################################
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import reduce
+from typing import Any, Callable, Iterable, Iterator, List
+
+from . import utils
+
+# Number of chunks per CPU that the values are split into by default, so
+# that uneven chunks still keep all workers busy
+CHUNKS_PER_CPU = 4
+
+
+def default_chunksize(size: int) -> int:
+	cpus = os.cpu_count() or 1
+	return max(1, -(-size // (cpus * CHUNKS_PER_CPU)))
+
+
+def map_chunks(f: Callable, values: List[Any], executor: Executor, chunksize: int = None, star=False) -> list:
+	"""
+	Apply f to all values in the executor, and return the results in the
+	order of values. Values are submitted in chunks, so a process pool
+	pickles f and the values once per chunk instead of once per value.
+	If star is True, f is called with the items of every value as arguments.
+	"""
+	if chunksize is None:
+		chunksize = default_chunksize(len(values))
+	if chunksize < 1:
+		raise ValueError(f"PathDict: chunksize must be at least 1, but is {chunksize}")
+	apply = _apply_star if star else _apply
+	futures = [executor.submit(apply, f, values[i : i + chunksize]) for i in range(0, len(values), chunksize)]
+	res = []
+	for future in futures:
+		res.extend(future.result())
+	return res
+
+
+def reduce_shards(
+	reduce_shard: Callable,
+	items: Iterable,
+	args: tuple,
+	combine: Callable,
+	workers: int = None,
+	executor: Executor = None,
+	chunksize: int = None,
+) -> Any:
+	"""
+	Return reduce_shard(items, *args), computed in parallel if workers or
+	an executor are given. Then items are split into shards of chunksize
+	items, every shard is reduced with reduce_shard(shard, *args) in the
+	executor, and the partial results are combined in shard order with
+	combine(a, b), so the result is deterministic. Without an executor, a
+	ProcessPoolExecutor with the given number of workers is used for the
+	call, so reduce_shard, args and items must be picklable.
+	"""
+	if workers is None and executor is None:
+		return reduce_shard(items, *args)
+	items = list(items)
+	if len(items) == 0:
+		return reduce_shard(items, *args)
+	if chunksize is None:
+		chunksize = default_chunksize(len(items))
+	if chunksize < 1:
+		raise ValueError(f"PathDict: chunksize must be at least 1, but is {chunksize}")
+	with _executor(workers, executor) as pool:
+		futures = [pool.submit(reduce_shard, items[i : i + chunksize], *args) for i in range(0, len(items), chunksize)]
+		partials = [future.result() for future in futures]
+	return reduce(combine, partials)
+
+
+@contextmanager
+def _executor(workers: int | None, executor: Executor | None) -> Iterator[Executor]:
+	if executor is not None:
+		yield executor
+		return
+	with ProcessPoolExecutor(workers) as pool:
+		yield pool
+
+
+# Module-level functions, so that process pools can pickle them
+
+
+def _apply(f: Callable, chunk: list) -> list:
+	return [f(value) for value in chunk]
+
+
+def _apply_star(f: Callable, chunk: list) -> list:
+	return [f(*value) for value in chunk]
+
+
+def fold(chunk: Iterable, f: Callable, aggregate: Any, star: bool) -> Any:
+	"""
+	Fold the chunk with f, starting with a copy of aggregate, so that shards
+	reduced in threads do not share a mutable aggregate.
+	"""
+	agg = utils.fast_deepcopy(aggregate)
+	for item in chunk:
+		agg = f(*item, agg) if star else f(item, agg)
+	return agg
@@ -1,10 +1,244 @@
 from __future__ import annotations
 
-from .utils import get_nested_keys_or_indices
+from functools import lru_cache
+from typing import Any, Callable, List
+
+# Number of distinct paths that compile_path keeps compiled.
+PATH_CACHE_SIZE = 4096
+
+_MISSING = object()
+
+
+class CompiledPath:
+	"""
+	Immutable and hashable form of a path.
+
+	A CompiledPath is created once per distinct key tuple by compile_path.
+	It stores the positions of the wildcards and the list index of every key,
+	so getting and setting values does not have to inspect the keys again.
+	"""
+
+	__slots__ = ("keys", "raw", "wildcards", "recursive", "selectors", "steps", "parent_steps", "_hash")
+
+	keys: tuple
+	raw: bool
+	wildcards: tuple[int, ...]
+	recursive: tuple[int, ...]
+	selectors: tuple[Any, ...]
+	steps: tuple[tuple[Any, int | None], ...]
+	parent_steps: tuple[tuple[Any, int | None], ...]
+
+	def __init__(self, keys: tuple, raw=False):
+		keys, self.wildcards = split_keys(keys, raw)
+		self.keys = keys
+		self.raw = raw
+		# Pair every key with its list index, or None if it cannot index a list
+		self.steps = tuple((k, _as_index(k)) for k in keys)
+		self.parent_steps = self.steps[:-1]
+		# Positions of the "**" wildcards
+		self.recursive = tuple(i for i in self.wildcards if keys[i] == RECURSIVE_WILDCARD)
+		# The selector of every wildcard for select_keys, None for other keys
+		self.selectors = tuple(_selector(k) if i in self.wildcards else None for i, k in enumerate(keys))
+		self._hash = None
+
+	def __repr__(self) -> str:
+		return f"CompiledPath(keys={self.keys}, raw={self.raw})"
+
+	def __eq__(self, other) -> bool:
+		if not isinstance(other, CompiledPath):
+			return NotImplemented
+		return self.keys == other.keys and self.raw == other.raw
+
+	def __hash__(self) -> int:
+		if self._hash is None:
+			self._hash = hash((self.keys, self.raw))
+		return self._hash
+
+	def __len__(self) -> int:
+		return len(self.keys)
+
+	@property
+	def has_wildcards(self) -> bool:
+		return len(self.wildcards) > 0
+
+	def get(self, data: dict | list, default=None) -> Any:
+		"""
+		Get the value at this path in data, or default if the path is valid
+		but does not exist. Raise a KeyError if the path is invalid.
+		"""
+		current = data
+		for key, index in self.steps:
+			if isinstance(current, dict):
+				current = current.get(key)
+			elif isinstance(current, list):
+				current = _list_get(current, key, index)
+			else:
+				raise KeyError(
+					f"PathDict: The path is not a stack of nested dicts and lists "
+					f"(value at key {key} has type {type(current)})"
+				)
+			if current is None:
+				return default
+		return current
+
+	def set(self, data: dict | list, value: Any) -> None:
+		"""
+		Set the value at this path in data, creating missing dicts on the way
+		down. The path must not be empty.
+		"""
+		current = data
+		for key, index in self.parent_steps:
+			if isinstance(current, dict):
+				child = current.get(key, _MISSING)
+				if child is _MISSING:
+					child = current[key] = {}
+				current = child
+			elif isinstance(current, list):
+				current = _list_get(current, key, index)
+			else:
+				raise KeyError("Can't set the key of a non-dict")
+
+		key, index = self.steps[-1]
+		if isinstance(current, dict):
+			current[key] = value
+		elif isinstance(current, list):
+			if index is None:
+				raise KeyError(f"PathDict set: invalid path {self}")
+			try:
+				current[index] = value
+			except IndexError as e:
+				raise KeyError(f"PathDict set: invalid path {self}") from e
+
+
+# Matches every key at one level
+WILDCARD = "*"
+# Matches every key at any depth
+RECURSIVE_WILDCARD = "**"
+
+
+class Where:
+	"""
+	A path segment that selects the children for which f(child) is True,
+	created with where(f). Children for which f raises a KeyError or a
+	TypeError, like a missing field or a scalar, are not selected.
+	"""
+
+	__slots__ = ("f",)
+
+	def __init__(self, f: Callable[[Any], bool]):
+		self.f = f
+
+	def __repr__(self) -> str:
+		return f"where({self.f!r})"
+
+	def matches(self, value: Any) -> bool:
+		try:
+			return bool(self.f(value))
+		except (KeyError, TypeError):
+			return False
+
+
+def where(f: Callable[[Any], bool]) -> Where:
+	"""
+	Return a path segment that selects the children for which f(child) is
+	True. The predicate is evaluated during the traversal, so the children
+	that do not match are never descended into.
+
+	Example:
+	>>> pd(tasks).at(where(lambda t: t["status"] == "open"), "owner").gather()
+	"""
+	return Where(f)
+
+
+def _is_alternation(key: str) -> bool:
+	# Only bracketed, so that plain keys may contain "|"
+	return key.startswith("[") and key.endswith("]") and "|" in key
+
+
+def _is_selector(key: Any) -> bool:
+	if isinstance(key, str):
+		return key == WILDCARD or key == RECURSIVE_WILDCARD or _is_alternation(key)
+	return isinstance(key, (slice, Where))
+
+
+def _selector(key: Any) -> Any:
+	"""
+	Return the selector of a wildcard key for select_keys: None for "*" and
+	"**", a tuple of (key, index) alternatives for "[a|b]", or the slice or
+	Where itself.
+	"""
+	if not isinstance(key, str):
+		return key
+	if key == WILDCARD or key == RECURSIVE_WILDCARD:
+		return None
+	return tuple((k, _as_index(k)) for k in dict.fromkeys(key[1:-1].split("|")))
+
+
+def select_keys(selector: Any, node: dict | list) -> List[Any]:
+	"""
+	Return the keys of the children of node that the selector of a wildcard
+	key selects, in order. List keys are non-negative ints.
+	"""
+	if selector is None:
+		return list(node) if isinstance(node, dict) else list(range(len(node)))
+	if isinstance(selector, tuple):
+		if isinstance(node, dict):
+			return [k for k, _ in selector if k in node]
+		indices = (i + len(node) if i < 0 else i for _, i in selector if i is not None and -len(node) <= i < len(node))
+		return list(dict.fromkeys(indices))
+	if isinstance(selector, slice):
+		return list(range(len(node))[selector]) if isinstance(node, list) else []
+	keys = node if isinstance(node, dict) else range(len(node))
+	return [k for k in keys if selector.matches(node[k])]
+
+
+def split_keys(keys: tuple, raw=False) -> tuple[tuple, tuple[int, ...]]:
+	"""
+	Remove empty strings from keys, and find the positions of the wildcards:
+	"*", "**", alternatives like "[a|b]", slices and where() predicates. Raw
+	paths have no wildcards.
+	"""
+	keys = tuple(k for k in keys if k != "")
+	if raw:
+		return keys, ()
+	return keys, tuple(i for i, k in enumerate(keys) if _is_selector(k))
+
+
+def _as_index(key: Any) -> int | None:
+	try:
+		return int(key)
+	except (ValueError, TypeError):
+		return None
+
+
+def _list_get(current: list, key: Any, index: int | None) -> Any:
+	if index is None:
+		raise KeyError(f"PathDict: invalid path ({key} not in {current})")
+	try:
+		return current[index]
+	except IndexError as e:
+		raise KeyError(f"PathDict: invalid path ({key} not in {current})") from e
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def _compile_cached(keys: tuple, raw: bool) -> CompiledPath:
+	return CompiledPath(keys, raw)
+
+
+def compile_path(keys: tuple, raw=False) -> CompiledPath:
+	"""
+	Return the CompiledPath for the given keys. Compiled paths are kept in a
+	bounded LRU cache, so frequently used paths are only compiled once.
+	"""
+	try:
+		return _compile_cached(keys, raw)
+	except TypeError:
+		# Paths with unhashable keys cannot be cached
+		return CompiledPath(keys, raw)
 
 
 class Path:
-	path: list[str]
+	compiled: CompiledPath
 	raw: bool
 
 	def __init__(self, *path, raw=False):
@@ -15,32 +249,34 @@ class Path:
 
 		if len(path) == 1 and isinstance(path[0], list):
 			# If the path is a list, then we are good to go
-			self.path = path[0]
-		else:
-			self.path = list(path)
+			path = tuple(path[0])
 
-		# Clean up empty strings
-		self.path = [x for x in self.path if x != ""]
+		# Empty strings are cleaned up by the compiled path
+		self.compiled = compile_path(path, raw)
 
 	def __repr__(self) -> str:
 		return f"Path(path={self.path}, raw={self.raw})"
 
+	@property
+	def path(self) -> list:
+		return list(self.compiled.keys)
+
 	@property
 	def has_wildcards(self):
-		return "*" in self.path
+		return self.compiled.has_wildcards
 
 	def __iter__(self):
 		"""Iterate over path keys using a for in loop"""
-		return iter(self.path)
+		return iter(self.compiled.keys)
 
 	def __len__(self):
-		return len(self.path)
+		return len(self.compiled.keys)
 
 	def __getitem__(self, key):
-		return self.path[key]
+		return self.compiled.keys[key]
 
 	def copy(self, replace_path=None, replace_raw=None) -> Path:
-		path_copy = list(self.path) if replace_path is None else replace_path
+		path_copy = self.path if replace_path is None else replace_path
 		raw_copy = self.raw if replace_raw is None else replace_raw
 		return Path(path_copy, raw=raw_copy)
 
@@ -50,17 +286,8 @@ class Path:
 		"""
 		if not self.has_wildcards:
 			return [self]
+		return [Path(list(p), raw=self.raw) for p, _ in traversal.iter_values(ref, self.compiled, with_paths=True)]
 
-		paths = [[]]
-		for key in self.path:
-			if key != "*":
-				# Extend all paths by the key if it is not "*"
-				paths = [path + [key] for path in paths]
-			else:
-				# If key is "*", expand all paths by all keys at the respective path
-				paths = [p + [k] for p in paths for k in get_nested_keys_or_indices(ref, p)]
 
-		# Return empty list if no paths were found
-		if paths == [[]]:
-			return []
-		return [Path(p, raw=self.raw) for p in paths]
+# Import traversal at the end of the file to avoid circular imports
+from . import traversal
@@ -1,41 +1,130 @@
 from __future__ import annotations
 
 import copy
+import functools
 import json
-from typing import Any, Callable, Union
+import operator
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Iterator, Union
 
-from . import utils
-from .path import Path
+from . import aggregate, arrays, batch, diff, parallel, serialize, stream, transaction, traversal, utils
+from .index import Index, compile_fields
+from .journal import Journal
+from .path import CompiledPath, Path, compile_path, split_keys
+from .snapshot import CopyOnWrite
 
 
 class PathDict:
 	root_data: dict | list | Any
 	data: dict | list | Any
 	path_handle: Path
+	indexes: list[Index]
+	journals: list[Journal]
+	transactions: list[transaction.Transaction]
+	copy_on_write: bool
 
-	def __init__(self, data: dict | list, raw=False, path: Path = None):
+	def __new__(cls, *args, threadsafe=False, **kwargs):
+		if threadsafe and cls is PathDict:
+			cls = ThreadSafePathDict
+		return super().__new__(cls)
+
+	def __init__(self, data: dict | list, raw=False, path: Path = None, copy_on_write=False, threadsafe=False):
 		"""
 		A PathDict always refers to a dict or list.
 		It is used to get data or perform operations at a given path.
 		When initialized, the current path is the root path.
+
+		If copy_on_write is True, writes never mutate the data in place.
+		Instead, only the containers along the written path are copied, and
+		the handle refers to the new data afterwards. See snapshot().
+
+		If threadsafe is True, the PathDict can be shared across threads.
+		at() then returns a new handle instead of moving this one, and all
+		operations hold a reader-writer lock that is striped over the
+		top-level keys. See ThreadSafePathDict.
 		"""
 		if not isinstance(data, (dict, list)):
-			raise TypeError(f"PathDict init: data must be dict or list but is {type(data)} " f"({data})")
+			raise TypeError(f"PathDict init: data must be dict or list but is {type(data)} ({data})")
+		if threadsafe and copy_on_write:
+			raise ValueError("PathDict init: copy_on_write and threadsafe cannot be combined")
 		self.data = data
 		self.path_handle = Path([], raw=raw) if path is None else path
+		self.indexes = []
+		self.journals = []
+		self.transactions = []
+		self.copy_on_write = copy_on_write
 
 	@classmethod
-	def from_data_and_path(cls, data: dict | list, path: Path) -> PathDict:
+	def from_data_and_path(cls, data: dict | list, path: Path, copy_on_write=False) -> PathDict:
 		"""
 		Alternative constructor for PathDict.
 		A PathDict always refers to a dict or list.
 		It is used to get data or perform operations at a given path.
 		When initialized, the current path is the root path.
 		"""
-		return cls(data=data, path=path)
+		return cls(data=data, path=path, copy_on_write=copy_on_write)
+
+	@classmethod
+	def load(cls, fp: IO, lazy=False) -> PathDict | Iterator[tuple[Any, Any]]:
+		"""
+		Load the JSON document in the text or binary file fp into a PathDict.
+
+		If lazy is True, return an iterator over (key, value) of the top-level
+		children instead, which parses the document incrementally and only
+		holds one child at a time. See iter_load.
+		"""
+		if lazy:
+			return stream.iter_children(fp)
+		return cls(json.load(fp))
+
+	@staticmethod
+	def iter_load(fp: IO, path: Any = ("*",), raw=False) -> Iterator[tuple[tuple, Any]]:
+		"""
+		Parse the JSON document in the text or binary file fp incrementally,
+		and yield (path, value) for every value that matches path, which may
+		contain wildcards. Everything else is skipped without being decoded,
+		so memory use is bounded by the largest matching value.
+
+		Example:
+		>>> with open("users.json") as f:
+		>>> 	for path, name in pd.iter_load(f, ("*", "name")):
+		>>> 		...
+		"""
+		return stream.iter_load(fp, path, raw)
 
 	def __repr__(self) -> str:
-		return f"PathDict({json.dumps(self.data, indent=4, sort_keys=True)}, {self.path_handle = })"
+		# Bounded, so logging a large PathDict does not encode all of its data
+		return f"PathDict({serialize.bounded_json(self.data)}, {self.path_handle = })"
+
+	############################################################################
+	# Serialization
+	############################################################################
+
+	def dumps(self, format="json") -> str | bytes:
+		"""
+		Encode the value at the current path. "json" uses orjson if it is
+		installed and returns a str, "msgpack" requires msgpack and returns
+		bytes. More formats can be added with serialize.register_encoder.
+		"""
+		return serialize.dumps(self.get(), format)
+
+	def dump(self, fp: IO, format="json") -> None:
+		"""
+		Encode the value at the current path into the file fp, one top-level
+		child at a time, so the whole encoded value is never held in memory.
+		Text formats can be written to text or binary files.
+		"""
+		serialize.dump(self.get(), fp, format)
+
+	def dump_at(self, path, fp: IO = None, format="json") -> str | bytes | None:
+		"""
+		Encode the value at the given path (like in [path]). Write it to fp
+		if it is given, otherwise return it like dumps.
+		"""
+		value = self[path]
+		if fp is None:
+			return serialize.dumps(value, format)
+		serialize.dump(value, fp, format)
 
 	def deepcopy(self, from_root=False, true_deepcopy=False) -> PathDict:
 		"""
@@ -67,6 +156,29 @@ class PathDict:
 		data_copy = copy.copy(self.data if from_root else self.get())
 		return PathDict.from_data_and_path(data_copy, path)
 
+	def snapshot(self) -> PathDict:
+		"""
+		Return a copy-on-write handle on the data at the same path, in O(1).
+
+		The snapshot shares all data with this handle. Writes through the
+		snapshot copy only the containers along the written path, so they
+		never affect this handle or other snapshots. Beware: writes made in
+		place through other handles are visible in all subtrees that the
+		snapshot still shares with them.
+		"""
+		return PathDict.from_data_and_path(self.data, self.path_handle, copy_on_write=True)
+
+	def with_set(self, path, value) -> PathDict:
+		"""
+		Return a copy-on-write handle on a version of the data in which the
+		value at the given path (like in [path]) is set to value. This
+		handle is not changed, and only the containers along the path are
+		copied.
+		"""
+		snapshot = self.snapshot()
+		snapshot[path] = value
+		return snapshot
+
 	############################################################################
 	# Moving the handle
 	############################################################################
@@ -83,7 +195,11 @@ class PathDict:
 		>>> pd(d).at("a", "b", "c").get() # -> 1
 
 		The path can also contain wildcards (*) to select everything at a given
-		level, and [a|b|c] to select multiple keys at a given level.
+		level, recursive wildcards (**) to select everything at any depth,
+		[a|b|c] to select multiple keys at a given level, slices like
+		slice(0, 10) to select list items, and where(f) to select the children
+		for which f(child) is True.
+		>>> pd(d).at("**", "c").gather() # -> [1]
 		In this case, the result is a MultiPathDict, which can perform
 		operations on all the selected elements at once.
 
@@ -96,7 +212,7 @@ class PathDict:
 		self.path_handle = Path(*path, raw=raw)
 
 		if self.path_handle.has_wildcards:
-			return MultiPathDict(self.data, self.path_handle)
+			return MultiPathDict(self.data, self.path_handle, handle=self)
 		return self
 
 	def at_root(self) -> PathDict:
@@ -146,21 +262,47 @@ class PathDict:
 		>>> pd(d).at("a", "b", "c", "0").get()  # -> 1 (Valid path)
 
 		Shorthand syntax:
-		>>> pd(d).at("a", "b", "c")[:]
-		You can use [:] to get the value at the current path.
-		Beware: using the subscript [...] will move the handle back to the root
-		of the data.
+		>>> pd(d)["a", "b", "c"]    # -> [1]
+		Subscripts [...] are always relative to the root of the data, and do
+		not move the handle.
 
 		:param default: The default value to return if the path is valid but
 		does not exist.
 		"""
-		# Iterate over the path to safely get the value
-		current = self.data
-		for key in self.path_handle:
-			current = utils.guarded_get(current, key)
-			if current is None:
-				return default
-		return current
+		return self.path_handle.compiled.get(self.data, default)
+
+	def get_many(self, paths, default=None) -> list:
+		"""
+		Get many values at once, like [path] for every path in paths, and
+		return them in the same order. The paths are grouped by their common
+		prefixes, so every shared prefix is only descended once.
+
+		Example:
+		>>> pd(d).get_many([("users", "1", "name"), ("users", "1", "age"), "meta"])
+		"""
+		paths = [self._split(path) for path in paths]
+		plain = [i for i, (_, wildcards) in enumerate(paths) if not wildcards]
+		values = batch.get_many(self.data, [paths[i][0] for i in plain], default)
+		res = [None] * len(paths)
+		for i, value in zip(plain, values):
+			res[i] = value
+		for i, (keys, wildcards) in enumerate(paths):
+			if wildcards:
+				res[i] = MultiPathDict(self.data, Path(*keys, raw=self.path_handle.raw), handle=self).gather()
+		return res
+
+	def _split(self, path) -> tuple[tuple, tuple[int, ...]]:
+		"""
+		Split a path given like in [path] into its keys and wildcard positions,
+		without compiling it, since batches mostly contain one-off paths.
+		"""
+		if isinstance(path, tuple):
+			keys = path
+		elif isinstance(path, list):
+			keys = tuple(path)
+		else:
+			keys = (path,)
+		return split_keys(keys, self.path_handle.raw)
 
 	############################################################################
 	# Setters
@@ -168,42 +310,110 @@ class PathDict:
 	############################################################################
 
 	def set(self, value) -> PathDict:
+		return self._set_at(self.path_handle.compiled, value)
+
+	def _set_at(self, compiled: CompiledPath, value) -> PathDict:
 		# Setting nothing is a no-op
 		if value is None:
 			return self
 
-		# If handle is at root, replace the whole data
-		if len(self.path_handle) == 0:
-			if isinstance(self.data, dict) and isinstance(value, dict):
-				self.data.clear()
-				self.data.update(value)
-				return self
-			if isinstance(self.data, list) and isinstance(value, list):
-				self.data.clear()
-				self.data.extend(value)
-				return self
-			raise TypeError(
-				"PathDict set: At the root level, you can only set dict dict or"
-				f"list to a list (tried to set a {type(self.data)} to a "
-				f"{type(value)})."
-			)
-
-		# Iterate over all keys except the last one
-		current = self.data
-		for key in self.path_handle[:-1]:
-			current = utils.guarded_descent(current, key)
-
-		key = self.path_handle[-1]
-		if isinstance(current, dict):
-			current[key] = value
-		elif isinstance(current, list):
-			try:
-				current[int(key)] = value
-			except (ValueError, IndexError, TypeError) as e:
-				raise KeyError(f"PathDict set: invalid path {self.path_handle}") from e
+		# If the path is the root, replace the whole data
+		if len(compiled) == 0:
+			return self._set_root(value)
+
+		self._changing(compiled.keys)
+		if self.copy_on_write:
+			writer = CopyOnWrite(self.data)
+			writer.set(compiled.keys, value)
+			self.data = writer.root
+		else:
+			# Descend along the compiled path, creating missing dicts on the way
+			compiled.set(self.data, value)
+		self._changed(compiled.keys)
+		return self
+
+	def _set_root(self, value) -> PathDict:
+		if self.copy_on_write and type(self.data) is type(value):
+			self._changing(())
+			self.data = value
+			self._changed(())
+			return self
+		if isinstance(self.data, dict) and isinstance(value, dict):
+			self._changing(())
+			self.data.clear()
+			self.data.update(value)
+			self._changed(())
+			return self
+		if isinstance(self.data, list) and isinstance(value, list):
+			self._changing(())
+			self.data.clear()
+			self.data.extend(value)
+			self._changed(())
+			return self
+		raise TypeError(
+			"PathDict set: At the root level, you can only set dict dict or"
+			f"list to a list (tried to set a {type(self.data)} to a "
+			f"{type(value)})."
+		)
+
+	def set_many(self, items: dict) -> PathDict:
+		"""
+		Set many values at once, like [path] = value for every path and value
+		in items. The result is the same as setting them one by one, but the
+		paths are grouped by their common prefixes, so every shared prefix is
+		only descended once.
 
+		Example:
+		>>> pd(d).set_many({("users", "1", "name"): "Joe", ("users", "1", "age"): 22})
+		"""
+		pending = []
+		for path, value in items.items():
+			# Setting nothing is a no-op
+			if value is None:
+				continue
+			keys, wildcards = self._split(path)
+			if len(keys) > 0 and not wildcards:
+				pending.append((keys, value))
+				continue
+			# Keep the order of writes by flushing the pending writes first
+			self._set_batch(pending)
+			pending = []
+			if len(keys) == 0:
+				self._set_root(value)
+			else:
+				MultiPathDict(self.data, Path(*keys, raw=self.path_handle.raw), handle=self).set(value)
+		self._set_batch(pending)
 		return self
 
+	def _set_batch(self, items: list[tuple[tuple, Any]]):
+		if len(items) == 0:
+			return
+		for keys, _ in items:
+			self._changing(keys)
+		if self.copy_on_write:
+			writer = CopyOnWrite(self.data)
+			for keys, value in items:
+				writer.set(keys, value)
+			self.data = writer.root
+		else:
+			batch.set_many(self.data, items)
+		if self.indexes or self.journals:
+			for keys, _ in items:
+				self._changed(keys)
+
+	def map_many(self, items: dict) -> PathDict:
+		"""
+		Like [path] = f for every path and function f in items, with shared
+		prefixes descended only once. All functions receive the values from
+		before the call. Wildcard paths are not supported, use
+		at(path).map(f) instead.
+		"""
+		paths = list(items)
+		if any(self._split(path)[1] for path in paths):
+			raise ValueError("PathDict map_many: wildcard paths are not supported")
+		values = self.get_many(paths)
+		return self.set_many({path: items[path](value) for path, value in zip(paths, values)})
+
 	def map(self, f: Callable) -> PathDict:
 		"""
 		Map the result of f to the value at path previously set by ".at(path)".
@@ -217,7 +427,12 @@ class PathDict:
 		"""
 		Makes a fast deepcopy of your root data, moves the handle to the previously
 		set path, applies map with f at that path, and returns the handle.
+
+		On a copy-on-write handle, only the containers along the path are
+		copied instead.
 		"""
+		if self.copy_on_write:
+			return self.snapshot().map(f)
 		current_handle = self.path_handle
 		return self.deepcopy(from_root=True).at(current_handle.path).map(f)
 
@@ -242,21 +457,42 @@ class PathDict:
 		"""
 		Shortcut for:
 		>>> copy().filter(f)
+
+		On a copy-on-write handle, return a new copy-on-write handle at the
+		current path instead, in which only the containers along the path are
+		copied.
 		"""
+		if self.copy_on_write:
+			return self.snapshot().filter(f)
 		return self.copy().filter(f)
 
 	############################################################################
 	# Reduce
 	############################################################################
 
-	def reduce(self, f: Callable, aggregate=None) -> Any:
+	def reduce(self, f: Callable, aggregate=None, combine: Callable = None, workers: int = None, executor=None) -> Any:
 		"""
 		Reduce a value starting with init at the given path.
 		If at the selected path is a dict, the function f will be called with
 		(key, value, aggregate) as arguments.
 		If at the selected path is a list, the function f will be called with
 		(value, aggregate) as arguments.
-		"""
+
+		If workers or an executor from concurrent.futures are given, the
+		children are split into shards that are reduced in parallel, each
+		starting with a copy of aggregate. The partial results are then
+		combined in order with combine(a, b). This requires f to be
+		associative and aggregate to be its identity, like 0 for a sum.
+		Without an executor, a ProcessPoolExecutor with the given number of
+		workers is used, so f and combine must be picklable.
+		"""
+		if workers is not None or executor is not None:
+			if combine is None:
+				raise ValueError("PathDict reduce: combine is required to reduce in parallel")
+			container, items = self._children("reduce")
+			is_dict = isinstance(container, dict)
+			items = items if is_dict else container
+			return parallel.reduce_shards(parallel.fold, items, (f, aggregate, is_dict), combine, workers, executor)
 
 		agg = aggregate
 		get_at_current = self.get()
@@ -270,32 +506,371 @@ class PathDict:
 			return agg
 		raise TypeError("PathDict reduce: must be applied to a dict or list")
 
+	############################################################################
+	# Grouping
+	############################################################################
+
+	def _children(self, method: str) -> tuple[dict | list, Any]:
+		get_at_current = self.get()
+		if isinstance(get_at_current, dict):
+			return get_at_current, get_at_current.items()
+		if isinstance(get_at_current, list):
+			return get_at_current, enumerate(get_at_current)
+		raise TypeError(f"PathDict {method}: must be applied to a dict or list")
+
+	def group_by(self, *fields, workers: int = None, executor=None) -> dict:
+		"""
+		Group the children at the current path by the value of the given
+		relative field path, in a single pass. Pass several fields to group
+		by tuples of values. A field is a key, or a list of keys for a nested
+		field.
+
+		For a dict, each group is a dict {key: child}, for a list, each group
+		is a list of children. Pass workers or an executor to group the
+		children in shards in parallel, like in reduce.
+
+		Example:
+		>>> tasks = pd({"t1": {"owner": "u1"}, "t2": {"owner": "u2"}, "t3": {"owner": "u1"}})
+		>>> tasks.group_by("owner")  # -> {"u1": {"t1": {...}, "t3": {...}}, "u2": {"t2": {...}}}
+		"""
+		container, items = self._children("group_by")
+		args = (fields, isinstance(container, dict))
+		return parallel.reduce_shards(aggregate.group_by, items, args, aggregate.combine_groups, workers, executor)
+
+	def count_by(self, *fields, workers: int = None, executor=None) -> dict:
+		"""
+		Count the children at the current path per value of the given relative
+		field paths, in a single pass. Pass workers or an executor to count
+		the children in shards in parallel, like in reduce.
+
+		Example:
+		>>> tasks.count_by("owner", "status")  # -> {("u1", "open"): 2, ("u2", "done"): 1}
+		"""
+		container, _ = self._children("count_by")
+		children = container.values() if isinstance(container, dict) else container
+		return parallel.reduce_shards(
+			aggregate.count_by, children, (fields,), aggregate.combine_counts, workers, executor
+		)
+
+	def aggregate_by(self, field, aggregations: dict, workers: int = None, executor=None) -> dict:
+		"""
+		Group the children at the current path by the value of field, and
+		aggregate other fields of each group in a single pass.
+		aggregations maps a field to "sum", "min", "max", "mean" or "count".
+		Missing values are ignored. Pass workers or an executor to aggregate
+		the children in shards in parallel, like in reduce.
+
+		Example:
+		>>> orders.aggregate_by("customer", {"amount": "sum", ("meta", "items"): "max"})
+		>>> # -> {"c1": {"amount": 30, ("meta", "items"): 4}, ...}
+		"""
+		container, _ = self._children("aggregate_by")
+		children = container.values() if isinstance(container, dict) else container
+		combine = functools.partial(aggregate.combine_states, aggregations)
+		args = (field, aggregations)
+		states = parallel.reduce_shards(aggregate.aggregate_states, children, args, combine, workers, executor)
+		return aggregate.finalize_states(states, aggregations)
+
 	############################################################################
 	#### Useful Shorthands
 	############################################################################
 
-	def sum(self) -> Any:
+	def sum(self, workers: int = None, executor=None) -> Any:
 		"""
-		Sum the elements at the given path.
+		Sum the elements at the given path. If workers or an executor are
+		given, the elements are summed in shards in parallel, like in reduce.
 		"""
 		get_at_current = self.get()
 		if isinstance(get_at_current, dict):
-			return sum(v for k, v in get_at_current.items())
+			return parallel.reduce_shards(sum, get_at_current.values(), (), operator.add, workers, executor)
 		if isinstance(get_at_current, list):
-			return sum(get_at_current)
+			return parallel.reduce_shards(sum, get_at_current, (), operator.add, workers, executor)
 		raise TypeError("PathDict sum: must be applied to a dict or list")
 
+	def columns(self, fields: list, relative_to: Any = "*", dtype: Any = float, fill: Any = None) -> dict:
+		"""
+		Return {field: NumPy array} with the value of every field, relative to
+		every match of relative_to below the current path. A field is a key,
+		or a list of keys for a nested field (returned as a tuple key).
+		Missing values are replaced by fill, or raise a ValueError if fill is
+		None. Requires NumPy.
+
+		Example:
+		>>> pd(db).at("orders").columns(["amount", ["meta", "items"]])
+		>>> # -> {"amount": array([...]), ("meta", "items"): array([...])}
+		"""
+		relative = tuple(relative_to) if isinstance(relative_to, (list, tuple)) else (relative_to,)
+		compiled = compile_path(self.path_handle.compiled.keys + relative, self.path_handle.raw)
+		rows = [row for _, row in traversal.iter_values(self.data, compiled)]
+		return arrays.columns(rows, fields, dtype, fill)
+
 	def append(self, value) -> PathDict:
 		"""
-		Append the value to the list at the given path.
+		Append the value to the list at the given path, in place.
+		If there is no list at the path yet, it is created.
 		"""
-		return self.map(lambda l: (l or []) + [value])
+		return self.extend((value,))
+
+	def extend(self, values) -> PathDict:
+		"""
+		Extend the list at the given path by all values, in place, with a
+		single descent. If there is no list at the path yet, it is created.
+		"""
+		values = list(values)
+		get_at_current = self.get()
+		if get_at_current is None:
+			return self.set(values)
+		if not isinstance(get_at_current, list):
+			raise TypeError("PathDict extend: must be applied to a list")
+		if self.copy_on_write:
+			return self.set(get_at_current + values)
+		self._changing(self.path_handle.compiled.keys, insert=True)
+		index = len(get_at_current)
+		get_at_current.extend(values)
+		self._changed(self.path_handle.compiled.keys, (index, len(values)))
+		return self
+
+	def insert(self, index: int, value) -> PathDict:
+		"""
+		Insert the value before index into the list at the given path, in
+		place. If there is no list at the path yet, it is created.
+		"""
+		get_at_current = self.get()
+		if get_at_current is None:
+			return self.set([value])
+		if not isinstance(get_at_current, list):
+			raise TypeError("PathDict insert: must be applied to a list")
+		if self.copy_on_write:
+			get_at_current = list(get_at_current)
+			get_at_current.insert(index, value)
+			return self.set(get_at_current)
+		self._changing(self.path_handle.compiled.keys, insert=True)
+		position = utils.insert_position(len(get_at_current), index)
+		get_at_current.insert(index, value)
+		self._changed(self.path_handle.compiled.keys, (position, 1))
+		return self
 
 	def update(self, value) -> PathDict:
 		"""
-		Update the dict at the given path with the given value.
+		Update the dict at the given path with the given value, in place.
+		If there is no dict at the path yet, it is created.
+		"""
+		get_at_current = self.get()
+		if get_at_current is None:
+			return self.set(dict(value))
+		if not isinstance(get_at_current, dict):
+			raise TypeError("PathDict update: must be applied to a dict")
+		if self.copy_on_write:
+			return self.set({**get_at_current, **value})
+		self._changing(self.path_handle.compiled.keys)
+		get_at_current.update(value)
+		self._changed(self.path_handle.compiled.keys)
+		return self
+
+	def merge(self, value, strategy="replace") -> PathDict:
+		"""
+		Recursively merge value into the dict or list at the given path, in
+		place. Nested dicts are merged key by key, and nested lists are merged
+		according to strategy:
+		- "replace": The list in value replaces the existing list
+		- "append": The items of the list in value are appended
+		- "union": Only the items that are not in the existing list yet are appended
+
+		Untouched subtrees are not copied. If there is nothing at the path yet,
+		a copy of value is set.
+
+		Example:
+		>>> p = pd({"a": {"b": 1, "l": [1, 2]}})
+		>>> p.merge({"a": {"c": 2, "l": [2, 3]}}, strategy="union").get()
+		>>> # -> {"a": {"b": 1, "c": 2, "l": [1, 2, 3]}}
+		"""
+		if strategy not in utils.MERGE_STRATEGIES:
+			raise ValueError(f"PathDict merge: strategy must be one of {utils.MERGE_STRATEGIES}, not {strategy}")
+		get_at_current = self.get()
+		if get_at_current is None:
+			return self.set(utils.fast_deepcopy(value))
+		if not (isinstance(get_at_current, dict) and isinstance(value, dict)) and not (
+			isinstance(get_at_current, list) and isinstance(value, list)
+		):
+			raise TypeError(f"PathDict merge: cannot merge {type(value)} into {type(get_at_current)}")
+		if self.copy_on_write:
+			return self.set(utils.deep_merge(get_at_current, value, strategy, in_place=False))
+		self._changing(self.path_handle.compiled.keys)
+		res = utils.deep_merge(get_at_current, value, strategy)
+		if res is not get_at_current:
+			# Lists are replaced by the "replace" strategy
+			return self.set(res)
+		self._changed(self.path_handle.compiled.keys)
+		return self
+
+	############################################################################
+	#### Diff and patch
+	############################################################################
+
+	def diff(self, other) -> list[diff.Op]:
+		"""
+		Return the operations that turn the value at the current path into
+		other (a PathDict or a value), as a list of Op(op, path, value) with
+		paths relative to the current path. op is "set", "delete" (a dict
+		key), "insert" or "remove" (a list item). Subtrees that are the same
+		object in both are skipped.
+
+		Example:
+		>>> pd({"a": 1, "l": [1, 2]}).diff({"l": [1, 3, 2]})
+		>>> # -> [Op("delete", ("a",)), Op("insert", ("l", 1), 3)]
+		"""
+		if isinstance(other, PathDict):
+			other = other.get()
+		return diff.diff(self.get(), other)
+
+	def patch(self, ops) -> PathDict:
+		"""
+		Apply the operations returned by diff at the current path, in order.
+		Consecutive set operations are applied together like set_many, so
+		shared prefixes are only descended once.
+		"""
+		base = self.path_handle.compiled.keys
+		pending = []
+		for op, path, value in ops:
+			keys = base + tuple(path)
+			if op == "set" and len(keys) > 0:
+				pending.append((keys, value))
+				continue
+			self._set_batch(pending)
+			pending = []
+			if op == "set":
+				self._set_root(value)
+			elif op in diff.OPS and len(keys) > 0:
+				self._patch_container(op, keys, value)
+			else:
+				raise ValueError(f"PathDict patch: invalid operation {op} at path {keys}")
+		self._set_batch(pending)
+		return self
+
+	def _patch_container(self, op: str, keys: tuple, value: Any):
+		# Deleting a dict key changes the key, the other operations the whole list
+		changed = keys if op == "delete" else keys[:-1]
+		self._changing(changed)
+		if self.copy_on_write:
+			writer = CopyOnWrite(self.data)
+			diff.apply_op(writer.descend(keys[:-1]), op, keys[-1], value)
+			self.data = writer.root
+		else:
+			diff.apply_op(compile_path(keys[:-1], raw=True).get(self.data), op, keys[-1], value)
+		self._changed(changed)
+
+	############################################################################
+	#### Indexes
+	############################################################################
+
+	def create_index(self, *fields) -> Index:
+		"""
+		Create a hash index on the children of the dict or list at the current
+		path, keyed by the value at the given relative field path of each
+		child. Pass several fields for a composite index, which is keyed by
+		tuples of values. A field is a key, or a list of keys for a nested
+		field.
+
+		Writes made through this handle keep the index up to date.
+
+		Example:
+		>>> tasks = pd({"t1": {"owner": "u1", "status": "open"}, "t2": {"owner": "u2", "status": "done"}})
+		>>> tasks.create_index("owner").lookup("u1")  # -> ["t1"]
+		>>> tasks.create_index("owner", "status").lookup(("u2", "done"))  # -> ["t2"]
 		"""
-		return self.map(lambda d: {**d, **value})
+		index = Index(self.path_handle.compiled.keys, compile_fields(fields))
+		index.rebuild(self.get())
+		self.indexes.append(index)
+		return index
+
+	def _changed(self, keys: tuple, inserted: tuple[int, int] | None = None):
+		"""
+		Update the indexes and journals after the value at the absolute path
+		keys changed. If only items were inserted into the list at keys,
+		inserted is their (index, count).
+		"""
+		for index in self.indexes:
+			index.changed(self.data, keys)
+		for journal in self.journals:
+			if inserted is None:
+				journal.after(self.data, keys)
+			else:
+				journal.inserted(self.data, keys, *inserted)
+
+	############################################################################
+	#### Change journal
+	############################################################################
+
+	def journal(self, coalesce=False) -> Journal:
+		"""
+		Start recording the changes made through this handle, and return the
+		Journal they are recorded in. Every change is recorded with its
+		absolute path, and copies of the old and new value, or of only the
+		inserted items for appends and inserts into lists. Use
+		journal.dirty_paths() and journal.drain_changes() to read them.
+
+		If coalesce is True, repeated writes to the same path are collapsed
+		into one change.
+
+		Example:
+		>>> p = pd({"a": {"b": 1}})
+		>>> journal = p.journal()
+		>>> p["a", "b"] = 2
+		>>> journal.drain_changes()  # -> [Change(path=("a", "b"), old=1, new=2)]
+		"""
+		journal = Journal(coalesce)
+		self.journals.append(journal)
+		return journal
+
+	def _changing(self, keys: tuple, insert=False):
+		"""
+		Let the journals and transactions copy the value at the absolute path
+		keys before it changes. If insert is True, items are only inserted
+		into the list at keys, and the journals copy them afterwards.
+		"""
+		if not insert:
+			for journal in self.journals:
+				journal.before(self.data, keys)
+		for t in self.transactions:
+			t.before(self.data, keys)
+
+	############################################################################
+	#### Transactions
+	############################################################################
+
+	@contextmanager
+	def transaction(self):
+		"""
+		Make all writes in the block through this handle all-or-nothing. If
+		the block raises, every value that was written is restored and the
+		exception is re-raised. Only the old values of the touched paths are
+		copied, not the whole data. Transactions can be nested.
+
+		Example:
+		>>> with p.transaction():
+		... 	p["users", "1", "balance"] -= 10
+		... 	p["users", "2", "balance"] += 10
+		"""
+		t = transaction.Transaction(self.data if self.copy_on_write else None)
+		self.transactions.append(t)
+		try:
+			yield self
+		except BaseException:
+			self.transactions.remove(t)
+			self._rollback(t)
+			raise
+		self.transactions.remove(t)
+
+	def _rollback(self, t: transaction.Transaction):
+		if t.root is not None:
+			self._changing(())
+			self.data = t.root
+			self._changed(())
+			return
+		for keys, old in reversed(t.undo):
+			self._changing(keys)
+			transaction.restore(self.data, keys, old)
+			self._changed(keys)
 
 	############################################################################
 	#### Standard dict methods
@@ -311,29 +886,49 @@ class PathDict:
 		return self.get().items()
 
 	def pop(self, key, default=None):
-		return self.get().pop(key, default)
+		if self.copy_on_write and key not in self.get():
+			return default
+		self._changing(self.path_handle.compiled.keys + (key,))
+		if self.copy_on_write:
+			writer = CopyOnWrite(self.data)
+			res = writer.descend(self.path_handle.compiled.keys).pop(key)
+			self.data = writer.root
+		else:
+			res = self.get().pop(key, default)
+		self._changed(self.path_handle.compiled.keys + (key,))
+		return res
 
 	def __len__(self):
 		return len(self.get())
 
+	# Subscripts never move the handle, so they are independent of its path
+
+	def _item_path(self, path) -> CompiledPath:
+		if isinstance(path, tuple):
+			return compile_path(path, self.path_handle.raw)
+		if isinstance(path, list):
+			return compile_path(tuple(path), self.path_handle.raw)
+		return compile_path((path,), self.path_handle.raw)
+
 	def __getitem__(self, path):
-		at = self.at(*path) if isinstance(path, tuple) else self.at(path)
-		if isinstance(at, MultiPathDict):
-			return at.gather()
-		res = at.get()
-		self.at_root()
-		return res
+		compiled = self._item_path(path)
+		if compiled.has_wildcards:
+			return MultiPathDict(self.data, Path(*compiled.keys, raw=compiled.raw), handle=self).gather()
+		return compiled.get(self.data)
 
 	def __setitem__(self, path, value):
-		at = self.at(*path) if isinstance(path, tuple) else self.at(path)
-		at.map(value) if callable(value) else at.set(value)
-		self.at_root()
-
-	def __contains__(self, *path):
+		compiled = self._item_path(path)
+		if compiled.has_wildcards:
+			at = MultiPathDict(self.data, Path(*compiled.keys, raw=compiled.raw), handle=self)
+			at.map(value) if callable(value) else at.set(value)
+		elif callable(value):
+			self._set_at(compiled, value(compiled.get(self.data)))
+		else:
+			self._set_at(compiled, value)
+
+	def __contains__(self, path):
 		try:
-			contains = self.at(*path).get() is not None
-			self.at_root()
-			return contains
+			return self[path] is not None
 		except KeyError:
 			return False
 
@@ -343,3 +938,4 @@ class PathDict:
 
 # Import MultiPathDict at the end of the file to avoid circular imports
 from .multi_path_dict import MultiPathDict
+from .threadsafe import ThreadSafePathDict
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import io
+import json
+import reprlib
+from typing import IO, Any, Callable, Dict, Iterator
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+# Maximum number of characters of the data in the repr of a PathDict
+REPR_MAX_CHARS = 10_000
+
+
+class Encoder:
+	"""
+	Base class of the encoders used by PathDict.dump and dumps.
+
+	encode(value) returns the encoded value as bytes. iter_encode(value)
+	yields the same bytes in chunks of one top-level child each, so a large
+	document can be written to a file without encoding it in one piece.
+	"""
+
+	# True if the encoded bytes are text that dumps returns as str
+	text = True
+
+	def encode(self, value: Any) -> bytes:
+		raise NotImplementedError
+
+	def iter_encode(self, value: Any) -> Iterator[bytes]:
+		yield self.encode(value)
+
+
+class JSONEncoder(Encoder):
+	"""
+	Compact JSON, encoded with orjson if it is installed, otherwise with the
+	standard library.
+	"""
+
+	def encode(self, value: Any) -> bytes:
+		if orjson is not None:
+			return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+		return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+	def iter_encode(self, value: Any) -> Iterator[bytes]:
+		if isinstance(value, dict):
+			yield b"{"
+			for i, (key, child) in enumerate(value.items()):
+				# Encode the key like the encoder does, by stripping the braces
+				member = self.encode({key: child})[1:-1]
+				yield b"," + member if i > 0 else member
+			yield b"}"
+		elif isinstance(value, (list, tuple)):
+			yield b"["
+			for i, child in enumerate(value):
+				yield b"," + self.encode(child) if i > 0 else self.encode(child)
+			yield b"]"
+		else:
+			yield self.encode(value)
+
+
+class MsgpackEncoder(Encoder):
+	"""
+	MessagePack, if msgpack is installed.
+	"""
+
+	text = False
+
+	def encode(self, value: Any) -> bytes:
+		if msgpack is None:
+			raise ImportError("PathDict dump: msgpack is required, install it with `pip install msgpack`")
+		return msgpack.packb(value, use_bin_type=True)
+
+	def iter_encode(self, value: Any) -> Iterator[bytes]:
+		if msgpack is None or not isinstance(value, (dict, list, tuple)):
+			yield self.encode(value)
+			return
+		packer = msgpack.Packer(use_bin_type=True)
+		if isinstance(value, dict):
+			yield packer.pack_map_header(len(value))
+			for key, child in value.items():
+				yield packer.pack(key) + packer.pack(child)
+		else:
+			yield packer.pack_array_header(len(value))
+			for child in value:
+				yield packer.pack(child)
+
+
+ENCODERS: Dict[str, Callable[[], Encoder]] = {
+	"json": JSONEncoder,
+	"msgpack": MsgpackEncoder,
+}
+
+
+def register_encoder(name: str, encoder: Callable[[], Encoder]) -> None:
+	"""
+	Register an Encoder class (or factory) under the format name, to be used
+	by dump(fp, format=name) and dumps(format=name).
+	"""
+	ENCODERS[name] = encoder
+
+
+def get_encoder(name: str) -> Encoder:
+	if name not in ENCODERS:
+		raise ValueError(f"PathDict dump: unknown format {name}, must be one of {list(ENCODERS)}")
+	return ENCODERS[name]()
+
+
+def dumps(value: Any, format: str) -> str | bytes:
+	"""
+	Encode the value, and return a str for text formats and bytes otherwise.
+	"""
+	encoder = get_encoder(format)
+	encoded = encoder.encode(value)
+	return encoded.decode() if encoder.text else encoded
+
+
+def dump(value: Any, fp: IO, format: str) -> None:
+	"""
+	Encode the value into the text or binary file fp chunk by chunk.
+	"""
+	encoder = get_encoder(format)
+	text = isinstance(fp, io.TextIOBase)
+	if text and not encoder.text:
+		raise TypeError(f"PathDict dump: format {format} must be written to a binary file")
+	for chunk in encoder.iter_encode(value):
+		fp.write(chunk.decode() if text else chunk)
+
+
+################################################################################
+# Bounded representations
+################################################################################
+
+
+def bounded_json(value: Any, max_chars=REPR_MAX_CHARS) -> str:
+	"""
+	Pretty-print value as JSON, but stop after max_chars characters. The JSON
+	is encoded lazily, so only the printed part of the value is visited.
+	Values that are not JSON serializable are shown with repr.
+	"""
+	encoder = json.JSONEncoder(indent=4, sort_keys=True, default=repr)
+	chunks = []
+	size = 0
+	for chunk in encoder.iterencode(value):
+		chunks.append(chunk)
+		size += len(chunk)
+		if size > max_chars:
+			return "".join(chunks)[:max_chars] + "..."
+	return "".join(chunks)
+
+
+_REPR = reprlib.Repr()
+_REPR.maxlevel = 4
+_REPR.maxdict = _REPR.maxlist = _REPR.maxtuple = _REPR.maxset = 50
+_REPR.maxstring = _REPR.maxother = 200
+
+
+def bounded_repr(value: Any) -> str:
+	"""
+	repr of value, abbreviated with ... beyond a fixed depth and number of
+	items, so it never visits the whole value.
+	"""
+	return _REPR.repr(value)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+from . import binary
+from .binary_path_dict import BinaryPathDict
+from .path import Path
+
+# Before Python 3.13, attaching registers the block with the resource tracker,
+# which unlinks it when the attaching process exits
+_UNTRACKED = sys.version_info < (3, 13) and os.name == "posix"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+	"""
+	Attach to an existing shared memory block, without letting the resource
+	tracker unlink it when the process exits.
+	"""
+	if sys.version_info >= (3, 13):
+		return shared_memory.SharedMemory(name, track=False)
+	shm = shared_memory.SharedMemory(name)
+	if _UNTRACKED:
+		resource_tracker.unregister(shm._name, "shared_memory")
+	return shm
+
+
+class SharedPathDict(BinaryPathDict):
+	"""
+	A read-only PathDict over a binary document (see binary.py) in a
+	multiprocessing.shared_memory block. The data is serialized once with
+	create, and every process attaches to the block by name without copying
+	it. Scalars are read directly from the block, and containers are only
+	decoded when they are returned.
+
+	A SharedPathDict can be pickled, for example as an argument of a process
+	pool task, and is attached to the same block in the worker.
+	"""
+
+	name: str
+
+	def __init__(self, name: str, raw=False, _shm: shared_memory.SharedMemory | None = None):
+		self.name = name
+		self.path_handle = Path([], raw=raw)
+		self._owner = _shm is not None
+		self._shm = _attach(name) if _shm is None else _shm
+		self._attach(binary.View(self._shm.buf))
+
+	@classmethod
+	def create(cls, data: dict | list, name: str | None = None, raw=False) -> SharedPathDict:
+		"""
+		Serialize data into a new shared memory block, and attach to it. The
+		returned SharedPathDict owns the block, and unlinks it when it is used
+		as a context manager, or when unlink is called.
+		"""
+		if not isinstance(data, (dict, list)):
+			raise TypeError(f"SharedPathDict create: data must be dict or list but is {type(data)}")
+		encoded = binary.dumps(data)
+		shm = shared_memory.SharedMemory(name, create=True, size=len(encoded))
+		shm.buf[: len(encoded)] = encoded
+		return cls(shm.name, raw=raw, _shm=shm)
+
+	def close(self):
+		"""
+		Detach from the block. The block itself stays available.
+		"""
+		self.view = None
+		self._shm.close()
+
+	def unlink(self):
+		"""
+		Free the block. Processes that are attached can still read it until
+		they close it.
+		"""
+		if _UNTRACKED:
+			# Workers on the same resource tracker may have unregistered it
+			resource_tracker.register(self._shm._name, "shared_memory")
+		self._shm.unlink()
+		self._owner = False
+
+	def __enter__(self) -> SharedPathDict:
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+		if self._owner:
+			self.unlink()
+
+	def __reduce__(self):
+		return type(self), (self.name, self.path_handle.raw)
+
+	def __repr__(self) -> str:
+		return f"SharedPathDict({self.name!r}, {self.path_handle = })"
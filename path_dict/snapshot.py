@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from typing import Any
+
+from .path import _MISSING, _as_index, _list_get
+
+
+class CopyOnWrite:
+	"""
+	Applies writes to a copy of root without mutating root itself.
+
+	The root and every dict or list along a written path is shallow-copied
+	the first time a write goes through it. All other subtrees are shared
+	with the original root, so a write costs the size of the containers
+	along its path instead of the size of the whole document.
+	"""
+
+	root: dict | list
+	owned: set[int]
+
+	def __init__(self, root: dict | list):
+		self.root = root.copy()
+		# ids of the containers that were copied by this writer and may be mutated
+		self.owned = {id(self.root)}
+
+	def _own(self, value: Any) -> Any:
+		if isinstance(value, (dict, list)) and id(value) not in self.owned:
+			value = value.copy()
+			self.owned.add(id(value))
+		return value
+
+	def descend(self, keys: tuple) -> Any:
+		"""
+		Return the owned container at keys, creating missing dicts like
+		PathDict.set does.
+		"""
+		current = self.root
+		for key in keys:
+			if isinstance(current, dict):
+				child = current.get(key, _MISSING)
+				if child is _MISSING:
+					child = {}
+					self.owned.add(id(child))
+				else:
+					child = self._own(child)
+				current[key] = child
+			elif isinstance(current, list):
+				index = key if isinstance(key, int) else _as_index(key)
+				child = self._own(_list_get(current, key, index))
+				current[index] = child
+			else:
+				raise KeyError("Can't set the key of a non-dict")
+			current = child
+		return current
+
+	def set(self, keys: tuple, value: Any) -> None:
+		"""
+		Set value at the non-empty path keys.
+		"""
+		parent = self.descend(keys[:-1])
+		key = keys[-1]
+		if isinstance(parent, dict):
+			parent[key] = value
+		elif isinstance(parent, list):
+			index = key if isinstance(key, int) else _as_index(key)
+			if index is None:
+				raise KeyError(f"PathDict set: invalid path {keys}")
+			try:
+				parent[index] = value
+			except IndexError as e:
+				raise KeyError(f"PathDict set: invalid path {keys}") from e
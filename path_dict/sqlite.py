@@ -0,0 +1,682 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Tuple
+
+from . import traversal, utils
+from .path import CompiledPath, Path, _as_index, compile_path, select_keys
+from .path_dict import PathDict
+
+################################################################################
+# Schema
+#
+# Every dict, list and scalar is one row, keyed by its path. A path is stored
+# as the JSON encoded keys, each preceded by _SEP. JSON escapes control
+# characters in strings, so _SEP cannot occur inside a key, and the rows of
+# the subtree at path p are exactly p and the range [p + _SEP, p + _END).
+# Dict and list nodes store their children through the parent column, in the
+# order of ord. Lists store their length as the value, scalars their JSON.
+################################################################################
+
+_SEP = "\x1f"
+_END = "\x20"
+
+DICT, LIST, SCALAR = "dict", "list", "scalar"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+	path TEXT PRIMARY KEY,
+	parent TEXT,
+	key TEXT,
+	ord INTEGER,
+	kind TEXT NOT NULL,
+	value TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS nodes_children ON nodes (parent, ord);
+"""
+
+# A row as it is stored: (path, parent, key, ord, kind, value)
+Row = Tuple[str, Any, Any, int, str, Any]
+
+
+def _rows(path: str, parent: str | None, key: Any, ord: int, value: Any) -> Iterator[Row]:
+	"""
+	Yield the rows of value and all its children, if value is stored at path.
+	"""
+	stack = [(path, parent, key, ord, value)]
+	while stack:
+		path, parent, key, ord, value = stack.pop()
+		encoded_key = None if parent is None else json.dumps(key)
+		if isinstance(value, dict):
+			yield path, parent, encoded_key, ord, DICT, None
+			items = value.items()
+		elif isinstance(value, (list, tuple)):
+			yield path, parent, encoded_key, ord, LIST, str(len(value))
+			items = enumerate(value)
+		else:
+			yield path, parent, encoded_key, ord, SCALAR, json.dumps(value)
+			continue
+		for i, (k, v) in enumerate(items):
+			stack.append((path + _SEP + json.dumps(k), path, k, i, v))
+
+
+def _decode(rows: List[tuple], path: str) -> Any:
+	"""
+	Build the value at path from the rows (path, parent, key, ord, kind,
+	value) of its subtree.
+	"""
+	nodes = {}
+	for row_path, _, _, _, kind, value in rows:
+		nodes[row_path] = {} if kind == DICT else [] if kind == LIST else json.loads(value)
+	for row_path, parent, key, _, _, _ in sorted(rows, key=lambda row: row[3]):
+		if row_path == path:
+			continue
+		container = nodes[parent]
+		if isinstance(container, dict):
+			container[json.loads(key)] = nodes[row_path]
+		else:
+			container.append(nodes[row_path])
+	return nodes[path]
+
+
+class _Node:
+	"""
+	A stored node at a path, without its children.
+	"""
+
+	__slots__ = ("path", "kind", "value")
+
+	def __init__(self, path: str, kind: str, value: Any):
+		self.path = path
+		self.kind = kind
+		self.value = value
+
+	@property
+	def is_null(self) -> bool:
+		return self.kind == SCALAR and self.value == "null"
+
+
+class SQLitePathDict:
+	"""
+	A PathDict that stores its data in an SQLite file, with one row per dict,
+	list and scalar. Reads only load the rows of the requested subtree, and
+	wildcard paths are resolved with indexed queries for the children of
+	every matched node. Writes only touch the rows that changed, in a single
+	transaction per call, or per batch() block.
+
+	It has the API of PathDict, except for the methods that keep state in
+	memory (journals, indexes, transactions and snapshots), which raise an
+	AttributeError. Reductions like reduce and sum load the data at the
+	current path, and are not supported for wildcard paths.
+	"""
+
+	filename: str
+	path_handle: Path
+
+	def __init__(self, filename: str, raw=False):
+		self.filename = filename
+		self.path_handle = Path([], raw=raw)
+		# Transactions are managed by _transaction
+		self.connection = sqlite3.connect(filename, isolation_level=None)
+		self.connection.executescript(_SCHEMA)
+		self._depth = 0
+		if self._node("") is None:
+			with self._transaction():
+				self._insert(_rows("", None, None, 0, {}))
+
+	@classmethod
+	def create(cls, filename: str, data: dict | list, raw=False) -> SQLitePathDict:
+		"""
+		Open filename, and replace everything stored in it with data.
+		"""
+		if not isinstance(data, (dict, list)):
+			raise TypeError(f"SQLitePathDict create: data must be dict or list but is {type(data)}")
+		db = cls(filename, raw=raw)
+		with db._transaction():
+			db.connection.execute("DELETE FROM nodes")
+			db._insert(_rows("", None, None, 0, data))
+		return db
+
+	def close(self):
+		self.connection.close()
+
+	def __enter__(self) -> SQLitePathDict:
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __repr__(self) -> str:
+		return f"SQLitePathDict({self.filename!r}, {self.path_handle = })"
+
+	@contextmanager
+	def batch(self):
+		"""
+		Group all writes in the block into one transaction, which is rolled
+		back if the block raises.
+
+		Example:
+		>>> with db.batch():
+		... 	db["users", "1", "age"] = 23
+		... 	db["users", "2", "age"] = 25
+		"""
+		with self._transaction():
+			yield self
+
+	def deepcopy(self, from_root=False, true_deepcopy=False) -> PathDict:
+		"""
+		Load the data at the current path or from the root into a new
+		in-memory PathDict. The loaded data is always a deep copy.
+		"""
+		data = self._get(compile_path((), raw=True)) if from_root else self.get()
+		return PathDict.from_data_and_path(data, self.path_handle.copy(replace_path=[]))
+
+	def copy(self, from_root=False) -> PathDict:
+		return self.deepcopy(from_root)
+
+	############################################################################
+	# Moving the handle
+	############################################################################
+
+	def at(self, *path, raw=None) -> SQLitePathDict:
+		"""
+		Move the handle to the given path, like PathDict.at. Wildcard paths
+		can be read with gather, and written with set and map.
+		"""
+		raw = self.path_handle.raw if raw is None else raw
+		self.path_handle = Path(*path, raw=raw)
+		return self
+
+	def at_root(self) -> SQLitePathDict:
+		return self.at()
+
+	def at_parent(self) -> SQLitePathDict:
+		return self.at(self.path_handle.path[:-1])
+
+	def at_children(self) -> SQLitePathDict:
+		return self.at(self.path_handle.path + ["*"])
+
+	############################################################################
+	# Getters
+	############################################################################
+
+	def get(self, default=None) -> Any:
+		"""
+		Load and return the value at the current path, or default if the path
+		does not exist.
+		"""
+		value = self._get(self._concrete("get"))
+		return default if value is None else value
+
+	def gather(self, as_type="list", include_paths=False) -> dict | list:
+		"""
+		Load the values at all paths that match the current path, like
+		MultiPathDict.gather.
+		"""
+		if as_type not in ["list", "dict"]:
+			raise ValueError("Can only return as dict or list, not both")
+		items = self._iter(self.path_handle.compiled)
+		if as_type == "dict":
+			return dict(items)
+		return list(items) if include_paths else [value for _, value in items]
+
+	def keys(self) -> list:
+		node = self._container(self._concrete("keys"), "keys")
+		if node.kind != DICT:
+			raise TypeError("SQLitePathDict keys: must be applied to a dict")
+		return [json.loads(key) for _, key, _, _ in self._children(node)]
+
+	def values(self) -> list:
+		return list(self._loaded("values", dict).values())
+
+	def items(self):
+		return self._loaded("items", dict).items()
+
+	def __len__(self) -> int:
+		node = self._container(self._concrete("len"), "len")
+		if node.kind == LIST:
+			return int(node.value)
+		query = "SELECT COUNT(*) FROM nodes WHERE parent = ?"
+		return self.connection.execute(query, (node.path,)).fetchone()[0]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def _item_path(self, path) -> CompiledPath:
+		keys = path if isinstance(path, tuple) else tuple(path) if isinstance(path, list) else (path,)
+		return compile_path(keys, self.path_handle.raw)
+
+	def __getitem__(self, path):
+		compiled = self._item_path(path)
+		if compiled.has_wildcards:
+			return [value for _, value in self._iter(compiled)]
+		return self._get(compiled)
+
+	def __contains__(self, path) -> bool:
+		try:
+			return self[path] is not None
+		except KeyError:
+			return False
+
+	############################################################################
+	# Setters
+	############################################################################
+
+	def set(self, value) -> SQLitePathDict:
+		"""
+		Set the value at the current path. For wildcard paths, set it at
+		every matching path, like MultiPathDict.set.
+		"""
+		self._set_at(self.path_handle.compiled, value)
+		return self
+
+	def __setitem__(self, path, value):
+		compiled = self._item_path(path)
+		if callable(value):
+			self._map_at(compiled, value)
+		else:
+			self._set_at(compiled, value)
+
+	def set_many(self, items: dict) -> SQLitePathDict:
+		"""
+		Set many values in one transaction, like [path] = value for every
+		path and value in items.
+		"""
+		with self._transaction():
+			for path, value in items.items():
+				self._set_at(self._item_path(path), value)
+		return self
+
+	def map(self, f: Callable) -> SQLitePathDict:
+		"""
+		Map the result of f to the value at the current path, or at every
+		matching path for wildcard paths, in one transaction.
+		"""
+		self._map_at(self.path_handle.compiled, f)
+		return self
+
+	def filter(self, f: Callable, as_type="list", include_paths=False) -> SQLitePathDict | PathDict:
+		"""
+		At the current path only keep the elements for which f(key, value)
+		is True for dicts, or f(value) is True for lists, like PathDict.filter.
+		For wildcard paths, return a PathDict on the matching values for which
+		f is True, like MultiPathDict.filter.
+		"""
+		compiled = self.path_handle.compiled
+		if compiled.has_wildcards:
+			if as_type == "dict":
+				data = {path: value for path, value in self._iter(compiled) if f(path, value)}
+			else:
+				data = [x for x in self.gather(include_paths=include_paths) if f(x)]
+			return PathDict.from_data_and_path(data, self.path_handle.copy(replace_path=[]))
+		with self._transaction():
+			current = self._loaded("filter")
+			if isinstance(current, dict):
+				self._write(compiled.keys, {k: v for k, v in current.items() if f(k, v)})
+			else:
+				self._write(compiled.keys, [x for x in current if f(x)])
+		return self
+
+	def append(self, value) -> SQLitePathDict:
+		"""
+		Append the value to the list at the current path, or at every matching
+		path. If there is no list at a path yet, it is created.
+		"""
+		return self.extend((value,))
+
+	def extend(self, values) -> SQLitePathDict:
+		"""
+		Extend the list at the current path, or at every matching path, by all
+		values. Only the rows of the new items are written. If there is no
+		list at a path yet, it is created.
+		"""
+		values = list(values)
+		with self._transaction():
+			for keys in self._paths(self.path_handle.compiled):
+				node = self._node_at(keys)
+				if node is None:
+					self._write(keys, values)
+					continue
+				if node.kind != LIST:
+					raise TypeError("SQLitePathDict extend: must be applied to a list")
+				length = int(node.value)
+				for i, value in enumerate(values, length):
+					self._insert(_rows(self._child_path(node, i), node.path, i, i, value))
+				query = "UPDATE nodes SET value = ? WHERE path = ?"
+				self.connection.execute(query, (str(length + len(values)), node.path))
+		return self
+
+	def insert(self, index: int, value) -> SQLitePathDict:
+		"""
+		Insert the value before index into the list at the current path, or at
+		every matching path. If there is no list at a path yet, it is created.
+		"""
+		with self._transaction():
+			for keys in self._paths(self.path_handle.compiled):
+				node = self._node_at(keys)
+				if node is not None and node.kind != LIST:
+					raise TypeError("SQLitePathDict insert: must be applied to a list")
+				items = [] if node is None else self._load(node)
+				items.insert(index, value)
+				self._write(keys, items)
+		return self
+
+	def update(self, value) -> SQLitePathDict:
+		"""
+		Update the dict at the current path, or at every matching path, with
+		the given value. If there is no dict at a path yet, it is created.
+		"""
+		with self._transaction():
+			for keys in self._paths(self.path_handle.compiled):
+				node = self._node_at(keys)
+				if node is None:
+					self._write(keys, dict(value))
+					continue
+				if node.kind != DICT:
+					raise TypeError("SQLitePathDict update: must be applied to a dict")
+				for key, child in value.items():
+					self._write(keys + (key,), child)
+		return self
+
+	def merge(self, value, strategy="replace") -> SQLitePathDict:
+		"""
+		Recursively merge value into the dict or list at the current path, or
+		at every matching path, like PathDict.merge. Only the rows that the
+		merge changes are written.
+		"""
+		if strategy not in utils.MERGE_STRATEGIES:
+			raise ValueError(f"SQLitePathDict merge: strategy must be one of {utils.MERGE_STRATEGIES}, not {strategy}")
+		with self._transaction():
+			for keys in self._paths(self.path_handle.compiled):
+				node = self._node_at(keys)
+				current = None if node is None else self._load(node)
+				if current is not None and not (
+					(isinstance(current, dict) and isinstance(value, dict))
+					or (isinstance(current, list) and isinstance(value, list))
+				):
+					raise TypeError(f"SQLitePathDict merge: cannot merge {type(value)} into {type(current)}")
+				self._write(keys, value if current is None else utils.deep_merge(current, value, strategy))
+		return self
+
+	def pop(self, key, default=None):
+		"""
+		Remove the child at key of the dict or list at the current path, and
+		return it, or default if it does not exist.
+		"""
+		compiled = self._concrete("pop")
+		with self._transaction():
+			node = self._container(compiled, "pop")
+			value = self._get(compile_path(compiled.keys + (key,), raw=True))
+			if value is None:
+				return default
+			if node.kind == LIST:
+				items = self._get(compiled)
+				items.pop(self._index(node, key))
+				self._write(compiled.keys, items)
+			else:
+				self._delete(node.path + _SEP + json.dumps(key))
+			return value
+
+	############################################################################
+	# Reductions of the loaded data
+	############################################################################
+
+	def reduce(self, f: Callable, aggregate=None, combine: Callable = None, workers: int = None, executor=None) -> Any:
+		return self._handle("reduce").reduce(f, aggregate, combine, workers, executor)
+
+	def sum(self, workers: int = None, executor=None) -> Any:
+		return self._handle("sum").sum(workers, executor)
+
+	def group_by(self, *fields, workers: int = None, executor=None) -> dict:
+		return self._handle("group_by").group_by(*fields, workers=workers, executor=executor)
+
+	def count_by(self, *fields, workers: int = None, executor=None) -> dict:
+		return self._handle("count_by").count_by(*fields, workers=workers, executor=executor)
+
+	def aggregate_by(self, field, aggregations: dict, workers: int = None, executor=None) -> dict:
+		return self._handle("aggregate_by").aggregate_by(field, aggregations, workers, executor)
+
+	def __getattr__(self, name: str):
+		if not name.startswith("_") and hasattr(PathDict, name):
+			raise AttributeError(f"SQLitePathDict does not support {name}, use deepcopy() to get an in-memory PathDict")
+		raise AttributeError(f"'SQLitePathDict' object has no attribute {name!r}")
+
+	def _set_at(self, compiled: CompiledPath, value: Any):
+		# Setting nothing is a no-op
+		if value is None:
+			return
+		with self._transaction():
+			for keys in self._paths(compiled):
+				self._write(keys, value)
+
+	def _map_at(self, compiled: CompiledPath, f: Callable):
+		with self._transaction():
+			for keys, value in list(self._iter(compiled)):
+				mapped = f(value)
+				if mapped is not None:
+					self._write(keys, mapped)
+
+	def _write(self, keys: tuple, value: Any):
+		"""
+		Store value at the concrete path keys, creating missing dicts on the
+		way like PathDict.set, and write only the rows that changed.
+		"""
+		if len(keys) == 0:
+			root = self._node("")
+			if not isinstance(value, dict if root.kind == DICT else list):
+				raise TypeError(
+					"PathDict set: At the root level, you can only set dict dict or"
+					f"list to a list (tried to set a {root.kind} to a "
+					f"{type(value)})."
+				)
+			return self._replace("", None, None, 0, value)
+		node = self._node("")
+		for key in keys[:-1]:
+			if node.kind == SCALAR:
+				raise KeyError("Can't set the key of a non-dict")
+			if node.kind == LIST:
+				key = self._index(node, key)
+			path = self._child_path(node, key)
+			child = self._node(path)
+			if child is None:
+				self._insert(_rows(path, node.path, key, self._next_ord(node.path), {}))
+				child = _Node(path, DICT, None)
+			node = child
+		key = keys[-1]
+		if node.kind == SCALAR:
+			# Like PathDict, setting a key of a scalar does nothing
+			return
+		if node.kind == LIST:
+			key = self._index(node, key)
+		path = self._child_path(node, key)
+		existing = self.connection.execute("SELECT ord FROM nodes WHERE path = ?", (path,)).fetchone()
+		ord = self._next_ord(node.path) if existing is None else existing[0]
+		self._replace(path, node.path, key, ord, value)
+
+	def _replace(self, path: str, parent: str | None, key: Any, ord: int, value: Any):
+		"""
+		Replace the subtree at path with the rows of value. Rows that did not
+		change are left alone.
+		"""
+		old = {row[0]: row for row in self._subtree(path)}
+		changed = []
+		for row in _rows(path, parent, key, ord, value):
+			if old.pop(row[0], None) != row:
+				changed.append(row)
+		self.connection.executemany("DELETE FROM nodes WHERE path = ?", ((p,) for p in old))
+		self.connection.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?, ?)", changed)
+
+	############################################################################
+	# Internals
+	############################################################################
+
+	@contextmanager
+	def _transaction(self):
+		if self._depth > 0:
+			self._depth += 1
+			try:
+				yield
+			finally:
+				self._depth -= 1
+			return
+		self.connection.execute("BEGIN")
+		self._depth = 1
+		try:
+			yield
+		except BaseException:
+			self.connection.execute("ROLLBACK")
+			raise
+		else:
+			self.connection.execute("COMMIT")
+		finally:
+			self._depth = 0
+
+	def _concrete(self, method: str) -> CompiledPath:
+		compiled = self.path_handle.compiled
+		if compiled.has_wildcards:
+			raise ValueError(f"SQLitePathDict {method}: wildcard paths are not supported, use gather")
+		return compiled
+
+	def _container(self, compiled: CompiledPath, method: str) -> _Node:
+		for _, node in self._iter_nodes(compiled):
+			if node is not None and node.kind != SCALAR:
+				return node
+		raise TypeError(f"SQLitePathDict {method}: must be applied to a dict or list")
+
+	def _node_at(self, keys: tuple) -> _Node | None:
+		"""
+		Return the node at the concrete path keys, or None if it does not
+		exist or is null.
+		"""
+		for _, node in self._iter_nodes(compile_path(keys, raw=True)):
+			return node
+
+	def _loaded(self, method: str, kind: type | tuple = (dict, list)) -> dict | list:
+		value = self._get(self._concrete(method))
+		if not isinstance(value, kind):
+			name = "a dict" if kind is dict else "a dict or list"
+			raise TypeError(f"SQLitePathDict {method}: must be applied to {name}")
+		return value
+
+	def _handle(self, method: str) -> PathDict:
+		return PathDict(self._loaded(method))
+
+	def _node(self, path: str) -> _Node | None:
+		row = self.connection.execute("SELECT kind, value FROM nodes WHERE path = ?", (path,)).fetchone()
+		return None if row is None else _Node(path, row[0], row[1])
+
+	def _children(self, node: _Node) -> List[tuple]:
+		query = "SELECT path, key, kind, value FROM nodes WHERE parent = ? ORDER BY ord"
+		return self.connection.execute(query, (node.path,)).fetchall()
+
+	def _select(self, node: _Node, selector: Any) -> List[Tuple[Any, _Node]]:
+		"""
+		Return (key, child) for the children of the container node that the
+		selector of a wildcard key selects, see path.select_keys. Only
+		where() predicates load the children.
+		"""
+		if selector is None or not isinstance(selector, (tuple, slice)):
+			children = [(json.loads(key), _Node(p, kind, value)) for p, key, kind, value in self._children(node)]
+			if selector is None:
+				return children
+			return [(key, child) for key, child in children if selector.matches(self._load(child))]
+		if node.kind == LIST:
+			keys = select_keys(selector, [None] * int(node.value))
+		elif isinstance(selector, slice):
+			return []
+		else:
+			keys = [key for key, _ in selector]
+		selected = ((key, self._node(self._child_path(node, key))) for key in keys)
+		return [(key, child) for key, child in selected if child is not None]
+
+	def _load(self, node: _Node) -> Any:
+		if node.kind == SCALAR:
+			return json.loads(node.value)
+		return _decode(self._subtree(node.path), node.path)
+
+	def _subtree(self, path: str) -> List[tuple]:
+		query = "SELECT * FROM nodes WHERE path = ? OR (path >= ? AND path < ?)"
+		return self.connection.execute(query, (path, path + _SEP, path + _END)).fetchall()
+
+	def _insert(self, rows: Iterator[Row]):
+		self.connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+	def _delete(self, path: str):
+		query = "DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)"
+		self.connection.execute(query, (path, path + _SEP, path + _END))
+
+	def _next_ord(self, parent: str) -> int:
+		query = "SELECT COALESCE(MAX(ord) + 1, 0) FROM nodes WHERE parent = ?"
+		return self.connection.execute(query, (parent,)).fetchone()[0]
+
+	def _index(self, node: _Node, key: Any) -> int:
+		"""
+		Normalize key to a non-negative index of the list node.
+		"""
+		index = _as_index(key)
+		length = int(node.value)
+		if index is not None and index < 0:
+			index += length
+		if index is None or not 0 <= index < length:
+			raise KeyError(f"PathDict: invalid path ({key} not in list of length {length})")
+		return index
+
+	def _child_path(self, node: _Node, key: Any) -> str:
+		return node.path + _SEP + json.dumps(key)
+
+	def _get(self, compiled: CompiledPath) -> Any:
+		for _, value in self._iter(compiled):
+			return value
+
+	def _paths(self, compiled: CompiledPath) -> List[tuple]:
+		if not compiled.has_wildcards:
+			return [compiled.keys]
+		return [path for path, _ in self._iter_nodes(compiled)]
+
+	def _iter(self, compiled: CompiledPath) -> Iterator[Tuple[tuple, Any]]:
+		"""
+		Yield (path, value) for every path matching compiled, like
+		traversal.iter_values.
+		"""
+		for path, node in self._iter_nodes(compiled):
+			yield path, None if node is None else self._load(node)
+
+	def _iter_nodes(self, compiled: CompiledPath) -> Iterator[Tuple[tuple, _Node | None]]:
+		"""
+		Yield (path, node) for every path matching compiled. node is None if
+		the path does not exist after the last wildcard.
+		"""
+		return traversal.walk(self._node(""), compiled, _Nodes(self))
+
+
+class _Nodes(traversal.Nodes):
+	"""
+	The stored nodes of an SQLitePathDict for traversal._walk. Null scalars
+	are missing values.
+	"""
+
+	def __init__(self, db: SQLitePathDict):
+		self.db = db
+
+	def is_container(self, node: _Node) -> bool:
+		return node.kind != SCALAR
+
+	def is_list(self, node: _Node) -> bool:
+		return node.kind == LIST
+
+	def length(self, node: _Node) -> int:
+		return int(node.value)
+
+	def child(self, node: _Node, key: Any) -> _Node | None:
+		child = self.db._node(self.db._child_path(node, key))
+		return None if child is None or child.is_null else child
+
+	def select(self, node: _Node, selector: Any) -> List[Tuple[Any, _Node | None]] | None:
+		if node.kind == SCALAR:
+			return None
+		return [(key, None if child.is_null else child) for key, child in self.db._select(node, selector)]
+
+	def identity(self, node: _Node) -> str:
+		return node.path
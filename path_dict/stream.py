@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from json.decoder import scanstring
+from typing import IO, Any, Iterator
+
+from .path import compile_path
+
+# Number of characters that are read from the file at once
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_DECODER = json.JSONDecoder()
+# Characters that can continue a number
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class _Reader:
+	"""
+	A buffered reader over a text or binary JSON file. Only the part of the
+	document that is currently parsed is kept in the buffer.
+	"""
+
+	def __init__(self, fp: IO):
+		self.fp = fp
+		self.buf = ""
+		self.pos = 0
+		self.eof = False
+		self.decoder = None
+
+	def read_more(self, size: int = None) -> None:
+		chunk = self.fp.read(CHUNK_SIZE if size is None else size)
+		self.eof = len(chunk) == 0
+		if isinstance(chunk, bytes):
+			if self.decoder is None:
+				self.decoder = codecs.getincrementaldecoder("utf-8")()
+			chunk = self.decoder.decode(chunk, final=self.eof)
+		# Drop everything that was parsed already
+		self.buf = self.buf[self.pos :] + chunk
+		self.pos = 0
+
+	def error(self, message: str) -> json.JSONDecodeError:
+		return json.JSONDecodeError(f"PathDict load: {message}", self.buf, self.pos)
+
+	def peek(self) -> str:
+		"""
+		Skip whitespace and return the next character, or "" at the end.
+		"""
+		while True:
+			self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+			if self.pos < len(self.buf) or self.eof:
+				return self.buf[self.pos : self.pos + 1]
+			self.read_more()
+
+	def expect(self, char: str) -> None:
+		if self.peek() != char:
+			raise self.error(f"expected {char!r}")
+		self.pos += 1
+
+	def decode(self) -> Any:
+		"""
+		Decode the value at the current position.
+		"""
+		self.peek()
+		size = CHUNK_SIZE
+		while True:
+			try:
+				value, end = _DECODER.raw_decode(self.buf, self.pos)
+				# A number at the end of the buffer may continue in the file, also
+				# if it stopped before a cut off part like the "e" of "1.5e3"
+				number = type(value) in (int, float)
+				if self.eof or (end < len(self.buf) and not (number and self.buf[end] in _NUMBER_CHARS)):
+					self.pos = end
+					return value
+			except json.JSONDecodeError:
+				if self.eof:
+					raise
+			# Read exponentially more, so large values are not decoded too often
+			self.read_more(size)
+			size *= 2
+
+	def key(self) -> str:
+		self.expect('"')
+		while True:
+			try:
+				key, self.pos = scanstring(self.buf, self.pos)
+				return key
+			except json.JSONDecodeError:
+				if self.eof:
+					raise
+			self.pos -= 1
+			self.read_more()
+			self.pos += 1
+
+	def skip(self) -> None:
+		"""
+		Skip the value at the current position without decoding it.
+		"""
+		char = self.peek()
+		if char not in "[{":
+			if char == '"':
+				self._skip_string()
+			else:
+				self.decode()
+			return
+		depth = 0
+		while True:
+			match = _STRUCTURE.search(self.buf, self.pos)
+			if match is None:
+				if self.eof:
+					raise self.error("unexpected end of data")
+				self.pos = len(self.buf)
+				self.read_more()
+				continue
+			self.pos = match.start()
+			char = match.group()
+			if char == '"':
+				self._skip_string()
+				continue
+			self.pos += 1
+			depth += 1 if char in "[{" else -1
+			if depth == 0:
+				return
+
+	def _skip_string(self) -> None:
+		while True:
+			match = _STRING.match(self.buf, self.pos)
+			if match is not None:
+				self.pos = match.end()
+				return
+			if self.eof:
+				raise self.error("unterminated string")
+			self.read_more()
+
+
+def iter_load(fp: IO, path: Any = ("*",), raw=False) -> Iterator[tuple[tuple, Any]]:
+	"""
+	Parse the JSON document in fp incrementally, and yield (path, value) for
+	every value that matches path, in document order. path is given like in
+	PathDict.at, and may contain wildcards. Only the matching values are
+	decoded, everything else is skipped, so memory use is bounded by the
+	largest matching value instead of the document. Paths that do not exist
+	in the document are not yielded.
+	"""
+	keys = tuple(path) if isinstance(path, (list, tuple)) else (path,)
+	compiled = compile_path(keys, raw)
+	if compiled.recursive:
+		# A value matched by "**" may also contain matches, but it is only read once
+		raise ValueError("PathDict load: the ** wildcard is not supported when streaming")
+	if any(selector is not None for selector in compiled.selectors):
+		# Alternatives and slices may need list lengths, and predicates whole values
+		raise ValueError("PathDict load: only * wildcards are supported when streaming")
+	wild = [i in compiled.wildcards for i in range(len(compiled))]
+	reader = _Reader(fp)
+	yield from _match(reader, compiled.steps, wild, 0, ())
+	if reader.peek() != "":
+		raise reader.error("extra data")
+
+
+def _match(reader: _Reader, steps: tuple, wild: list, i: int, path: tuple) -> Iterator[tuple[tuple, Any]]:
+	if i == len(steps):
+		yield path, reader.decode()
+		return
+	key, index = steps[i]
+	char = reader.peek()
+	if char == "{":
+		reader.pos += 1
+		if reader.peek() == "}":
+			reader.pos += 1
+			return
+		while True:
+			child_key = reader.key()
+			reader.expect(":")
+			if wild[i]:
+				yield from _match(reader, steps, wild, i + 1, path + (child_key,))
+			elif child_key == key:
+				yield from _match(reader, steps, wild, i + 1, path + (key,))
+			else:
+				reader.skip()
+			if reader.peek() == "}":
+				reader.pos += 1
+				return
+			reader.expect(",")
+	elif char == "[":
+		if not wild[i] and index is None:
+			raise KeyError(f"PathDict load: invalid path ({key} is not a list index)")
+		reader.pos += 1
+		if reader.peek() == "]":
+			reader.pos += 1
+			return
+		position = 0
+		while True:
+			if wild[i]:
+				yield from _match(reader, steps, wild, i + 1, path + (position,))
+			elif position == index:
+				yield from _match(reader, steps, wild, i + 1, path + (key,))
+			else:
+				reader.skip()
+			position += 1
+			if reader.peek() == "]":
+				reader.pos += 1
+				return
+			reader.expect(",")
+	elif reader.decode() is not None:
+		raise KeyError(f"PathDict load: The path is not a stack of nested dicts and lists (at key {key})")
+
+
+def iter_children(fp: IO) -> Iterator[tuple[Any, Any]]:
+	"""
+	Yield (key, value) for the top-level children of the JSON document in
+	fp, one at a time. List children have int keys.
+	"""
+	for path, value in iter_load(fp, ("*",)):
+		yield path[0], value
+
+
+def iter_root(fp: IO) -> tuple[bool, Iterator[tuple[Any, Any]]]:
+	"""
+	Return whether the JSON document in fp is a dict, and an iterator over
+	(key, value) of its children like iter_children. Raise a TypeError if
+	the document is not a dict or list.
+	"""
+	reader = _Reader(fp)
+	char = reader.peek()
+	if char not in ("{", "["):
+		raise TypeError("PathDict load: the document must be a dict or list")
+	return char == "{", _root_children(reader)
+
+
+def _root_children(reader: _Reader) -> Iterator[tuple[Any, Any]]:
+	for path, value in _match(reader, (("*", None),), [True], 0, ()):
+		yield path[0], value
+	if reader.peek() != "":
+		raise reader.error("extra data")
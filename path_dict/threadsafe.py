@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import copy
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Tuple, Union
+
+from .multi_path_dict import MultiPathDict
+from .path import CompiledPath, Path
+from .path_dict import PathDict
+
+# Number of locks that the top-level keys are distributed over
+LOCK_STRIPES = 16
+
+
+class RWLock:
+	"""
+	A reader-writer lock. Any number of threads can hold it for reading at
+	the same time, but only one thread can hold it for writing. Waiting
+	writers are preferred over new readers, so writers do not starve.
+
+	The lock is reentrant: a thread that holds it can acquire it again, and
+	the writer can also acquire it for reading. A reader cannot upgrade to a
+	writer, since two upgrading readers would deadlock. This raises a
+	RuntimeError instead.
+	"""
+
+	def __init__(self):
+		self._cond = threading.Condition(threading.Lock())
+		# Thread ident -> number of nested read acquisitions
+		self._readers = {}
+		self._writer = None
+		self._writer_depth = 0
+		self._waiting_writers = 0
+
+	def acquire_read(self) -> None:
+		me = threading.get_ident()
+		with self._cond:
+			if self._writer == me:
+				self._writer_depth += 1
+				return
+			if me in self._readers:
+				# A nested read must not wait for writers, or it would deadlock
+				self._readers[me] += 1
+				return
+			while self._writer is not None or self._waiting_writers > 0:
+				self._cond.wait()
+			self._readers[me] = 1
+
+	def release_read(self) -> None:
+		me = threading.get_ident()
+		with self._cond:
+			if self._writer == me:
+				self._release_write()
+				return
+			count = self._readers[me] - 1
+			if count > 0:
+				self._readers[me] = count
+				return
+			del self._readers[me]
+			if len(self._readers) == 0:
+				self._cond.notify_all()
+
+	def acquire_write(self) -> None:
+		me = threading.get_ident()
+		with self._cond:
+			if self._writer == me:
+				self._writer_depth += 1
+				return
+			if me in self._readers:
+				raise RuntimeError("PathDict: cannot write while reading the same data in this thread")
+			self._waiting_writers += 1
+			try:
+				while self._writer is not None or len(self._readers) > 0:
+					self._cond.wait()
+			finally:
+				self._waiting_writers -= 1
+			self._writer = me
+			self._writer_depth = 1
+
+	def release_write(self) -> None:
+		with self._cond:
+			self._release_write()
+
+	def held(self) -> bool:
+		"""
+		Return True if the current thread holds the lock.
+		"""
+		me = threading.get_ident()
+		return self._writer == me or me in self._readers
+
+	def _release_write(self) -> None:
+		self._writer_depth -= 1
+		if self._writer_depth == 0:
+			self._writer = None
+			self._cond.notify_all()
+
+
+class _Held:
+	"""
+	Context manager that holds a tuple of RWLocks of a StripedRWLock for
+	reading or writing.
+	"""
+
+	__slots__ = ("striped", "locks", "write", "acquired")
+
+	def __init__(self, striped: StripedRWLock, locks: Tuple[RWLock, ...], write: bool):
+		self.striped = striped
+		self.locks = locks
+		self.write = write
+		self.acquired = 0
+
+	def __enter__(self) -> None:
+		local = self.striped.local
+		depth = getattr(local, "depth", 0)
+		if depth > 0 and not all(lock.held() for lock in self.locks):
+			# Waiting for a lock while holding another could deadlock
+			raise RuntimeError(
+				"PathDict: cannot lock other top-level keys while this thread holds a lock of the same data, "
+				"for example in a callback. Use transaction() to lock the whole data."
+			)
+		try:
+			for lock in self.locks:
+				lock.acquire_write() if self.write else lock.acquire_read()
+				self.acquired += 1
+		except BaseException:
+			self._release()
+			raise
+		local.depth = depth + 1
+
+	def __exit__(self, *exc) -> None:
+		self._release()
+		self.striped.local.depth -= 1
+
+	def _release(self) -> None:
+		for lock in reversed(self.locks[: self.acquired]):
+			lock.release_write() if self.write else lock.release_read()
+		self.acquired = 0
+
+
+class StripedRWLock:
+	"""
+	Distributes the top-level keys of the data over a fixed number of
+	RWLocks. Operations below different top-level keys mostly use different
+	locks, so they do not block each other. Operations that may touch more
+	than one top-level key hold all locks, always in the same order.
+
+	A thread that holds some of the locks can only lock them again, and gets
+	a RuntimeError for the others. Otherwise it could wait for them while
+	another thread that holds them waits for its locks.
+	"""
+
+	stripes: Tuple[RWLock, ...]
+	whole_only: bool
+
+	def __init__(self, stripes=LOCK_STRIPES, whole_only=False):
+		self.stripes = tuple(RWLock() for _ in range(stripes))
+		# Keys of a list cannot be striped, since "0" and 0 are the same index
+		self.whole_only = whole_only
+		# The number of _Held that the current thread is in
+		self.local = threading.local()
+
+	def select(self, compiled: CompiledPath | None) -> Tuple[RWLock, ...]:
+		"""
+		Return the locks that guard the path, or all locks if compiled is None.
+		"""
+		if compiled is None or self.whole_only or len(compiled) == 0 or 0 in compiled.wildcards:
+			return self.stripes
+		try:
+			return (self.stripes[hash(compiled.keys[0]) % len(self.stripes)],)
+		except TypeError:
+			return self.stripes
+
+	def read(self, compiled: CompiledPath | None = None) -> _Held:
+		return _Held(self, self.select(compiled), write=False)
+
+	def write(self, compiled: CompiledPath | None = None) -> _Held:
+		return _Held(self, self.select(compiled), write=True)
+
+
+class ThreadSafePathDict(PathDict):
+	"""
+	A PathDict that can be shared across threads, created with
+	PathDict(data, threadsafe=True).
+
+	at() returns a new handle instead of moving this one, and every
+	operation holds the striped reader-writer lock of the data for the
+	top-level key it works on. All handles on the same data share the lock
+	and the indexes. Iterators are materialized while the lock is held.
+
+	Callbacks, like the function passed to map, run while the lock of their
+	top-level key is held. If they use other top-level keys, a RuntimeError
+	is raised instead of risking a deadlock. Run them in a transaction(),
+	which holds the whole lock, to use the whole data.
+	"""
+
+	lock: StripedRWLock
+
+	def __init__(self, data: dict | list, raw=False, path: Path = None, copy_on_write=False, threadsafe=True):
+		super().__init__(data, raw=raw, path=path, copy_on_write=copy_on_write, threadsafe=threadsafe)
+		self.lock = StripedRWLock(whole_only=isinstance(data, list))
+		self._index_lock = threading.Lock()
+
+	def at(self, *path, raw=None) -> Union[ThreadSafePathDict, ThreadSafeMultiPathDict]:
+		raw = self.path_handle.raw if raw is None else raw
+		handle = copy.copy(self)
+		handle.path_handle = Path(*path, raw=raw)
+		if handle.path_handle.has_wildcards:
+			return ThreadSafeMultiPathDict(self.data, handle.path_handle, handle=handle)
+		return handle
+
+	def items(self) -> list:
+		with self.lock.read(self.path_handle.compiled):
+			return list(self.get().items())
+
+	def create_index(self, *fields):
+		with self.lock.read(self.path_handle.compiled), self._index_lock:
+			return super().create_index(*fields)
+
+	def journal(self, coalesce=False):
+		with self._index_lock:
+			return super().journal(coalesce)
+
+	@contextmanager
+	def transaction(self):
+		"""
+		Like PathDict.transaction, but the whole data is locked for writing
+		until the block ends, so other threads never see a partial update.
+		"""
+		with self.lock.write(), super().transaction():
+			yield self
+
+	def _changed(self, keys: tuple, inserted: tuple[int, int] | None = None):
+		if len(self.indexes) > 0 or len(self.journals) > 0:
+			with self._index_lock:
+				super()._changed(keys, inserted)
+
+	def _changing(self, keys: tuple, insert=False):
+		if len(self.journals) > 0 or len(self.transactions) > 0:
+			with self._index_lock:
+				super()._changing(keys, insert)
+
+	def __repr__(self) -> str:
+		with self.lock.read():
+			return super().__repr__()
+
+	def __getitem__(self, path):
+		with self.lock.read(self._item_path(path)):
+			return super().__getitem__(path)
+
+	def __setitem__(self, path, value):
+		with self.lock.write(self._item_path(path)):
+			super().__setitem__(path, value)
+
+	def __contains__(self, path):
+		with self.lock.read(self._item_path(path)):
+			return super().__contains__(path)
+
+
+class ThreadSafeMultiPathDict(MultiPathDict):
+	"""
+	The MultiPathDict of a ThreadSafePathDict. Its operations hold the locks
+	of the handle it was created from.
+	"""
+
+	handle: ThreadSafePathDict
+
+	def iter_values(self) -> Iterator[Any]:
+		with self.handle.lock.read(self.path_handle.compiled):
+			return iter(list(super().iter_values()))
+
+	def iter_paths(self) -> Iterator[tuple]:
+		with self.handle.lock.read(self.path_handle.compiled):
+			return iter(list(super().iter_paths()))
+
+	def iter_items(self) -> Iterator[tuple[tuple, Any]]:
+		with self.handle.lock.read(self.path_handle.compiled):
+			return iter(list(super().iter_items()))
+
+
+def _locked(cls: type, name: str, write: bool, whole=False):
+	method = getattr(cls, name)
+
+	def locked(self, *args, **kwargs):
+		lock = self.handle.lock if isinstance(self, MultiPathDict) else self.lock
+		compiled = None if whole else self.path_handle.compiled
+		with lock.write(compiled) if write else lock.read(compiled):
+			return method(self, *args, **kwargs)
+
+	locked.__name__ = method.__name__
+	locked.__qualname__ = f"{cls.__name__}.{name}"
+	locked.__doc__ = method.__doc__
+	return locked
+
+
+_PATH_DICT_READS = (
+	"get",
+	"keys",
+	"values",
+	"__len__",
+	"reduce",
+	"group_by",
+	"count_by",
+	"aggregate_by",
+	"sum",
+	"columns",
+	"dumps",
+	"dump",
+	"diff",
+)
+_PATH_DICT_WRITES = ("set", "map", "filter", "append", "extend", "insert", "update", "merge", "pop")
+_PATH_DICT_WHOLE_READS = ("deepcopy", "copy", "get_many", "with_set", "dump_at")
+_PATH_DICT_WHOLE_WRITES = ("set_many", "map_many", "patch")
+
+for _name in _PATH_DICT_READS:
+	setattr(ThreadSafePathDict, _name, _locked(PathDict, _name, write=False))
+for _name in _PATH_DICT_WRITES:
+	setattr(ThreadSafePathDict, _name, _locked(PathDict, _name, write=True))
+for _name in _PATH_DICT_WHOLE_READS:
+	setattr(ThreadSafePathDict, _name, _locked(PathDict, _name, write=False, whole=True))
+for _name in _PATH_DICT_WHOLE_WRITES:
+	setattr(ThreadSafePathDict, _name, _locked(PathDict, _name, write=True, whole=True))
+
+_MULTI_PATH_DICT_READS = (
+	"gather",
+	"reduce",
+	"filter",
+	"parallel_filter",
+	"group_by",
+	"count_by",
+	"aggregate_by",
+	"sum",
+	"mean",
+	"min",
+	"max",
+	"quantile",
+	"to_array",
+)
+_MULTI_PATH_DICT_WRITES = ("map", "set", "append", "extend", "insert")
+
+for _name in _MULTI_PATH_DICT_READS:
+	setattr(ThreadSafeMultiPathDict, _name, _locked(MultiPathDict, _name, write=False))
+for _name in _MULTI_PATH_DICT_WRITES:
+	setattr(ThreadSafeMultiPathDict, _name, _locked(MultiPathDict, _name, write=True))
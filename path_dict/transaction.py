@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from typing import Any, List, Tuple
+
+from . import utils
+from .path import _MISSING, compile_path
+
+
+class Transaction:
+	"""
+	The undo log of a PathDict.transaction(). Before a path is written for
+	the first time, a copy of its old value is logged, or _MISSING if the
+	first missing dict along the path is created by the write. Writes below
+	a logged path are not logged again, so every touched node is copied at
+	most once.
+
+	Copy-on-write handles never mutate their data, so for them only the
+	root at the start of the transaction is kept.
+	"""
+
+	root: dict | list | None
+	undo: List[Tuple[tuple, Any]]
+
+	def __init__(self, root: dict | list | None = None):
+		self.root = root
+		self.undo = []
+		self._logged = set()
+
+	def __repr__(self) -> str:
+		return f"Transaction(undo={len(self.undo)})"
+
+	def before(self, root: dict | list, keys: tuple) -> None:
+		"""
+		Log the old value at keys, before it is written.
+		"""
+		if self.root is not None:
+			return
+		for i in range(len(keys) + 1):
+			if keys[:i] in self._logged:
+				return
+		current = root
+		for i, (key, index) in enumerate(compile_path(keys, raw=True).steps):
+			if isinstance(current, dict):
+				if key not in current:
+					self._log(keys[: i + 1], _MISSING)
+					return
+				current = current[key]
+			elif isinstance(current, list) and index is not None and -len(current) <= index < len(current):
+				current = current[index]
+			else:
+				# The write fails or does nothing
+				return
+		self._log(keys, utils.fast_deepcopy(current))
+
+	def _log(self, keys: tuple, old: Any) -> None:
+		self._logged.add(keys)
+		self.undo.append((keys, old))
+
+
+def restore(root: dict | list, keys: tuple, old: Any) -> None:
+	"""
+	Restore the old value at keys that was logged by a Transaction.
+	"""
+	if len(keys) == 0:
+		root.clear()
+		root.update(old) if isinstance(root, dict) else root.extend(old)
+	elif old is _MISSING:
+		parent = compile_path(keys[:-1], raw=True).get(root)
+		if isinstance(parent, dict):
+			parent.pop(keys[-1], None)
+	else:
+		compile_path(keys, raw=True).set(root, old)
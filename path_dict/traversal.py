@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+from .path import CompiledPath, _list_get, select_keys
+
+
+class Nodes:
+	"""
+	How _walk reads the nodes of a backend. A node is a dict, list or scalar
+	of the backend, and None is a missing value. Backends subclass it for
+	their own node type, and only have to implement the primitives. The
+	matching rules of the path segments are all in _walk.
+	"""
+
+	def is_container(self, node: Any) -> bool:
+		raise NotImplementedError
+
+	def is_list(self, node: Any) -> bool:
+		raise NotImplementedError
+
+	def length(self, node: Any) -> int:
+		raise NotImplementedError
+
+	def child(self, node: Any, key: Any) -> Any:
+		"""
+		Return the child at key of the container node, or None if it does not
+		exist. List keys are valid non-negative indices.
+		"""
+		raise NotImplementedError
+
+	def select(self, node: Any, selector: Any) -> list[tuple[Any, Any]] | None:
+		"""
+		Return (key, child) for the children of the container node that the
+		selector of a wildcard key selects, see path.select_keys, or None if
+		node is a scalar.
+		"""
+		raise NotImplementedError
+
+	def containers(self, children: list[tuple[Any, Any]]) -> list[tuple[Any, Any]]:
+		"""
+		Return the (key, child) of children whose child is a dict or list.
+		"""
+		return [(k, child) for k, child in children if child is not None and self.is_container(child)]
+
+	def identity(self, node: Any) -> Any:
+		"""
+		Return a key that identifies the container node while it is walked,
+		to detect cycles.
+		"""
+		return id(node)
+
+	def descend(self, node: Any, key: Any, index: int | None) -> Any:
+		"""
+		Like get, but create a missing dict at key of a dict.
+		"""
+		raise NotImplementedError
+
+	def get(self, node: Any, key: Any, index: int | None) -> Any:
+		"""
+		Return the child at key of node, or None if it does not exist. Raise
+		a KeyError if node is a scalar, or key is not an index of the list.
+		"""
+		if not self.is_container(node):
+			raise KeyError(
+				f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} has type {type(node)})"
+			)
+		return self.child(node, self.slot(node, key, index))
+
+	def probe(self, node: Any, key: Any, index: int | None) -> Any:
+		"""
+		Like get, but return None instead of raising.
+		"""
+		if not self.is_container(node):
+			return None
+		if self.is_list(node):
+			length = self.length(node)
+			if index is None or not -length <= index < length:
+				return None
+			key = index + length if index < 0 else index
+		return self.child(node, key)
+
+	def read(self, parent: Any, key: Any) -> Any:
+		"""
+		Read the child at key of a parent yielded by _walk.
+		"""
+		if parent is None:
+			return None
+		if not self.is_container(parent):
+			raise KeyError(
+				f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} has type {type(parent)})"
+			)
+		return self.child(parent, key)
+
+	def slot(self, node: Any, key: Any, index: int | None) -> Any:
+		"""
+		Return the key of the child at key of node, as it is yielded by
+		_walk. List keys become non-negative indices, and raise a KeyError
+		if they are not in the list.
+		"""
+		if node is None or not self.is_container(node) or not self.is_list(node):
+			return key
+		length = self.length(node)
+		if index is None or not -length <= index < length:
+			raise KeyError(f"PathDict: invalid path ({key} not in list of length {length})")
+		return index + length if index < 0 else index
+
+
+class _Memory(Nodes):
+	"""
+	Nodes of nested dicts and lists. The generic methods are inlined, as
+	this is what every in-memory PathDict walks.
+	"""
+
+	identity = id
+
+	def is_container(self, node: Any) -> bool:
+		return isinstance(node, (dict, list))
+
+	def is_list(self, node: Any) -> bool:
+		return isinstance(node, list)
+
+	def length(self, node: Any) -> int:
+		return len(node)
+
+	def child(self, node: Any, key: Any) -> Any:
+		return node.get(key) if isinstance(node, dict) else node[key]
+
+	def select(self, node: Any, selector: Any) -> list[tuple[Any, Any]] | None:
+		if not isinstance(node, (dict, list)):
+			return None
+		if selector is None:
+			return list(node.items()) if isinstance(node, dict) else list(enumerate(node))
+		return [(k, node[k]) for k in select_keys(selector, node)]
+
+	def containers(self, children: list[tuple[Any, Any]]) -> list[tuple[Any, Any]]:
+		return [(k, child) for k, child in children if isinstance(child, (dict, list))]
+
+	def descend(self, node: Any, key: Any, index: int | None) -> Any:
+		if isinstance(node, dict):
+			if key not in node:
+				node[key] = {}
+			return node[key]
+		if isinstance(node, list):
+			return _list_get(node, key, index)
+		raise KeyError("Can't set the key of a non-dict")
+
+	def get(self, node: Any, key: Any, index: int | None) -> Any:
+		if isinstance(node, dict):
+			return node.get(key)
+		if isinstance(node, list):
+			return _list_get(node, key, index)
+		raise KeyError(
+			f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} has type {type(node)})"
+		)
+
+	def probe(self, node: Any, key: Any, index: int | None) -> Any:
+		if isinstance(node, dict):
+			return node.get(key)
+		if isinstance(node, list) and index is not None and -len(node) <= index < len(node):
+			return node[index]
+		return None
+
+	def slot(self, node: Any, key: Any, index: int | None) -> Any:
+		if not isinstance(node, list):
+			return key
+		if index is None or not -len(node) <= index < len(node):
+			raise KeyError(f"PathDict: invalid path ({key} not in {node})")
+		return index + len(node) if index < 0 else index
+
+	def read(self, parent: Any, key: Any) -> Any:
+		return read(parent, key)
+
+
+MEMORY = _Memory()
+
+
+def _walk(root: Any, compiled: CompiledPath, create: bool, with_paths: bool, nodes: Nodes = MEMORY) -> Iterator[tuple]:
+	"""
+	Walk root along the compiled path in a single depth-first pass, carrying
+	the current node along, and yield (path, parent, key) for every concrete
+	path that matches. parent is the container that holds key at the end of
+	the path, and key can be used on it directly (list keys are
+	non-negative ints). nodes reads the nodes of the backend, all backends
+	match paths with this function.
+
+	A "**" wildcard matches any number of levels, or any number of levels
+	but at least one if it is the last key. It only descends into dicts and
+	lists, and never into a container that it is already descending from,
+	so cyclic data is walked without repeating itself. The keys after a
+	"**" only match values that exist, and branches where they do not fit
+	are skipped instead of raising a KeyError.
+
+	If create is True, missing dicts after the last wildcard are created on
+	the way down, like PathDict.set does. Otherwise parent is None if the
+	path does not exist. path is None unless with_paths is True.
+	"""
+	steps = compiled.steps
+	last = len(steps) - 1
+	wild = [False] * len(steps)
+	for i in compiled.wildcards:
+		wild[i] = True
+	deep = [False] * len(steps)
+	for i in compiled.recursive:
+		deep[i] = True
+	selectors = compiled.selectors
+	last_wildcard = compiled.wildcards[-1] if compiled.wildcards else -1
+	# Steps after this one only match existing values
+	first_recursive = compiled.recursive[0] if compiled.recursive else len(steps)
+
+	# Several "**" can reach the same path in different ways, so yield it once
+	seen = set() if len(compiled.recursive) > 1 else None
+	track = with_paths or seen is not None
+	# (identity, step) of the "**" steps that are being descended from
+	active = set()
+	get, probe, slot, select, containers, identity = (
+		nodes.get,
+		nodes.probe,
+		nodes.slot,
+		nodes.select,
+		nodes.containers,
+		nodes.identity,
+	)
+	# In memory, dict keys are their own slot, so the call can be skipped
+	memory = nodes is MEMORY
+
+	stack = [(root, 0, () if track else None)]
+	while stack:
+		node, i, path = stack.pop()
+		if node is _EXIT:
+			active.discard(i)
+			continue
+
+		# Follow concrete keys without going through the stack
+		while i < last and not wild[i]:
+			key, index = steps[i]
+			if track:
+				path += (key,)
+			if i > first_recursive:
+				node = probe(node, key, index)
+			elif create and i > last_wildcard:
+				node = nodes.descend(node, key, index)
+			elif node is not None:
+				node = get(node, key, index)
+			i += 1
+			# Nothing exists below a missing node, so there is nothing to expand
+			if node is None and (i <= last_wildcard or i > first_recursive):
+				break
+		else:
+			if not wild[i]:
+				key, index = steps[i]
+				if track:
+					path += (key,)
+				if i > first_recursive and probe(node, key, index) is None:
+					continue
+				if not (memory and isinstance(node, dict)):
+					key = slot(node, key, index)
+				if seen is None or _first(seen, path):
+					yield (path if with_paths else None), node, key
+				continue
+
+			if node is None:
+				continue
+			# Only the selected children are expanded
+			children = select(node, selectors[i])
+			if children is None:
+				if deep[i] or i > first_recursive:
+					# Scalars have nothing below them
+					continue
+				raise KeyError(
+					f"PathDict: The path is not a stack of nested dicts and lists "
+					f"(value at key {steps[i][0]} has type {type(node)})"
+				)
+
+			if deep[i]:
+				marker = (identity(node), i)
+				if marker in active:
+					continue
+				active.add(marker)
+				stack.append((_EXIT, marker, None))
+				# Descend one more level, into containers only
+				stack.extend((child, i, path + (k,) if track else None) for k, child in reversed(containers(children)))
+				if i < last:
+					# Or match the rest of the path here
+					stack.append((node, i + 1, path))
+					continue
+
+			if i == last:
+				for k, _ in children:
+					child_path = path + (k,) if track else None
+					if seen is None or _first(seen, child_path):
+						yield (child_path if with_paths else None), node, k
+			else:
+				stack.extend((child, i + 1, path + (k,) if track else None) for k, child in reversed(children))
+
+
+# Marks the end of a "**" descent on the stack of _walk
+_EXIT = object()
+
+
+def _first(seen: set, path: tuple) -> bool:
+	if path in seen:
+		return False
+	seen.add(path)
+	return True
+
+
+def walk(root: Any, compiled: CompiledPath, nodes: Nodes) -> Iterator[tuple[tuple, Any]]:
+	"""
+	Yield (path, node) for every path matching compiled in the root node of
+	a backend, like iter_values. node is None if the path does not exist.
+	"""
+	if len(compiled) == 0:
+		yield (), root
+		return
+	for path, parent, key in _walk(root, compiled, False, True, nodes):
+		yield path, nodes.read(parent, key)
+
+
+def read(parent: Any, key: Any) -> Any:
+	"""
+	Read the value at key of a parent yielded by the traversal.
+	"""
+	if isinstance(parent, dict):
+		return parent.get(key)
+	if isinstance(parent, list):
+		try:
+			return parent[key]
+		except IndexError as e:
+			raise KeyError(f"PathDict: invalid path ({key} not in {parent})") from e
+	if parent is None:
+		return None
+	raise KeyError(
+		f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} has type {type(parent)})"
+	)
+
+
+def write(parent: Any, key: Any, value: Any) -> None:
+	"""
+	Write the value at key of a parent yielded by the traversal.
+	"""
+	if isinstance(parent, dict):
+		parent[key] = value
+	elif isinstance(parent, list):
+		try:
+			parent[key] = value
+		except IndexError as e:
+			raise KeyError(f"PathDict set: invalid path ({key} not in {parent})") from e
+
+
+def iter_values(root: dict | list, compiled: CompiledPath, with_paths=False) -> Iterator[tuple[tuple | None, Any]]:
+	"""
+	Yield (path, value) for every path matching compiled in root.
+	path is None unless with_paths is True.
+	"""
+	for path, parent, key in _walk(root, compiled, False, with_paths):
+		yield path, read(parent, key)
+
+
+def iter_slots(
+	root: dict | list, compiled: CompiledPath, with_paths=False, create=True
+) -> Iterator[tuple[tuple | None, Any, Any]]:
+	"""
+	Yield (path, parent, key) for every path matching compiled in root,
+	creating missing dicts like PathDict.set. Use read and write to access
+	the value in the slot. Without create, parent is None if the path does
+	not exist, and the same KeyErrors are raised.
+	"""
+	return _walk(root, compiled, create, with_paths)
@@ -2,26 +2,202 @@ from __future__ import annotations
 
 from typing import Any
 
+# Types that fast_deepcopy returns as they are
+_IMMUTABLE = {int, str, bool, float, type(None), bytes, complex}
+# Types that fast_deepcopy copies
+_CONTAINERS = {dict, list, tuple, set}
+# Copies without memo that get deeper than this check the data for cycles
+_CYCLE_CHECK_DEPTH = 1000
 
-def fast_deepcopy(obj):
+
+class _PendingTuple:
+	"""
+	A tuple whose items are still being copied into the list items. fixups
+	are (target, key) slots that refer to the tuple before it is finished.
+	"""
+
+	__slots__ = ("items", "original", "fixups")
+
+	def __init__(self, items: list, original: tuple):
+		self.items = items
+		self.original = original
+		self.fixups = []
+
+
+def fast_deepcopy(obj, memo=False):
 	"""
 	Makes a fast deep copy of the object.
-	dict, list, tuple, set, str, int, float and bool are truly copied.
-	Everything else is just copied by reference.
+	dict, list, tuple and set are truly copied, int, str, bool, float and other
+	types are copied by reference. Dict keys, set elements and tuples of
+	immutable items are immutable and thus not copied.
+
+	The copy uses an explicit stack instead of recursion, so it works for
+	arbitrarily deep data. Lists are copied with a single slice, and only
+	their items that are containers are copied further.
 
 	:param obj: The object to be copied
+	:param memo: If True, every container is copied only once, so shared
+	subtrees stay shared in the copy and cyclic references are supported.
+	Without memo, cyclic data is found and copied as with memo=True.
 	"""
-	# Fast exit for immutable types
-	if isinstance(obj, (int, str, bool, float)):
+	t = type(obj)
+	if t in _IMMUTABLE or (t not in _CONTAINERS and not isinstance(obj, dict)):
 		return obj
-	# Copy key and value for dicts
-	if isinstance(obj, dict):
-		return {fast_deepcopy(k): fast_deepcopy(v) for k, v in obj.items()}
-	# Copy all other supported types
-	if (t := type(obj)) in (list, tuple, set):
-		return t(fast_deepcopy(v) for v in obj)
-	# Everything else is copied by reference
-	return obj
+
+	# Maps id(original) to (original, copy). The original is kept alive so
+	# that its id is not reused during the copy.
+	copies = {} if memo else None
+	# Without memo, a cycle would be copied forever, and data is only checked
+	# for cycles once the copy gets deeper than this
+	check_depth = None if memo else _CYCLE_CHECK_DEPTH
+	# The slot root[0] receives the copy of obj
+	root = [obj]
+	# Every frame (target, key, value, depth) copies value into target[key]
+	stack = [(root, 0, obj, 0)]
+	while stack:
+		target, key, value, depth = stack.pop()
+		t = type(value)
+
+		if t is _PendingTuple:
+			# All items of the tuple have been copied, finish it
+			new = tuple(value.items)
+			target[key] = new
+			for fix_target, fix_key in value.fixups:
+				fix_target[fix_key] = new
+			if copies is not None:
+				copies[id(value.original)] = (value.original, new)
+			continue
+
+		if copies is not None and id(value) in copies:
+			existing = copies[id(value)][1]
+			if type(existing) is _PendingTuple:
+				existing.fixups.append((target, key))
+			else:
+				target[key] = existing
+			continue
+
+		if check_depth is not None and depth > check_depth:
+			if _is_cyclic(obj):
+				return fast_deepcopy(obj, memo=True)
+			# Only deep, no need to check again
+			check_depth = None
+
+		if t is list:
+			new = value[:]
+			items = enumerate(value)
+		elif t is tuple:
+			new = list(value)
+			items = enumerate(value)
+		elif t is set:
+			new = value.copy()
+			items = ()
+		else:
+			new = dict(value)
+			items = value.items()
+
+		if t is tuple:
+			# The tuple is created after all of its items are copied
+			pending = _PendingTuple(new, value)
+			stack.append((target, key, pending, depth))
+			if copies is not None:
+				copies[id(value)] = (value, pending)
+		else:
+			target[key] = new
+			if copies is not None:
+				copies[id(value)] = (value, new)
+
+		for k, v in items:
+			vt = type(v)
+			if vt in _IMMUTABLE:
+				continue
+			if vt is tuple and all(type(x) in _IMMUTABLE for x in v):
+				# A tuple of immutable items is immutable itself, so it can be shared
+				continue
+			if vt in _CONTAINERS or isinstance(v, dict):
+				stack.append((new, k, v, depth + 1))
+
+	return root[0]
+
+
+def _is_cyclic(obj) -> bool:
+	"""
+	Return True if a container in obj contains itself, directly or nested.
+	"""
+	# Containers are entered when pushed and exited when their marker is
+	# popped, so active holds the ids of the containers on the current path.
+	active = set()
+	done = set()
+	stack = [(False, obj)]
+	while stack:
+		exiting, value = stack.pop()
+		if exiting:
+			active.discard(id(value))
+			done.add(id(value))
+			continue
+		if id(value) in active:
+			return True
+		if id(value) in done:
+			continue
+		active.add(id(value))
+		stack.append((True, value))
+		items = value.values() if isinstance(value, dict) else value
+		stack.extend((False, v) for v in items if type(v) in (list, tuple) or isinstance(v, dict))
+	return False
+
+
+MERGE_STRATEGIES = ("replace", "append", "union")
+
+
+def deep_merge(target: Any, value: Any, strategy="replace", in_place=True) -> Any:
+	"""
+	Recursively merge value into target and return the result.
+	Dicts are merged key by key. Lists are replaced, appended to, or extended
+	by the items they do not contain yet, depending on the strategy ("replace",
+	"append" or "union"). Everything else is replaced by value.
+
+	Untouched subtrees of target are never copied. Parts of value that are
+	inserted are copied with fast_deepcopy, so later merges into target never
+	change value. If in_place is False, target is not mutated, and only the
+	containers along merged paths are copied.
+	"""
+	if isinstance(target, dict) and isinstance(value, dict):
+		res = target if in_place else target.copy()
+		for k, v in value.items():
+			res[k] = deep_merge(res[k], v, strategy, in_place) if k in res else fast_deepcopy(v)
+		return res
+	if isinstance(target, list) and isinstance(value, list) and strategy != "replace":
+		res = target if in_place else list(target)
+		if strategy == "append":
+			res.extend(fast_deepcopy(value))
+			return res
+		# Union, use a set for hashable items and fall back to a scan otherwise
+		seen = set()
+		for v in res:
+			try:
+				seen.add(v)
+			except TypeError:
+				pass
+		for v in value:
+			try:
+				if v in seen:
+					continue
+				seen.add(v)
+			except TypeError:
+				if v in res:
+					continue
+			res.append(fast_deepcopy(v))
+		return res
+	return fast_deepcopy(value)
+
+
+def insert_position(length: int, index: int) -> int:
+	"""
+	Return the position at which list.insert(index, value) inserts into a
+	list of the given length.
+	"""
+	if index < 0:
+		return max(length + index, 0)
+	return min(index, length)
 
 
 def safe_list_get(current, key):
@@ -45,7 +221,7 @@ def guarded_get(current: dict | list, key: Any):
 	if isinstance(current, list):
 		return safe_list_get(current, key)
 	raise KeyError(
-		f"PathDict: The path is not a stack of nested dicts and lists " f"(value at key {key} has type {type(current)})"
+		f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} has type {type(current)})"
 	)
 
 
@@ -89,5 +265,5 @@ def get_nested_keys_or_indices(ref: dict | list, path: list):
 	if isinstance(current, list):
 		return list(range(len(current)))
 	raise KeyError(
-		f"PathDict: The path is not a stack of nested dicts and lists " f"(value at key {key} has type {type(current)})"
+		f"PathDict: The path is not a stack of nested dicts and lists (value at key {key} has type {type(current)})"
 	)
@@ -1,5 +1,4 @@
 from path_dict import pd
-import json
 from pyinstrument.profiler import Profiler
 
 from path_dict.path_dict import PathDict
@@ -15,8 +14,10 @@ class TestObject(object):
 		print(path)
 
 
-users = pd(json.loads(open(f"{db_directory}/users.json", "r").read()))
-tasks = pd(json.loads(open(f"{db_directory}/tasks.json", "r").read()))
+with open(f"{db_directory}/users.json", "rb") as f:
+	users = PathDict.load(f)
+with open(f"{db_directory}/tasks.json", "rb") as f:
+	tasks = PathDict.load(f)
 
 
 users.filter(f=lambda k, v: v.get("status") != "archived")
@@ -27,14 +28,11 @@ tasks["test", "test"] = TestObject({"test": "test"})
 
 
 def agg(tasks: PathDict, sorted_users_list):
-	# Get active users
+	# Index tasks by annotator and status once instead of filtering per user
+	by_annotator_status = tasks.create_index("annotator_id", "status")
 	for user in sorted_users_list:
-		user_active_tasks = tasks.filtered(lambda k, v: v.get("annotator_id") == user["id"] and v["status"] == "assigned_accepted")
-		s = len(user_active_tasks)
-		user["active_tasks_sum"] = s
-		user_pending_tasks = tasks.filtered(lambda k, v: v.get("annotator_id") == user["id"] and v["status"] == "assigned_pending")
-		s = len(user_pending_tasks)
-		user["pending_tasks_sum"] = s
+		user["active_tasks_sum"] = len(by_annotator_status.lookup((user["id"], "assigned_accepted")))
+		user["pending_tasks_sum"] = len(by_annotator_status.lookup((user["id"], "assigned_pending")))
 		print(user["last_name"], user["active_tasks_sum"], user["pending_tasks_sum"])
 
 
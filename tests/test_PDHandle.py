@@ -1,6 +1,15 @@
+import copy
+import io
+import json
+import operator
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from path_dict import pd
+from path_dict import aggregate, pd, serialize
+from path_dict.journal import Change
+from path_dict.threadsafe import ThreadSafePathDict
 from tests import dummy_data
 
 
@@ -376,3 +385,541 @@ def test_iter():
 	for k in p:
 		keys.append(k)
 	assert keys == ["a", "b", "c"]
+
+
+def test_create_index():
+	tasks = pd(
+		{
+			"t1": {"owner": "u1", "status": "open", "meta": {"prio": 1}},
+			"t2": {"owner": "u2", "status": "done", "meta": {"prio": 2}},
+			"t3": {"owner": "u1", "status": "done", "meta": {"prio": 1}},
+		}
+	)
+	by_owner = tasks.create_index("owner")
+	by_owner_status = tasks.create_index("owner", "status")
+	by_prio = tasks.create_index(["meta", "prio"])
+	assert by_owner.lookup("u1") == ["t1", "t3"]
+	assert by_owner.lookup("u3") == []
+	assert by_owner.lookup_many(["u2", "u1"]) == ["t2", "t1", "t3"]
+	assert by_owner_status.lookup(("u1", "done")) == ["t3"]
+	assert by_prio.lookup(1) == ["t1", "t3"]
+
+	# Writes through the handle keep the indexes up to date
+	tasks["t1", "status"] = "done"
+	assert by_owner_status.lookup(("u1", "done")) == ["t3", "t1"]
+	tasks["t4"] = {"owner": "u2", "status": "open"}
+	assert by_owner.lookup("u2") == ["t2", "t4"]
+	assert by_prio.lookup(None) == ["t4"]
+	tasks.at("*", "meta", "prio").map(lambda p: (p or 0) + 1)
+	assert by_prio.lookup(2) == ["t1", "t3"]
+	assert by_prio.lookup(1) == ["t4"]
+	tasks.at().filter(lambda k, v: v["owner"] != "u1")
+	assert by_owner.lookup("u1") == []
+	assert by_owner.lookup("u2") == ["t2", "t4"]
+	tasks.at().pop("t2")
+	assert by_owner.lookup("u2") == ["t4"]
+
+	# Indexes on lists
+	p = pd({"l": [{"n": 1}, {"n": 2}, {"n": 1}]})
+	by_n = p.at("l").create_index("n")
+	assert by_n.lookup(1) == [0, 2]
+	p["l", 1, "n"] = 1
+	assert by_n.lookup(1) == [0, 2, 1]
+
+	with pytest.raises(ValueError):
+		p.create_index()
+
+
+def test_group_by():
+	tasks = pd(
+		{
+			"t1": {"owner": "u1", "status": "open", "hours": 2},
+			"t2": {"owner": "u2", "status": "done", "hours": 5},
+			"t3": {"owner": "u1", "status": "done"},
+			"t4": {"owner": "u1", "status": "done", "hours": 4},
+		}
+	)
+	assert tasks.group_by("owner") == {
+		"u1": {"t1": tasks["t1"], "t3": tasks["t3"], "t4": tasks["t4"]},
+		"u2": {"t2": tasks["t2"]},
+	}
+	assert tasks.count_by("owner") == {"u1": 3, "u2": 1}
+	assert tasks.count_by("owner", "status") == {("u1", "open"): 1, ("u2", "done"): 1, ("u1", "done"): 2}
+	assert tasks.aggregate_by("owner", {"hours": "sum", ("hours",): "mean", "status": "count"}) == {
+		"u1": {"hours": 6, ("hours",): 3.0, "status": 3},
+		"u2": {"hours": 5, ("hours",): 5.0, "status": 1},
+	}
+	assert tasks.aggregate_by("status", {"hours": "min"}) == {"open": {"hours": 2}, "done": {"hours": 4}}
+	with pytest.raises(ValueError):
+		tasks.aggregate_by("owner", {"hours": "median"})
+
+	# Lists and MultiPathDicts group lists of values
+	p = pd({"l": [{"n": 1}, {"n": 2}, {"n": 1}]})
+	assert p.at("l").group_by("n") == {1: [{"n": 1}, {"n": 1}], 2: [{"n": 2}]}
+	assert p.at("l", "*").count_by("n") == {1: 2, 2: 1}
+	assert p.at("l", "*").aggregate_by("n", {"n": "max"}) == {1: {"n": 1}, 2: {"n": 2}}
+	with pytest.raises(TypeError):
+		p.at("l", 0, "n").count_by("n")
+
+
+def test_snapshot():
+	j = {"a": {"b": 1, "c": [1, 2]}, "x": {"y": {"z": 1}}}
+	snap = pd(j).snapshot()
+	assert snap.get() is j
+
+	# Writes copy only the containers along the path
+	snap["a", "b"] = 2
+	assert j["a"]["b"] == 1
+	assert snap["a", "b"] == 2
+	assert snap.get() is not j
+	assert snap["a"] is not j["a"]
+	assert snap["x"] is j["x"]
+	assert snap["a"]["c"] is j["a"]["c"]
+
+	# with_set leaves the handle unchanged
+	snap2 = snap.with_set(("x", "y", "z"), 5)
+	assert snap["x", "y", "z"] == 1
+	assert snap2["x", "y", "z"] == 5
+	assert snap2["a"] is snap["a"]
+
+	# mapped and filtered on copy-on-write handles
+	mapped = snap.at("a", "c").mapped(lambda l: l + [3])
+	assert mapped.get() == [1, 2, 3]
+	assert snap.at("a", "c").get() == [1, 2]
+	assert mapped.at("x").get() is j["x"]
+	filtered = snap.at("a", "c").filtered(lambda v: v > 1)
+	assert filtered.get() == [2]
+	assert snap.at("a", "c").get() == [1, 2]
+
+	# Wildcard writes and pop
+	snap3 = pd(j).snapshot()
+	snap3.at("*", "new").set(0)
+	snap3.at("a", "c", "*").map(lambda v: v * 10)
+	assert snap3["*", "new"] == [0, 0]
+	assert snap3["a", "c"] == [10, 20]
+	assert snap3.at("a").pop("b") == 1
+	assert snap3.at("a").pop("b", "default") == "default"
+	assert j == {"a": {"b": 1, "c": [1, 2]}, "x": {"y": {"z": 1}}}
+
+	snap3.at().set({"new": "root"})
+	assert snap3.get() == {"new": "root"}
+	assert j["a"]["b"] == 1
+
+
+def test_extend_insert():
+	p = pd({"a": [1]})
+	log = p["a"]
+	p.at("a").append(2).extend([3, 4]).insert(0, 0)
+	assert p["a"] is log
+	assert log == [0, 1, 2, 3, 4]
+	p.at("b", "c").extend(x for x in range(2))
+	p.at("d").insert(5, "x")
+	assert p.at().get() == {"a": [0, 1, 2, 3, 4], "b": {"c": [0, 1]}, "d": ["x"]}
+	with pytest.raises(TypeError):
+		p.at("b").extend([1])
+	with pytest.raises(TypeError):
+		p.at("b").insert(0, 1)
+
+	# Copy-on-write handles do not mutate the list in place
+	snap = pd({"a": log}).snapshot()
+	snap.at("a").append(5)
+	snap.at("a").insert(0, -1)
+	assert log == [0, 1, 2, 3, 4]
+	assert snap["a"] == [-1, 0, 1, 2, 3, 4, 5]
+
+
+def test_update_in_place():
+	p = pd({"a": {"b": 1}})
+	inner = p["a"]
+	p.at("a").update({"c": 2})
+	assert p["a"] is inner
+	assert inner == {"b": 1, "c": 2}
+	p.at("x").update({"y": 1})
+	assert p["x"] == {"y": 1}
+	with pytest.raises(TypeError):
+		p.at("a", "b").update({"c": 2})
+
+
+def test_merge():
+	config = {"a": {"b": 1, "l": [1, 2], "d": {"e": 1}}, "keep": {"big": [1]}}
+	p = pd(config)
+	keep, a = config["keep"], config["a"]
+	patch = {"a": {"c": {"new": 1}, "l": [2, 3], "d": {"f": 2}}}
+	p.merge(patch, strategy="union")
+	assert config == {"a": {"b": 1, "c": {"new": 1}, "l": [1, 2, 3], "d": {"e": 1, "f": 2}}, "keep": {"big": [1]}}
+	assert config["keep"] is keep
+	assert config["a"] is a
+	# Inserted parts are copies of the patch
+	assert config["a"]["c"] is not patch["a"]["c"]
+
+	p.at("a", "l").merge([3, 4], strategy="append")
+	assert config["a"]["l"] == [1, 2, 3, 3, 4]
+	p.at("a").merge({"l": [0]})
+	assert config["a"]["l"] == [0]
+	p.at("a", "l").merge([5])
+	assert config["a"]["l"] == [5]
+	p.at("a", "m").merge({"x": 1})
+	assert config["a"]["m"] == {"x": 1}
+	p.at("a", "u").merge([[1], [2]], strategy="union")
+	p.at("a", "u").merge([[2], [3]], strategy="union")
+	assert config["a"]["u"] == [[1], [2], [3]]
+
+	with pytest.raises(ValueError):
+		p.at().merge({}, strategy="invalid")
+	with pytest.raises(TypeError):
+		p.at().merge([1])
+
+	# Copy-on-write handles only copy the merged path
+	snap = pd(config).snapshot()
+	snap.merge({"a": {"b": 2}})
+	assert config["a"]["b"] == 1
+	assert snap["a", "b"] == 2
+	assert snap["keep"] is keep
+
+
+def test_get_many():
+	p = pd(dummy_data.get_users())
+	assert p.get_many([("users", "1", "name"), ("users", "1", "age"), "total_users", ("follows", 0, 1)]) == [
+		"Joe",
+		22,
+		3,
+		"Sue",
+	]
+	assert p.get_many([("users", "9", "name"), ()], default="default") == ["default", p.data]
+	assert p.get_many([("users", "*", "age")]) == [[22, 49, 32]]
+	assert p.get_many([("follows", 0, 1), ("follows", "0", -1), ("follows", -3, "1")]) == ["Sue", "Sue", "Sue"]
+	with pytest.raises(KeyError):
+		p.get_many([("follows", "x")])
+
+
+def test_set_many():
+	p = pd({"a": {"b": 1}, "l": [1, 2]})
+	p.set_many({("a", "c"): 2, ("x", "y", "z"): 3, ("l", 1): 20, ("a", "d"): None})
+	assert p.get() == {"a": {"b": 1, "c": 2}, "x": {"y": {"z": 3}}, "l": [1, 20]}
+
+	# Writes are applied as if one by one
+	p.set_many({("n", "m"): 1, "n": {"o": 2}})
+	assert p["n"] == {"o": 2}
+	p.set_many({"n": {"o": 2}, ("n", "m"): 1})
+	assert p["n"] == {"o": 2, "m": 1}
+	p.set_many({("a", "*"): 0, (): {"new": 1}, "after": 2})
+	assert p.get() == {"new": 1, "after": 2}
+
+	with pytest.raises(KeyError):
+		p.set_many({("new", "x", "y"): 1})
+	with pytest.raises(KeyError):
+		pd({"l": [1]}).set_many({("l", 5): 1})
+	# Also if a later write replaces the invalid one
+	with pytest.raises(KeyError):
+		pd({"l": [1]}).set_many({("l", 5, "x"): 1, ("l",): []})
+	with pytest.raises(KeyError):
+		pd({"a": 1}).set_many({("a", "x", "y"): 1, ("a",): {}})
+
+	# List index aliases are the same slot, like in sequential writes
+	for items in [
+		{("l", 0, "x"): 1, ("l", "0"): {"y": 1}, ("l", 0, "z"): 2},
+		{("l", -1): {"a": 1}, ("l", 1, "b"): 2, ("l", "-1", "c"): 3},
+		{("l", True): {"a": 1}, ("l", 1, "b"): 2},
+		{("l", "1", "x"): 1, "l": [{}, {}], ("l", 1, "b"): 2, ("l", "1", "c"): 3},
+	]:
+		sequential = pd({"l": [{}, {}]})
+		for path, value in items.items():
+			sequential[path] = value
+		assert pd({"l": [{}, {}]}).set_many(items).get() == sequential.get()
+
+	p = pd({"a": {"n": 1}, "b": {"n": 2}})
+	p.map_many({("a", "n"): lambda n: n + 1, ("b", "n"): lambda n: n * 10, ("c", "n"): lambda n: (n or 0) + 1})
+	assert p.get() == {"a": {"n": 2}, "b": {"n": 20}, "c": {"n": 1}}
+	with pytest.raises(ValueError):
+		p.map_many({("*", "n"): lambda n: n})
+
+	snap = p.snapshot()
+	snap.set_many({("a", "n"): 0, ("a", "m"): 0})
+	assert p["a"] == {"n": 2}
+	assert snap["a"] == {"n": 0, "m": 0}
+	assert snap["b"] is p["b"]
+
+
+def test_item_access_keeps_handle():
+	p = pd({"a": {"b": 1}, "c": [1, 2]})
+	handle = p.at("a")
+	assert handle["c", 1] == 2
+	assert ("a", "b") in handle
+	assert "x" not in handle
+	handle["c", 0] = lambda x: x + 10
+	handle["a", "*"] = 5
+	assert handle.path_handle.path == ["a"]
+	assert handle.get() == {"b": 5}
+	assert p.data == {"a": {"b": 5}, "c": [11, 2]}
+
+
+def test_threadsafe():
+	with pytest.raises(ValueError):
+		pd({}, threadsafe=True, copy_on_write=True)
+
+	p = pd({"users": {"1": {"n": 0}}, "tasks": {}}, threadsafe=True)
+	assert isinstance(p, ThreadSafePathDict)
+	# at() returns a new handle on the same data
+	users = p.at("users")
+	assert users is not p
+	assert p.path_handle.path == []
+	assert users.at("users", "1", "n").get() == 0
+	assert p.at("*", "1", "n").gather() == [0, None]
+	assert p.deepcopy().get() == p.get()
+
+	index = p.at("tasks").create_index("owner")
+
+	def work(i):
+		for j in range(200):
+			p["counters", str(i % 4)] = lambda x: (x or 0) + 1
+			p.at("tasks").set_many({("tasks", f"{i}-{j}"): {"owner": i}})
+			assert p["users", "1", "n"] == 0
+			assert len(p.at("tasks").items()) > 0
+
+	threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert p["counters"] == {"0": 400, "1": 400, "2": 400, "3": 400}
+	assert len(p["tasks"]) == 1600
+	assert len(index.lookup(3)) == 200
+
+	# Readers cannot upgrade to writers
+	with p.lock.read():
+		with pytest.raises(RuntimeError):
+			p["x"] = 1
+	p["x"] = 1
+	assert p["x"] == 1
+
+	# Callbacks can only use other top-level keys in a transaction, since
+	# waiting for their locks could deadlock. Int keys have fixed stripes.
+	p = pd({1: 1, 2: 2}, threadsafe=True)
+	p.at(1).map(lambda v: v + p[1])
+	with pytest.raises(RuntimeError):
+		p.at(1).map(lambda v: p[2])
+	with pytest.raises(RuntimeError):
+		p.at(1).map(lambda v: p.set_many({(2,): v}))
+	with p.transaction():
+		p.at(1).map(lambda v: v + p[2])
+	assert p.get() == {1: 4, 2: 2}
+
+
+def _add_count(key, value, agg):
+	return agg + value["n"]
+
+
+def test_parallel_reduce():
+	data = {str(i): {"n": i, "kind": "even" if i % 2 == 0 else "odd"} for i in range(100)}
+	p = pd(data)
+	with ThreadPoolExecutor(4) as executor:
+		total = p.reduce(lambda k, v, a: a + v["n"], 0, combine=operator.add, executor=executor)
+		assert total == sum(range(100))
+
+		# Each shard starts with a copy of the aggregate
+		def count(k, v, a):
+			a[v["kind"]] = a.get(v["kind"], 0) + 1
+			return a
+
+		hist = p.reduce(count, {}, combine=aggregate.combine_counts, executor=executor)
+		assert hist == {"even": 50, "odd": 50}
+		assert pd(list(range(10))).reduce(lambda v, a: a + [v], [], combine=operator.add, executor=executor) == list(
+			range(10)
+		)
+		assert pd([]).reduce(lambda v, a: a + v, 0, combine=operator.add, executor=executor) == 0
+		with pytest.raises(ValueError):
+			p.reduce(lambda k, v, a: a, 0, executor=executor)
+
+		assert p.count_by("kind", executor=executor) == p.count_by("kind")
+		assert p.group_by("kind", executor=executor) == p.group_by("kind")
+		assert list(p.group_by("kind", executor=executor)["odd"]) == list(p.group_by("kind")["odd"])
+		aggregations = {"n": "sum", ("n",): "max", "kind": "count"}
+		assert p.aggregate_by("kind", {"n": "mean"}, executor=executor) == p.aggregate_by("kind", {"n": "mean"})
+		assert p.aggregate_by("kind", aggregations, executor=executor) == p.aggregate_by("kind", aggregations)
+		assert pd(list(range(100))).sum(executor=executor) == 4950
+		assert p.at("*", "n").sum(executor=executor) == 4950
+		assert p.at("*").count_by("kind", executor=executor) == {"even": 50, "odd": 50}
+		assert p.at("*", "n").reduce(lambda v, a: a + v, 0, combine=operator.add, executor=executor) == 4950
+
+	assert p.at().reduce(_add_count, 0, combine=operator.add, workers=2) == 4950
+	assert p.at("*", "n").sum(workers=2) == 4950
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dump(monkeypatch, use_orjson):
+	if not use_orjson:
+		monkeypatch.setattr(serialize, "orjson", None)
+	db = {"a": {"b": [1, 2.5, None, True]}, "c": "ü", 1: []}
+	expected = json.loads(json.dumps(db))
+	p = pd(db)
+	assert json.loads(p.dumps()) == expected
+	assert json.loads(p.dump_at(("a", "b"))) == [1, 2.5, None, True]
+	assert json.loads(p.at("a").dumps()) == {"b": [1, 2.5, None, True]}
+
+	for fp in (io.StringIO(), io.BytesIO()):
+		p.at().dump(fp)
+		assert json.loads(fp.getvalue()) == expected
+	fp = io.BytesIO()
+	p.dump_at("a", fp)
+	assert json.loads(fp.getvalue()) == {"b": [1, 2.5, None, True]}
+
+	with pytest.raises(ValueError):
+		p.dumps(format="yaml")
+	if serialize.msgpack is None:
+		with pytest.raises(ImportError):
+			p.dumps(format="msgpack")
+
+
+def test_bounded_repr():
+	p = pd({str(i): {"value": i} for i in range(100_000)})
+	assert len(repr(p)) < serialize.REPR_MAX_CHARS + 100
+	assert repr(p).endswith("..., self.path_handle = Path(path=[], raw=False))")
+	assert len(repr(p.at("*"))) < 10_000
+	# Objects that are not JSON serializable are shown with repr
+	assert "TestObject" in repr(pd({"a": type("TestObject", (), {})()}))
+
+
+def test_journal():
+	p = pd({"a": {"b": 1, "l": [1]}, "c": 1})
+	journal = p.journal()
+	coalesced = p.journal(coalesce=True)
+	p["a", "b"] = 2
+	p.at("a", "l").append(2)
+	p.at("a", "l", "*").map(lambda x: x * 10)
+	p.set_many({("c",): 2, ("d",): {"e": 1}})
+	p.at().pop("c")
+	p["a", "b"] = 4
+
+	assert journal.drain_changes() == [
+		Change(("a", "b"), 1, 2),
+		Change(("a", "l", 1), None, [2], "insert"),
+		Change(("a", "l", 0), 1, 10),
+		Change(("a", "l", 1), 2, 20),
+		Change(("c",), 1, 2),
+		Change(("d",), None, {"e": 1}),
+		Change(("c",), 2, None),
+		Change(("a", "b"), 2, 4),
+	]
+	assert journal.drain_changes() == []
+	# Writes before the insert are not collapsed with writes after it
+	assert coalesced.dirty_paths() == [("a", "l", 0), ("a", "l", 1), ("d",), ("c",), ("a", "b")]
+	assert coalesced.drain_changes()[-1] == Change(("a", "b"), 2, 4)
+	assert len(coalesced) == 0
+
+	# Appends only record the appended items
+	p = pd({"l": list(range(1000))})
+	journal = p.journal()
+	coalesced = p.journal(coalesce=True)
+	for i in range(100):
+		p.at("l").append({"i": i})
+	p.at("*").append(-1)
+	p.at("l").insert(-1, "x")
+	p.at("*").insert(0, "y")
+	changes = journal.drain_changes()
+	assert all(change.op == "insert" and len(change.new) == 1 for change in changes)
+	assert changes[-3:] == [
+		Change(("l", 1100), None, [-1], "insert"),
+		Change(("l", 1100), None, ["x"], "insert"),
+		Change(("l", 0), None, ["y"], "insert"),
+	]
+	assert coalesced.drain_changes()[0] == Change(("l", 1000), None, [{"i": i} for i in range(100)] + [-1], "insert")
+	changes[0].new[0]["i"] = 5
+	assert p["l", 1001, "i"] == 0
+
+	cow = pd({"a": [1]}, copy_on_write=True)
+	journal = cow.journal()
+	cow.at("a").append(2)
+	cow.at().set({"b": 1})
+	assert journal.drain_changes() == [Change(("a",), [1], [1, 2]), Change((), {"a": [1, 2]}, {"b": 1})]
+	# Popping a missing key leaves nothing pending in the journal
+	assert cow.at().pop("missing", 0) == 0
+	assert journal.drain_changes() == [] and journal._pending == {}
+
+
+def test_diff_patch():
+	shared = {"big": list(range(100))}
+	a = {"a": 1, "l": [1, 2, 3, 4], "d": {"x": 1, "y": [1, {"z": 1}]}, "s": shared, "t": 1}
+	b = {"l": [1, 5, 3, 9, 4], "d": {"x": 2, "y": [1, {"z": 2}], "w": None}, "s": shared, "t": True}
+	ops = pd(a).diff(pd(b))
+	assert ops == [
+		("delete", ("a",), None),
+		("insert", ("l", 3), 9),
+		("set", ("l", 1), 5),
+		("set", ("d", "w"), None),
+		("set", ("d", "x"), 2),
+		("set", ("d", "y", 1, "z"), 2),
+		("set", ("t",), True),
+	]
+	assert pd(a).diff(a) == []
+
+	for x, y in [(a, b), (b, a), ({"l": [1, 2, 3]}, {"l": [3]}), ([1, [2]], [[2], 1, 1])]:
+		p = pd(copy.deepcopy(x))
+		journal = p.journal()
+		assert p.patch(p.diff(y)).get() == y
+		assert len(journal) > 0
+		cow = pd(x, copy_on_write=True)
+		before = copy.deepcopy(x)
+		assert cow.patch(cow.diff(y)).get() == y
+		assert x == before
+
+	p = pd({"a": {"b": [1]}})
+	p.at("a").patch([("insert", ("b", 0), 0), ("set", ("c",), 1)])
+	assert p.at().get() == {"a": {"b": [0, 1], "c": 1}}
+	with pytest.raises(ValueError):
+		p.patch([("move", ("a",), None)])
+	with pytest.raises(KeyError):
+		p.patch([("remove", ("a", "b", 5), None)])
+
+
+def test_transaction():
+	data = {"a": {"b": 1, "l": [1, 2]}, "c": {"d": 1}}
+	before = copy.deepcopy(data)
+	p = pd(data)
+	index = p.at("a").create_index("x")
+	with pytest.raises(KeyError):
+		with p.at().transaction():
+			p["a", "b"] = 2
+			p["new", "x", "y"] = 1
+			p.at("a", "l").append(3)
+			p.at("a", "l").append(4)
+			p.at("c").pop("d")
+			p.at("a").update({"e": {"x": 1}})
+			p.at("*", "b").set(5)
+			p["a", "l", 9] = 1
+	assert p.at().get() == before
+	assert index.lookup(1) == []
+	assert len(p.at("a", "l").transactions) == 0
+
+	with p.at().transaction():
+		p["a", "b"] = 2
+		with pytest.raises(ValueError):
+			with p.transaction():
+				p["c", "d"] = 2
+				raise ValueError()
+	assert p.at().get() == {**before, "a": {**before["a"], "b": 2}}
+
+	cow = pd({"a": [1]}, copy_on_write=True)
+	with pytest.raises(KeyError):
+		with cow.transaction():
+			cow.at("a").append(2)
+			cow["a", 5] = 1
+	assert cow.at().get() == {"a": [1]}
+
+	shared = pd({"a": 1}, threadsafe=True)
+	with pytest.raises(ZeroDivisionError):
+		with shared.transaction():
+			shared["a"] = 2
+			shared["b"] = 1 / 0
+	assert shared.get() == {"a": 1}
+
+	# Wildcard writes on a handle without indexes or journals
+	data = {"a": {"x": 1, "l": [1]}, "b": {"x": 2, "l": [2]}}
+	p = pd(data)
+	with pytest.raises(RuntimeError):
+		with p.transaction():
+			p.at("*", "x").set(99)
+			p["*", "x"] = 5
+			p.at("*", "x").map(lambda x: x + 1)
+			p.at("*", "l").append(3)
+			raise RuntimeError()
+	assert p.at().get() == {"a": {"x": 1, "l": [1]}, "b": {"x": 2, "l": [2]}}
@@ -1,7 +1,9 @@
+import copy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pytest
 
-from path_dict import pd
-from tests import dummy_data
+from path_dict import arrays, pd, where
 
 
 def test_get_all():
@@ -203,3 +205,200 @@ def test_set():
 	assert p["users", "1", "blip"] == "blap"
 	assert p["users", "2", "blip"] == "blap"
 	assert p["users", "3", "blip"] == "blap"
+
+
+def test_single_pass_traversal():
+	p = pd({"a": {"x": [1, 2]}, "b": {"x": [3]}, "c": {}})
+	assert p.at("*", "x", "*").gather(include_paths=True) == [
+		(("a", "x", 0), 1),
+		(("a", "x", 1), 2),
+		(("b", "x", 0), 3),
+	]
+	# Missing keys after the last wildcard are gathered as None
+	assert p.at("*", "y", "z").gather() == [None, None, None]
+
+	# Set creates missing dicts after the last wildcard
+	p.at("*", "y", "z").set(0)
+	assert p["c"] == {"y": {"z": 0}}
+	p.at("*", "x", "*").map(lambda x: x * 10)
+	assert p.at("*", "x").gather() == [[10, 20], [30], None]
+
+	with pytest.raises(KeyError):
+		p.at("*", "x", "key").set(1)
+
+	# Nothing is written if a later branch raises
+	p = pd({"a": {}, "b": {"x": [1]}})
+	journal = p.journal()
+	with pytest.raises(KeyError):
+		p.at("*", "x", "key").set(1)
+	with pytest.raises(KeyError):
+		p.at("*", "x", 5).set(1)
+	assert p.at().get() == {"a": {}, "b": {"x": [1]}}
+	assert journal.drain_changes() == []
+
+
+def test_iterators():
+	p = pd({"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}})
+	values = p.at("*", "n").iter_values()
+	assert next(values) == 1
+	assert list(values) == [2, 3]
+	assert list(p.at("*", "n").iter_paths()) == [("a", "n"), ("b", "n"), ("c", "n")]
+	assert list(p.at("*", "n").iter_items()) == [(("a", "n"), 1), (("b", "n"), 2), (("c", "n"), 3)]
+
+	assert p.at("*", "n").reduce(lambda v, a: a + v, 0) == 6
+	assert p.at("*", "n").reduce(lambda k, v, a: a + [k[0]], [], as_type="dict") == ["a", "b", "c"]
+	assert p.at("*", "n").filter(lambda v: v > 1).get() == [2, 3]
+	assert p.at("*", "n").filter(lambda k, v: k[0] == "a", as_type="dict").get() == {("a", "n"): 1}
+	assert p.at("*", "n").filter(lambda kv: kv[1] == 3, include_paths=True).get() == [(("c", "n"), 3)]
+
+
+def test_append():
+	p = pd({"a": {"l": [1]}, "b": {}})
+	first = p["a", "l"]
+	p.at("*", "l").append(2)
+	p.at("*", "l").extend([3, 4])
+	p.at("*", "l").insert(0, 0)
+	assert p["a", "l"] is first
+	assert p.at("*", "l").gather() == [[0, 1, 2, 3, 4], [0, 2, 3, 4]]
+	with pytest.raises(TypeError):
+		p.at("*").append(1)
+
+	snap = p.snapshot()
+	snap.at("*", "l").append(5)
+	assert first == [0, 1, 2, 3, 4]
+	assert snap["a", "l"] == [0, 1, 2, 3, 4, 5]
+
+
+def _square(x):
+	return x * x
+
+
+def test_parallel_map_filter():
+	data = {str(i): {"n": i} for i in range(50)}
+	with ThreadPoolExecutor(4) as executor:
+		p = pd(copy.deepcopy(data))
+		p.at("*", "n").map(lambda x: x + 1, executor=executor, chunksize=3)
+		assert p.at("*", "n").gather() == list(range(1, 51))
+
+		snap = pd(data).snapshot()
+		snap.at("*", "n").map(lambda x: None if x % 2 else x * 10, executor=executor)
+		assert snap["4", "n"] == 40 and snap["5", "n"] == 5
+		assert data["4"]["n"] == 4
+
+		evens = pd(data).at("*", "n").parallel_filter(lambda x: x % 2 == 0, executor, chunksize=7)
+		assert evens.get() == pd(data).at("*", "n").filter(lambda x: x % 2 == 0).get()
+		by_path = pd(data).at("*", "n").parallel_filter(lambda path, x: x < 2, executor, as_type="dict")
+		assert by_path.get() == {("0", "n"): 0, ("1", "n"): 1}
+		with pytest.raises(ValueError):
+			pd(data).at("*", "n").map(_square, executor=executor, chunksize=0)
+
+	with ProcessPoolExecutor(2) as executor:
+		p = pd(copy.deepcopy(data))
+		p.at("*", "n").map(_square, executor=executor)
+		assert p.at("*", "n").gather() == [i * i for i in range(50)]
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_statistics(monkeypatch, with_numpy):
+	if with_numpy:
+		pytest.importorskip("numpy")
+	else:
+		monkeypatch.setattr(arrays, "numpy", None)
+	orders = pd({"o1": {"amount": 10}, "o2": {"amount": 30}, "o3": {}, "o4": {"amount": 20}})
+	amounts = orders.at("*", "amount")
+	assert amounts.sum() == 60
+	assert isinstance(amounts.sum(), int)
+	assert amounts.mean() == 20.0
+	assert amounts.min() == 10 and isinstance(amounts.min(), int)
+	assert amounts.max() == 30 and isinstance(amounts.max(), int)
+	assert pd([2**60 + 1, 2**60]).at("*").max() == 2**60 + 1
+	assert pd({}).at("*").min() is None
+	assert amounts.quantile(0.5) == 20.0
+	assert amounts.quantile([0, 0.25, 1]) == [10.0, 15.0, 30.0]
+	with pytest.raises(ValueError):
+		amounts.quantile(2)
+	assert pd({}).at("*", "amount").mean() is None
+	assert pd({}).at("*", "amount").sum() == 0
+	assert pd([{"x": 0.5}, {"x": 1}, {"x": 4}]).at("*", "x").quantile([0.5, 0.75]) == [1.0, 2.5]
+	if not with_numpy:
+		with pytest.raises(ImportError):
+			amounts.to_array()
+
+
+def test_to_array():
+	np = pytest.importorskip("numpy")
+	orders = pd({"o1": {"amount": 10, "meta": {"items": 1}}, "o2": {"amount": 30}})
+	assert orders.at("*", "amount").to_array().tolist() == [10.0, 30.0]
+	assert orders.at("*", "amount").to_array(dtype=np.int64).dtype == np.int64
+	with pytest.raises(ValueError):
+		orders.at("*", "meta", "items").to_array()
+	assert orders.at("*", "meta", "items").to_array(fill=0).tolist() == [1.0, 0.0]
+
+	cols = orders.at().columns(["amount", ["meta", "items"]], fill=-1)
+	assert cols["amount"].tolist() == [10.0, 30.0]
+	assert cols["meta", "items"].tolist() == [1.0, -1.0]
+
+
+def test_recursive_wildcard():
+	db = {"email": "r", "a": {"email": "a", "l": [{"email": "l0"}, {"x": {"email": "x"}}, 5]}, "s": "scalar"}
+	assert pd(db).at("**", "email").gather(include_paths=True) == [
+		(("email",), "r"),
+		(("a", "email"), "a"),
+		(("a", "l", 0, "email"), "l0"),
+		(("a", "l", 1, "x", "email"), "x"),
+	]
+	assert pd(db).at("a", "l", "**").gather() == [{"email": "l0"}, {"x": {"email": "x"}}, 5, "l0", {"email": "x"}, "x"]
+	assert pd(db).at("**", "l", "**", "email").gather() == ["l0", "x"]
+	assert pd(db).at("**", "**", "email").gather() == ["r", "a", "l0", "x"]
+	assert pd(db).at("**", 1, "*").gather() == [{"email": "x"}]
+
+	# Cycles are not followed again
+	db["a"]["self"] = db
+	assert pd(db).at("**", "email").gather() == ["r", "a", "l0", "x"]
+
+	p = pd(db)
+	p.at("**", "email").map(str.upper)
+	p.at("**", "x", "email").set("changed")
+	assert pd(db).at("**", "email").gather() == ["R", "A", "L0", "changed"]
+
+
+def test_selectors():
+	tasks = {
+		"t1": {"status": "open", "owner": "u1", "tags": ["a", "b", "c"]},
+		"t2": {"status": "done", "owner": "u2", "tags": ["b"]},
+		"t3": {"status": "open", "owner": "u3", "tags": []},
+	}
+	assert pd(tasks).at("[t1|t3|t9]", "owner").gather() == ["u1", "u3"]
+	assert pd(tasks)["[t2|t1]", "owner"] == ["u2", "u1"]
+	assert pd(tasks).at("*", "tags", slice(-2, None)).gather(include_paths=True) == [
+		(("t1", "tags", 1), "b"),
+		(("t1", "tags", 2), "c"),
+		(("t2", "tags", 0), "b"),
+	]
+	assert pd(tasks).at("t1", "tags", "[0|-1]").gather() == ["a", "c"]
+	piped = pd({"a|b": 1, "[a|b]": 2, "a": 3})
+	assert piped["a|b"] == 1
+	assert piped.at("a|b").get() == 1
+	piped["a|b"] = 4
+	assert piped["[a|b]"] == [3]
+	assert piped.at("[a|b]", raw=True).get() == 2
+	assert piped.at().get() == {"a|b": 4, "[a|b]": 2, "a": 3}
+
+	visited = []
+
+	def is_open(task):
+		visited.append(task["owner"])
+		return task["status"] == "open"
+
+	assert pd(tasks).at(where(is_open), "owner").gather() == ["u1", "u3"]
+	assert visited == ["u1", "u2", "u3"]
+	assert pd(tasks).at("**", where(lambda v: v == "b")).gather(include_paths=True) == [
+		(("t1", "tags", 1), "b"),
+		(("t2", "tags", 0), "b"),
+	]
+
+	p = pd(copy.deepcopy(tasks))
+	p.at(where(lambda t: t["status"] == "open"), "status").set("closed")
+	p["*", "tags", slice(0, 1)] = str.upper
+	assert p.at("*", "status").gather() == ["closed", "done", "closed"]
+	assert p.at("*", "tags").gather() == [["A", "b", "c"], ["B"], []]
@@ -1,4 +1,7 @@
-from path_dict.path import Path
+import pytest
+
+from path_dict import where
+from path_dict.path import CompiledPath, Path, compile_path, select_keys
 
 
 def test_Path():
@@ -8,3 +11,56 @@ def test_Path():
 	assert Path("test", "*").has_wildcards
 	# A Path without wildcards expands to a list of itself
 	assert path.expand({}) == [path]
+
+
+def test_compile_path():
+	compiled = compile_path(("users", "", "1", "*"))
+	assert compiled.keys == ("users", "1", "*")
+	assert compiled.wildcards == (2,)
+	assert compiled.has_wildcards
+	# Compiled paths are cached and hashable
+	assert compile_path(("users", "", "1", "*")) is compiled
+	assert hash(compiled) == hash(CompiledPath(("users", "1", "*")))
+	assert Path("users", "", "1", "*").compiled is compiled
+	# Raw paths have no wildcards
+	assert not compile_path(("users", "*"), raw=True).has_wildcards
+	# Unhashable keys are compiled without the cache
+	assert compile_path((["a"],)).keys == (["a"],)
+
+
+def test_compiled_get_set():
+	data = {"a": [{"b": 1}]}
+	assert compile_path(("a", "0", "b")).get(data) == 1
+	assert compile_path(("a", 0, "c")).get(data, "default") == "default"
+	compile_path(("a", "0", "c", "d")).set(data, 2)
+	assert data == {"a": [{"b": 1, "c": {"d": 2}}]}
+	with pytest.raises(KeyError):
+		compile_path(("a", "x")).get(data)
+	with pytest.raises(KeyError):
+		compile_path(("a", 5)).set(data, 1)
+
+
+def test_selectors():
+	open_task = where(lambda t: t["status"] == "open")
+	compiled = compile_path(("[a|b]", "[0|-1]", slice(1, None), open_task, "**", "x"))
+	assert compiled.wildcards == (0, 1, 2, 3, 4)
+	assert compiled.recursive == (4,)
+	assert compiled.selectors == (
+		(("a", None), ("b", None)),
+		(("0", 0), ("-1", -1)),
+		slice(1, None),
+		open_task,
+		None,
+		None,
+	)
+	assert not compile_path(("[a|b]",), raw=True).has_wildcards
+	# Keys with "|" are only alternatives in brackets
+	assert not compile_path(("a|b", "[a]", "a|[b]")).has_wildcards
+
+	assert select_keys(compiled.selectors[0], {"b": 1, "c": 2, "a": 3}) == ["a", "b"]
+	assert select_keys(compiled.selectors[1], [1, 2, 3]) == [0, 2]
+	assert select_keys(compiled.selectors[1], [1]) == [0]
+	assert select_keys(compiled.selectors[2], [1, 2, 3]) == [1, 2]
+	assert select_keys(compiled.selectors[2], {"a": 1}) == []
+	tasks = {"t1": {"status": "open"}, "t2": {"status": "done"}, "t3": 5}
+	assert select_keys(open_task, tasks) == ["t1"]
@@ -0,0 +1,74 @@
+from path_dict import pd, where
+from path_dict.mapped import MappedPathDict
+from path_dict.shared import SharedPathDict
+from path_dict.sqlite import SQLitePathDict
+
+DATA = {
+	"users": {
+		"1": {"name": "Joe", "age": 22, "tags": ["a", "b"], "boss": None},
+		"2": {"name": "Ben", "age": 49, "tags": [], "nested": {"name": "inner"}},
+		"3": {"name": "Sue", "age": 32, "tags": ["c"]},
+	},
+	"scalar": 1,
+	"list": [{"name": "x"}, 2, [3, {"name": "y"}]],
+	"a|b": 1,
+}
+
+PATHS = [
+	("users", "1", "name"),
+	("users", "9", "name"),
+	("users", "1", "tags", -1),
+	("users", "1", "tags", 5),
+	("users", "1", "tags", "x"),
+	("users", "1", "name", "x"),
+	("users", "1", "boss", "x"),
+	("scalar", "x"),
+	("a|b",),
+	("*",),
+	("users", "*", "name"),
+	("users", "*", "missing", "x"),
+	("users", "*", "tags", 0),
+	("users", "*", "tags", slice(-1, None)),
+	("users", "[1|3|9]", "age"),
+	("list", "[0|-1|7]"),
+	("list", "*", "name"),
+	("users", where(lambda u: u["age"] > 30), "name"),
+	("*", slice(None)),
+	("*", "*"),
+	("*", "[name|1]"),
+	("**", "name"),
+	("**", 1),
+	("**", "tags", 0),
+	("users", "**"),
+	("list", "**"),
+	("**", "**", "name"),
+	("**", where(lambda v: v == 2)),
+	(where(lambda v: isinstance(v, list)),),
+	("[list|users|extra]", "[0|1]"),
+]
+
+
+def _result(backend, path):
+	try:
+		return backend[path]
+	except KeyError:
+		return KeyError
+
+
+def test_backends_match(tmp_path):
+	mapped = MappedPathDict.create(str(tmp_path / "db.pdb"), DATA)
+	sqlite = SQLitePathDict.create(str(tmp_path / "db.sqlite"), DATA)
+	with mapped, sqlite, SharedPathDict.create(DATA) as shared:
+		for path in PATHS:
+			expected = _result(pd(DATA), path)
+			for backend in [mapped, shared, sqlite]:
+				assert _result(backend, path) == expected, (type(backend).__name__, path)
+
+		# The overlay of written top-level values is matched like the file
+		mapped["users", "4"] = {"name": "Ann", "age": 40, "tags": ["d"]}
+		mapped["extra"] = [{"name": "z"}]
+		written = pd(DATA).deepcopy()
+		written["users", "4"] = {"name": "Ann", "age": 40, "tags": ["d"]}
+		written["extra"] = [{"name": "z"}]
+		for path in PATHS:
+			assert _result(mapped, path) == _result(written, path), path
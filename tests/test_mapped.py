@@ -0,0 +1,136 @@
+import io
+import json
+import os
+
+import pytest
+
+from path_dict import pd, where
+from path_dict.binary_path_dict import _Offset
+from path_dict.mapped import MappedPathDict
+from tests import dummy_data
+
+
+def test_mapped_reads(tmp_path):
+	db = dummy_data.get_db()
+	filename = str(tmp_path / "db.pdb")
+	with MappedPathDict.create(filename, db) as m:
+		assert m.get() == db
+		assert m.at("users", "1", "name").get() == db["users"]["1"]["name"]
+		assert m.at("users", "missing").get("default") == "default"
+		assert m["users", "2", "friends"] == db["users"]["2"]["friends"]
+		assert m["users", "*", "name"] == pd(db).at("users", "*", "name").gather()
+		assert m.at("users", "*", "age").gather(include_paths=True) == pd(db).at("users", "*", "age").gather(
+			include_paths=True
+		)
+		assert m.at("users").keys() == list(db["users"])
+		assert len(m.at("users")) == len(db["users"])
+		assert ("users", "1") in m and ("users", "x") not in m
+		assert m["**", "name"] == pd(db).at("**", "name").gather()
+		for path in [
+			("users", "[1|2]", "name"),
+			("users", "*", "friends", slice(-1, None)),
+			("users", where(lambda u: u["age"] > 30), "name"),
+		]:
+			assert m[path] == pd(db)[path]
+		assert m.at("users", "**").gather(include_paths=True) == pd(db).at("users", "**").gather(include_paths=True)
+		assert (
+			m.at("users").filter(lambda k, v: v["age"] > 30).get()
+			== pd(db).at("users").filtered(lambda k, v: v["age"] > 30).get()
+		)
+		assert m.at("users", "*", "age").filter(lambda age: age > 30).get() == [
+			a for a in pd(db).at("users", "*", "age").gather() if a > 30
+		]
+		with pytest.raises(KeyError):
+			m["users", "1", "name", "x"]
+		with pytest.raises(ValueError):
+			m.at("users", "*").get()
+
+
+def test_mapped_writes(tmp_path):
+	db = {"a": {"b": 1, "c": [1, 2]}, "d": "x"}
+	filename = str(tmp_path / "db.pdb")
+	m = MappedPathDict.create(filename, db)
+	other = MappedPathDict(filename)
+
+	m["a", "b"] = 2
+	m.at("e", "f").set({"g": [True]})
+	m["a", "c", -1] = 3
+	assert m.at().get() == {"a": {"b": 2, "c": [1, 3]}, "d": "x", "e": {"f": {"g": [True]}}}
+	assert m["a", "*"] == [2, [1, 3]]
+	assert m["e", "*", "g"] == [[True]]
+	with pytest.raises(KeyError):
+		m["d", "x", "y"] = 1
+	with pytest.raises(TypeError):
+		m.at().set([])
+	# Values that cannot be encoded are not applied
+	with pytest.raises(TypeError):
+		m["a", "b"] = {1, 2}
+	assert m["a", "b"] == 2
+
+	# Other processes see the writes after a refresh
+	assert other["a", "b"] == 1
+	assert other.refresh()["a", "b"] == 2
+	assert other.get() == m.get()
+	other.close()
+
+	# Reopening replays the log, compacting merges it into the file
+	m.close()
+	m = MappedPathDict(filename)
+	assert m["e", "f", "g", 0] is True
+	m.compact()
+	assert not os.path.exists(filename + ".log")
+	assert m.overlay == {}
+	assert m.at().get() == {"a": {"b": 2, "c": [1, 3]}, "d": "x", "e": {"f": {"g": [True]}}}
+
+	m.at().set({"new": 1})
+	assert m.get() == {"new": 1}
+	m["new"] = 2
+	m.close()
+	with MappedPathDict(filename) as m:
+		assert m.get() == {"new": 2}
+
+
+def test_mapped_partial_writes(tmp_path):
+	db = {"users": {"u1": {"name": "a", "tags": [1]}, "u2": {"name": "b", "tags": [2]}}, "n": [{"x": 1}, {"x": 2}]}
+	filename = str(tmp_path / "db.pdb")
+	m = MappedPathDict.create(filename, db)
+	other = MappedPathDict(filename)
+	expected = pd(db).deepcopy()
+
+	m["users", "u1", "name"] = "c"
+	m["n", -1, "x"] = 3
+	expected["users", "u1", "name"] = "c"
+	expected["n", -1, "x"] = 3
+	# Only the containers along the written paths are decoded
+	assert isinstance(m.overlay["users"]["u2"], _Offset)
+	assert isinstance(m.overlay["users"]["u1"]["tags"], _Offset)
+	assert isinstance(m.overlay["n"][0], _Offset)
+	assert m.at().get() == expected.at().get()
+	assert m["users", "*", "name"] == ["c", "b"]
+	assert m["users", where(lambda u: u["tags"] == [2]), "name"] == ["b"]
+	m["users", "u2", "tags", 0] = 4
+	assert m["users", "u2"] == {"name": "b", "tags": [4]}
+	expected["users", "u2", "tags", 0] = 4
+
+	# Other processes reopen the file after it was compacted
+	assert other.refresh().at().get() == expected.at().get()
+	m.compact()
+	m["users", "u2", "name"] = "d"
+	expected["users", "u2", "name"] = "d"
+	assert other.refresh().at().get() == expected.at().get()
+	other.close()
+	m.close()
+
+
+def test_mapped_from_json(tmp_path):
+	db = dummy_data.get_db()
+	filename = str(tmp_path / "db.pdb")
+	with MappedPathDict.from_json(filename, io.StringIO(json.dumps(db))) as m:
+		assert m.get() == db
+	with MappedPathDict.from_json(filename, io.StringIO("[1, [2], {}]")) as m:
+		assert m.get() == [1, [2], {}]
+		assert m[-1] == {}
+		m[1, 0] = 3
+		assert m.get() == [1, [3], {}]
+		with pytest.raises(KeyError):
+			m[3] = 1
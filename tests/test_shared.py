@@ -0,0 +1,46 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from path_dict import pd
+from path_dict.shared import SharedPathDict
+from tests import dummy_data
+
+
+def _names(shared):
+	return shared.at("users", "*", "name").gather()
+
+
+def test_shared_reads():
+	db = dummy_data.get_db()
+	with SharedPathDict.create(db) as shared:
+		assert shared.get() == db
+		assert shared["users", "1", "name"] == db["users"]["1"]["name"]
+		assert shared.at("users", "missing").get("default") == "default"
+		assert shared.at("users").keys() == list(db["users"])
+		assert len(shared.at("users")) == len(db["users"])
+		assert ("users", "2") in shared
+		with pytest.raises(ValueError):
+			shared.at("users", "*").get()
+
+		attached = pickle.loads(pickle.dumps(shared))
+		assert attached.name == shared.name
+		assert attached["users", "2", "age"] == db["users"]["2"]["age"]
+		attached.close()
+
+		with ProcessPoolExecutor(max_workers=2) as executor:
+			results = list(executor.map(_names, [shared, shared]))
+		assert results == [pd(db).at("users", "*", "name").gather()] * 2
+
+
+def test_shared_lifetime():
+	with pytest.raises(TypeError):
+		SharedPathDict.create("x")
+	shared = SharedPathDict.create([1, "a", {"b": None}])
+	assert shared[-1] == {"b": None}
+	assert shared[1] == "a"
+	shared.close()
+	shared.unlink()
+	with pytest.raises(FileNotFoundError):
+		SharedPathDict(shared.name)
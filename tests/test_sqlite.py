@@ -0,0 +1,107 @@
+import pytest
+
+from path_dict import pd, where
+from path_dict.sqlite import SQLitePathDict
+from tests import dummy_data
+
+
+def test_sqlite_reads(tmp_path):
+	db = dummy_data.get_db()
+	with SQLitePathDict.create(str(tmp_path / "db.sqlite"), db) as s:
+		assert s.get() == db
+		assert s.at("users", "1", "name").get() == db["users"]["1"]["name"]
+		assert s.at("users", "missing").get("default") == "default"
+		assert s["users", "2", "friends"] == db["users"]["2"]["friends"]
+		assert s["users", "2", "friends", -1] == db["users"]["2"]["friends"][-1]
+		assert s["users", "*", "name"] == pd(db).at("users", "*", "name").gather()
+		assert s.at("users", "*", "age").gather(as_type="dict") == pd(db).at("users", "*", "age").gather(as_type="dict")
+		assert s.at("users").keys() == list(db["users"])
+		assert len(s.at("users")) == len(db["users"])
+		assert ("users", "1") in s and ("users", "x") not in s
+		assert s["**", "name"] == pd(db).at("**", "name").gather()
+		for path in [
+			("users", "[1|2]", "name"),
+			("users", "*", "friends", slice(-1, None)),
+			("users", where(lambda u: u["age"] > 30), "name"),
+		]:
+			assert s[path] == pd(db)[path]
+		with pytest.raises(KeyError):
+			s["users", "1", "name", "x"]
+		with pytest.raises(ValueError):
+			s.at("users", "*").get()
+
+
+def test_sqlite_writes(tmp_path):
+	filename = str(tmp_path / "db.sqlite")
+	data = {"a": {"b": 1, "c": [1, 2, 3]}, "d": "x"}
+	s = SQLitePathDict.create(filename, data)
+	expected = pd(data).deepcopy()
+
+	for path, value in [(("a", "b"), 2), (("e", "f"), {"g": [True, None]}), (("a", "c", -1), 4), (("e", "*", "x"), 0)]:
+		s[path] = value
+		expected[path] = value
+	s.at("a", "c", "*").map(lambda v: v + 1)
+	expected.at("a", "c", "*").map(lambda v: v + 1)
+	s.set_many({("h",): [1], ("d",): "y"})
+	expected.set_many({("h",): [1], ("d",): "y"})
+	assert s.at().get() == expected.at().get()
+	assert s.at().pop("d") == "y" and s.at().pop("d", 5) == 5
+	assert s.at("a", "c").pop(0) == 2
+	assert s["a", "c"] == [3, 5]
+	s.close()
+
+	reopened = SQLitePathDict(filename)
+	assert reopened.at().keys() == ["a", "e", "h"]
+	with pytest.raises(TypeError):
+		reopened.at().set([1])
+	with pytest.raises(KeyError):
+		with reopened.batch():
+			reopened["x"] = 1
+			reopened["h", 5] = 1
+	assert "x" not in reopened
+	reopened.close()
+
+
+def test_sqlite_path_dict_api(tmp_path):
+	data = {"a": {"b": 1, "c": [1, 2, 3]}, "d": {"x": {"n": 1}, "y": {"n": 2}}}
+	s = SQLitePathDict.create(str(tmp_path / "db.sqlite"), data)
+	expected = pd(data).deepcopy()
+
+	s.at("a", "c").append(4).extend([5, 6]).insert(0, 0)
+	expected.at("a", "c").append(4).extend([5, 6]).insert(0, 0)
+	s.at("a", "new").append(1)
+	expected.at("a", "new").append(1)
+	s.at("a").update({"b": 2, "e": {"f": 1}})
+	expected.at("a").update({"b": 2, "e": {"f": 1}})
+	s.at("a").merge({"e": {"g": 2}, "c": [9]}, strategy="append")
+	expected.at("a").merge({"e": {"g": 2}, "c": [9]}, strategy="append")
+	s.at("d", "*").update({"m": 0})
+	expected.at("d", "*").map(lambda v: {**v, "m": 0})
+	s.at("a", "c").filter(lambda v: v % 2 == 0)
+	expected.at("a", "c").filter(lambda v: v % 2 == 0)
+	assert s.at().get() == expected.at().get()
+	assert s.at("a", "c").get() == [0, 2, 4, 6]
+	assert s.at("a", "c", 3).get() == 6 and len(s.at("a", "c")) == 4
+
+	assert s.at("d").values() == [{"n": 1, "m": 0}, {"n": 2, "m": 0}]
+	assert list(s.at("d").items()) == list(expected.at("d").items())
+	assert s.at("a", "c").sum() == 12
+	assert s.at("a", "c").reduce(lambda v, agg: agg + v, 0) == 12
+	assert s.at("d").count_by("m") == {0: 2}
+	assert s.at("d", "*", "n").filter(lambda v: v > 1).get() == [2]
+	assert s.at("a", "c").at_parent().at_children().gather() == list(expected.at("a").get().values())
+
+	copied = s.at("d").deepcopy()
+	copied["x", "n"] = 5
+	assert s["d", "x", "n"] == 1
+	assert s.at("a").copy(from_root=True).get() == expected.at().get()
+
+	with pytest.raises(TypeError):
+		s.at("a").extend([1])
+	with pytest.raises(TypeError):
+		s.at("a", "c").update({"x": 1})
+	with pytest.raises(ValueError):
+		s.at("d", "*").sum()
+	with pytest.raises(AttributeError, match="journal"):
+		s.journal()
+	s.close()
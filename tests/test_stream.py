@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+
+from path_dict import pd, stream
+from tests import dummy_data
+
+
+def test_iter_load(monkeypatch):
+	# Small chunks make values cross the chunk boundaries
+	monkeypatch.setattr(stream, "CHUNK_SIZE", 5)
+	db = dummy_data.get_db()
+	db["escaped"] = {'k"}]': 'v\\"[{', "n": [1.5e3, -2, None, True]}
+	text = json.dumps(db, indent=2)
+
+	assert list(pd.iter_load(io.StringIO(text), ())) == [((), db)]
+	children = list(pd.load(io.StringIO(text), lazy=True))
+	assert children == list(db.items())
+
+	for path in [("users", "*", "name"), ("users", "*", "friends", "*"), ("escaped", "n", "*"), ("escaped", "n", "1")]:
+		expected = pd(db).at(*path).gather(include_paths=True) if "*" in path else [(path, pd(db)[path])]
+		assert list(pd.iter_load(io.BytesIO(text.encode()), path)) == expected
+
+	# Missing paths are not yielded
+	assert list(pd.iter_load(io.StringIO(text), ("users", "missing", "*"))) == []
+	assert list(pd.iter_load(io.StringIO(text), ["users", "1", "age"])) == [
+		(("users", "1", "age"), db["users"]["1"]["age"])
+	]
+
+	with pytest.raises(KeyError):
+		list(pd.iter_load(io.StringIO(text), ("users", "1", "age", "x")))
+	with pytest.raises(KeyError):
+		list(pd.iter_load(io.StringIO(text), ("escaped", "n", "x")))
+	with pytest.raises(ValueError):
+		list(pd.iter_load(io.StringIO(text), ("**", "name")))
+	with pytest.raises(ValueError):
+		list(pd.iter_load(io.StringIO(text), ("users", "[1|2]")))
+	with pytest.raises(json.JSONDecodeError):
+		list(pd.iter_load(io.StringIO('{"a": [1, 2}'), ("a", "*")))
+	with pytest.raises(json.JSONDecodeError):
+		list(pd.iter_load(io.StringIO('{"a": 1} 2'), ("a",)))
+
+
+class _ShortReads(io.StringIO):
+	def read(self, size=-1):
+		return super().read(1)
+
+
+def test_iter_load_numbers(monkeypatch):
+	# Numbers that are cut off at a chunk boundary are read to their end
+	numbers = [1.5e3, -12.75e-2, 123, 0.5, -7, 1e100]
+	text = json.dumps({"n": numbers, "x": 123})
+	for size in range(1, len(text) + 1):
+		monkeypatch.setattr(stream, "CHUNK_SIZE", size)
+		assert list(pd.iter_load(io.StringIO(text), ("n", "*"))) == [(("n", i), n) for i, n in enumerate(numbers)]
+		assert list(pd.iter_load(io.StringIO(text), ("x",))) == [(("x",), 123)]
+	assert list(pd.load(_ShortReads(text), lazy=True)) == [("n", numbers), ("x", 123)]
+
+
+def test_load():
+	db = dummy_data.get_db()
+	p = pd.load(io.StringIO(json.dumps(db)))
+	assert p.get() == db
@@ -0,0 +1,67 @@
+from path_dict.utils import fast_deepcopy
+
+
+def test_fast_deepcopy():
+	data = {"x": [1, (2, [3]), {4}, {"y": None}], "t": (1, 2)}
+	data_copy = fast_deepcopy(data)
+	assert data_copy == data
+	assert list(data_copy) == ["x", "t"]
+	assert data_copy["x"] is not data["x"]
+	assert data_copy["x"][1][1] is not data["x"][1][1]
+	assert data_copy["x"][2] is not data["x"][2]
+	assert data_copy["x"][3] is not data["x"][3]
+	assert fast_deepcopy(1) == 1
+
+	# Deep data does not hit the recursion limit
+	deep = current = {}
+	for _ in range(10000):
+		current["n"] = current = {}
+	deep_copy = fast_deepcopy(deep)
+	depth = 0
+	while deep_copy:
+		assert deep_copy is not deep
+		deep, deep_copy = deep["n"], deep_copy["n"]
+		depth += 1
+	assert depth == 10000
+
+
+def test_fast_deepcopy_memo():
+	shared = [1, 2]
+	data = {"a": shared, "b": shared}
+	data_copy = fast_deepcopy(data)
+	assert data_copy["a"] is not data_copy["b"]
+	data_copy = fast_deepcopy(data, memo=True)
+	assert data_copy["a"] is data_copy["b"]
+	assert data_copy["a"] is not shared
+
+	cyclic = {"a": 1}
+	cyclic["self"] = cyclic
+	cyclic_copy = fast_deepcopy(cyclic, memo=True)
+	assert cyclic_copy["self"] is cyclic_copy
+	assert cyclic_copy is not cyclic
+
+	items = []
+	cyclic_tuple = (items,)
+	items.append(cyclic_tuple)
+	cyclic_tuple_copy = fast_deepcopy(cyclic_tuple, memo=True)
+	assert cyclic_tuple_copy[0][0] is cyclic_tuple_copy
+	assert cyclic_tuple_copy[0] is not items
+
+
+def test_fast_deepcopy_cyclic():
+	# Cyclic data is copied as with memo, instead of copying forever
+	cyclic = {"a": [1]}
+	cyclic["self"] = cyclic
+	cyclic["a"].append(cyclic["a"])
+	cyclic_copy = fast_deepcopy(cyclic)
+	assert cyclic_copy is not cyclic
+	assert cyclic_copy["self"] is cyclic_copy
+	assert cyclic_copy["a"][1] is cyclic_copy["a"]
+
+	# Shared subtrees without a cycle are still copied for every reference
+	shared = [[1]]
+	data = {"a": shared, "b": shared, "c": [shared]}
+	data_copy = fast_deepcopy(data)
+	assert data_copy == data
+	assert data_copy["a"] is not data_copy["b"]
+	assert data_copy["c"][0] is not data_copy["a"]